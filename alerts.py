@@ -0,0 +1,189 @@
+# alerts.py — tablas de alertas del escáner ('alerts' = último estado, 'alerts_log' = historial).
+# 'scan_version' es un contador monótono: cada escritura de alertas (y cada scan terminado)
+# lo incrementa y las filas de 'alerts' guardan la versión en la que cambiaron, así el panel
+# pide sólo las filas nuevas y no hace nada si la versión no se movió.
+# Retención: las filas de alerts_log más viejas que RETENTION_DAYS se resumen por ticker y
+# día en 'alerts_daily' y se borran, por tandas chicas para poder correr con el escáner vivo.
+#   python alerts.py [--keep-days 30] [--summary-days 730]
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import db
+import perf
+
+RETENTION_DAYS = 30      # días de detalle (una fila por scan) en alerts_log
+SUMMARY_DAYS = None      # días de resúmenes diarios a conservar (None = para siempre)
+COMPACT_BATCH = 5_000    # filas por transacción al compactar
+
+
+def connect():
+    """Conexión compartida del hilo (db.get_conn); no hace falta cerrarla."""
+    return db.get_conn()
+
+def upsert_many(conn, rows) -> None:
+    """
+    rows: [(ticker, empresa, ivr, etiqueta, ts, universe, rule), ...]. Upsert en 'alerts' + append en
+    'alerts_log', todo en una transacción con executemany y una versión nueva de
+    'scan_version' para esas filas. No cierra la conexión.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    with perf.timer("db.alerts.write"), conn:
+        _bump(conn, rows[-1][4])
+        conn.executemany("""INSERT INTO alerts (ticker,empresa,ivr,etiqueta,ts,universe,rule,version)
+                            VALUES (?,?,?,?,?,?,?,(SELECT version FROM scan_version WHERE id = 1))
+                            ON CONFLICT(ticker) DO UPDATE SET
+                              empresa=excluded.empresa, ivr=excluded.ivr, etiqueta=excluded.etiqueta, ts=excluded.ts,
+                              universe=excluded.universe, rule=excluded.rule, version=excluded.version
+                         """, rows)
+        conn.executemany("""INSERT INTO alerts_log (ticker,empresa,ivr,etiqueta,ts,universe,rule)
+                            VALUES (?,?,?,?,?,?,?)""", rows)
+
+# ======================== Versión (feed de cambios) ========================
+def _bump(conn, ts: str) -> None:
+    conn.execute("UPDATE scan_version SET version = version + 1, ts = ? WHERE id = 1", (ts,))
+
+def publish_scan(conn=None) -> None:
+    """Marca el fin de un scan (el panel refresca el estado del escáner aunque no haya alertas)."""
+    conn = conn or connect()
+    with conn:
+        _bump(conn, datetime.utcnow().isoformat())
+
+def current_version(conn=None) -> int:
+    """Versión publicada (una lectura de una fila; es lo único que consulta el panel entre scans)."""
+    return (conn or connect()).execute("SELECT version FROM scan_version WHERE id = 1").fetchone()[0]
+
+ALERT_COLS = ["ticker", "empresa", "ivr", "etiqueta", "ts", "universe", "rule"]
+
+def changes_since(version: int, conn=None) -> tuple:
+    """(versión actual, filas de 'alerts' que cambiaron después de `version`) por el índice de versión."""
+    conn = conn or connect()
+    v = current_version(conn)
+    if v == version:
+        return v, pd.DataFrame(columns=ALERT_COLS)
+    df = pd.read_sql_query(
+        f"SELECT {', '.join(ALERT_COLS)} FROM alerts WHERE version > ?", conn, params=(version,),
+    )
+    return v, df
+
+# ======================== Retención ========================
+def _cutoff(days: float) -> str:
+    return (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+def compact_log(keep_days: float = RETENTION_DAYS, summary_days: float = SUMMARY_DAYS,
+                batch: int = COMPACT_BATCH, conn=None) -> int:
+    """
+    Pasa a 'alerts_daily' (n, mín/máx/suma de IVR, último IVR y etiqueta del día) las filas
+    de alerts_log anteriores a hoy - keep_days (días completos) y las borra. Cada tanda de
+    `batch` filas es su propia transacción corta, así el escáner sigue escribiendo entre
+    medio (WAL). Devuelve cuántas filas de detalle se compactaron.
+    """
+    conn = conn or connect()
+    cutoff = _cutoff(keep_days)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS compact_chunk (rid INTEGER PRIMARY KEY)")
+    total = 0
+    while True:
+        # IMMEDIATE: toma el lock de escritura de entrada (y espera el busy_timeout); una
+        # transacción diferida que lee y después escribe falla en seco si el escáner escribió
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM compact_chunk")
+            n = conn.execute(
+                "INSERT INTO compact_chunk SELECT rowid FROM alerts_log WHERE ts < ? ORDER BY ts LIMIT ?",
+                (cutoff, batch),
+            ).rowcount
+            if n <= 0:
+                conn.rollback()
+                break
+            conn.execute("""
+                INSERT INTO alerts_daily (ticker, date, empresa, n, ivr_min, ivr_max, ivr_sum, ivr_last, etiqueta_last, last_ts)
+                SELECT g.ticker, g.date, l.empresa, g.n, g.ivr_min, g.ivr_max, g.ivr_sum, l.ivr, l.etiqueta, g.last_ts
+                FROM (
+                    SELECT ticker, substr(ts, 1, 10) AS date, count(*) AS n, min(ivr) AS ivr_min,
+                           max(ivr) AS ivr_max, total(ivr) AS ivr_sum, max(ts) AS last_ts
+                    FROM alerts_log WHERE rowid IN (SELECT rid FROM compact_chunk)
+                    GROUP BY ticker, date
+                ) g
+                JOIN alerts_log l ON l.rowid = (
+                    SELECT rowid FROM alerts_log WHERE ticker = g.ticker AND ts = g.last_ts LIMIT 1
+                )
+                WHERE true
+                ON CONFLICT (ticker, date) DO UPDATE SET
+                  n = n + excluded.n,
+                  ivr_min = min(ivr_min, excluded.ivr_min),
+                  ivr_max = max(ivr_max, excluded.ivr_max),
+                  ivr_sum = ivr_sum + excluded.ivr_sum,
+                  empresa = CASE WHEN excluded.last_ts >= last_ts THEN excluded.empresa ELSE empresa END,
+                  ivr_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.ivr_last ELSE ivr_last END,
+                  etiqueta_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.etiqueta_last ELSE etiqueta_last END,
+                  last_ts = max(last_ts, excluded.last_ts)
+            """)
+            conn.execute("DELETE FROM alerts_log WHERE rowid IN (SELECT rid FROM compact_chunk)")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += n
+    if summary_days:
+        with conn:
+            conn.execute("DELETE FROM alerts_daily WHERE date < ?", (_cutoff(summary_days),))
+    return total
+
+# ======================== Consulta ========================
+HISTORY_COLS = ["date", "n", "ivr_min", "ivr_max", "ivr_avg", "ivr_last", "etiqueta_last"]
+
+def ticker_history(ticker: str, start: str = None, conn=None) -> pd.DataFrame:
+    """
+    Historial diario de alertas de un ticker (resúmenes + detalle reciente, ambos por
+    índice ticker/ts). Una fila por día con alertas desde `start` (AAAA-MM-DD).
+    """
+    conn = conn or connect()
+    start = start or ""
+    daily = pd.read_sql_query(
+        """SELECT date, n, ivr_min, ivr_max, ivr_sum, ivr_last, etiqueta_last, last_ts
+           FROM alerts_daily WHERE ticker = ? AND date >= ?""",
+        conn, params=(ticker, start),
+    )
+    raw = pd.read_sql_query(
+        """SELECT substr(ts, 1, 10) AS date, ivr, etiqueta, ts
+           FROM alerts_log WHERE ticker = ? AND ts >= ? ORDER BY ts""",
+        conn, params=(ticker, start),
+    )
+    if not raw.empty:
+        g = raw.groupby("date")
+        raw = pd.DataFrame({
+            "n": g.size(),
+            "ivr_min": g["ivr"].min(),
+            "ivr_max": g["ivr"].max(),
+            "ivr_sum": g["ivr"].sum(),
+            "ivr_last": g["ivr"].last(),
+            "etiqueta_last": g["etiqueta"].last(),
+            "last_ts": g["ts"].last(),
+        }).reset_index()
+    frames = [d for d in (daily, raw) if not d.empty]
+    if not frames:
+        return pd.DataFrame(columns=HISTORY_COLS)
+    df = pd.concat(frames, ignore_index=True)
+    # un día puede estar a medias entre resumen y detalle mientras corre la compactación
+    df = df.sort_values("last_ts")
+    g = df.groupby("date")
+    out = pd.DataFrame({
+        "n": g["n"].sum(),
+        "ivr_min": g["ivr_min"].min(),
+        "ivr_max": g["ivr_max"].max(),
+        "ivr_last": g["ivr_last"].last(),
+        "etiqueta_last": g["etiqueta_last"].last(),
+    })
+    out["ivr_avg"] = (g["ivr_sum"].sum() / out["n"]).round(2)
+    return out.reset_index()[HISTORY_COLS]
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compacta alerts_log en resúmenes diarios (alerts_daily)")
+    ap.add_argument("--keep-days", type=float, default=RETENTION_DAYS, help="días de detalle a conservar")
+    ap.add_argument("--summary-days", type=float, default=SUMMARY_DAYS, help="días de resúmenes a conservar (sin valor = todos)")
+    args = ap.parse_args()
+    n = compact_log(args.keep_days, args.summary_days)
+    print(f"Compactadas {n} filas de alerts_log.")
@@ -1,12 +1,24 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 from datetime import datetime
-import yfinance as yf
+import functools
 import os
-import math
-from streamlit_autorefresh import st_autorefresh
-st_autorefresh(interval=3 * 60 * 1000, key="auto")  # 3 minutos
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import alerts
+import backtest
+import db
+import fetcher
+import fundamentals
+import peer_stats
+import perf
+import rules
+import scan_universe
+import scoring
+import statements
+import universe_store
+import watchlist
+from settings import DEFAULTS, load_settings, save_settings
 
 # ======================== Config básica ========================
 ASSETS_DIR = "assets"
@@ -19,240 +31,20 @@ st.set_page_config(
     layout="wide",
 )
 
-DB_PATH = "screener.db"
-
-# Defaults (si no hay settings guardados aún)
-DEFAULTS = {
-    "pe_cap": 25.0,
-    "pb_cap": 5.0,
-    "eve_cap": 15.0,
-    "val_th": 70,   # umbral Valor para etiqueta
-    "qual_th": 50,  # umbral Calidad para etiqueta
-    "w_val": 0.7,   # peso Valor en IVR
-    "w_qual": 0.3,  # peso Calidad en IVR
-}
-
-# ======================== DB mínima ============================
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-cursor.execute(
-    """
-    CREATE TABLE IF NOT EXISTS tickers (
-        ticker TEXT PRIMARY KEY,
-        created_at TEXT
-    )
-    """
-)
-cursor.execute(
-    """
-    CREATE TABLE IF NOT EXISTS settings (
-        id INTEGER PRIMARY KEY CHECK (id = 1),
-        pe_cap REAL,
-        pb_cap REAL,
-        eve_cap REAL,
-        val_th INTEGER,
-        qual_th INTEGER,
-        w_val REAL,
-        w_qual REAL
-    )
-    """
-)
-conn.commit()
-
-def ensure_settings_row():
-    cursor.execute("SELECT COUNT(*) FROM settings WHERE id = 1")
-    n = cursor.fetchone()[0]
-    if n == 0:
-        cursor.execute(
-            """
-            INSERT INTO settings (id, pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual)
-            VALUES (1, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                DEFAULTS["pe_cap"], DEFAULTS["pb_cap"], DEFAULTS["eve_cap"],
-                DEFAULTS["val_th"], DEFAULTS["qual_th"],
-                DEFAULTS["w_val"], DEFAULTS["w_qual"],
-            ),
-        )
-        conn.commit()
-
-def load_settings() -> dict:
-    ensure_settings_row()
-    cursor.execute("SELECT pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual FROM settings WHERE id = 1")
-    row = cursor.fetchone()
-    keys = ["pe_cap", "pb_cap", "eve_cap", "val_th", "qual_th", "w_val", "w_qual"]
-    return dict(zip(keys, row))
-
-def save_settings(pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual):
-    cursor.execute(
-        """
-        UPDATE settings
-        SET pe_cap=?, pb_cap=?, eve_cap=?, val_th=?, qual_th=?, w_val=?, w_qual=?
-        WHERE id = 1
-        """,
-        (pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual),
-    )
-    conn.commit()
-
-def listar_tickers() -> list:
-    df = pd.read_sql_query("SELECT ticker FROM tickers ORDER BY ticker ASC", conn)
-    return df["ticker"].tolist()
-
-def agregar_ticker(t: str) -> None:
-    t = (t or "").strip().upper()
-    if not t:
-        return
-    cursor.execute(
-        "INSERT OR IGNORE INTO tickers (ticker, created_at) VALUES (?, ?)",
-        (t, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
-
-def eliminar_ticker(t: str) -> None:
-    cursor.execute("DELETE FROM tickers WHERE ticker = ?", (t,))
-    conn.commit()
-
 # ======================== Datos de Yahoo! =======================
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_metrics(ticker: str) -> dict:
-    """Trae métricas simples desde yfinance. Devuelve dict con NaN si falta algo."""
-    out = {
-        "Ticker": ticker,
-        "Empresa": "",
-        "Sector": "",
-        "Industry": "",
-        "Precio": float("nan"),
-        "P/E": float("nan"),
-        "P/B": float("nan"),
-        "EV/EBITDA": float("nan"),
-        "Debt/Equity": float("nan"),
-        "ROE": float("nan"),  # Return on Equity (ratio, ej. 0.15 = 15%)
-    }
-    try:
-        tk = yf.Ticker(ticker)
-
-        # Precio
-        price = None
-        try:
-            fi = tk.fast_info
-            price = fi.get("last_price")
-        except Exception:
-            price = None
-        if price is None:
-            try:
-                h = tk.history(period="1d")
-                if not h.empty:
-                    price = float(h["Close"].iloc[-1])
-            except Exception:
-                price = None
-        if price is not None:
-            out["Precio"] = float(price)
-
-        # Info general
-        info = {}
-        try:
-            info = tk.info or {}
-        except Exception:
-            info = {}
-
-        out["Empresa"] = info.get("longName") or info.get("shortName") or ""
-        out["Sector"]  = info.get("sector") or ""
-        out["Industry"]= info.get("industry") or ""
-
-        pe  = info.get("trailingPE")
-        pb  = info.get("priceToBook")
-        eve = info.get("enterpriseToEbitda")
-        de_raw = info.get("debtToEquity")  # a veces en %
-        roe = info.get("returnOnEquity")   # ratio (0.12 = 12%)
-
-        out["P/E"] = float(pe) if isinstance(pe, (int, float)) else float("nan")
-        out["P/B"] = float(pb) if isinstance(pb, (int, float)) else float("nan")
-        out["EV/EBITDA"] = float(eve) if isinstance(eve, (int, float)) else float("nan")
+FETCH_WORKERS = 8  # tickers en paralelo al refrescar la tabla
+APP_PERF_EVERY = 60  # segundos entre renders guardados en 'perf_runs' (por proceso, no cada rerun)
 
-        if isinstance(de_raw, (int, float)):
-            de_val = float(de_raw)
-            if de_val > 10:  # si parece porcentaje, pásalo a veces
-                de_val = de_val / 100.0
-            out["Debt/Equity"] = de_val
-
-        if isinstance(roe, (int, float)):
-            out["ROE"] = float(roe)
-
-    except Exception:
-        pass
-    return out
-
-# ======================== Helpers de score =======================
-def is_financial_row(row: pd.Series) -> bool:
-    s = (row.get("Sector") or "").lower()
-    i = (row.get("Industry") or "").lower()
-    keys = ["financial", "bank", "insurance", "capital markets", "diversified financial"]
-    return any(k in s for k in keys) or any(k in i for k in keys)
-
-def subscore_inverse(x: float, cap: float) -> float:
-    """Mayor puntaje cuando el múltiplo es bajo. Escala 0..1 con cap simple."""
-    try:
-        if pd.isna(x):
-            return float("nan")
-        return max(0.0, min(1.0, (cap - float(x)) / cap))
-    except Exception:
-        return float("nan")
-
-def score_val_non_fin(row: pd.Series, pe_cap: float, pb_cap: float, eve_cap: float) -> float:
-    subs = [
-        subscore_inverse(row.get("P/E"), pe_cap),
-        subscore_inverse(row.get("P/B"), pb_cap),
-        subscore_inverse(row.get("EV/EBITDA"), eve_cap),
-    ]
-    s = pd.Series(subs, dtype="float64").dropna()
-    return float(s.mean() * 100.0) if not s.empty else float("nan")
-
-def score_val_bank(row: pd.Series, pe_cap: float, pb_cap: float) -> float:
-    """Para bancos/financieras: pondera P/B (x2) y P/E (x1)."""
-    pb_sub = subscore_inverse(row.get("P/B"), pb_cap)
-    pe_sub = subscore_inverse(row.get("P/E"), pe_cap)
-    subs = [pb_sub, pb_sub, pe_sub]  # peso 2:1
-    s = pd.Series(subs, dtype="float64").dropna()
-    return float(s.mean() * 100.0) if not s.empty else float("nan")
-
-def calcular_val_score_mixto(row: pd.Series, pe_cap: float, pb_cap: float, eve_cap: float) -> float:
-    return score_val_bank(row, pe_cap, pb_cap) if is_financial_row(row) else \
-           score_val_non_fin(row, pe_cap, pb_cap, eve_cap)
-
-def score_calidad_de(de_ratio: float) -> float:
-    """Calidad por D/E: menor deuda mejor. D/E<=0→100; 2→50; 3→0."""
-    if pd.isna(de_ratio):
-        return float("nan")
-    try:
-        x = float(de_ratio)
-        if x <= 0:
-            return 100.0
-        return float(max(0.0, min(100.0, (3.0 - x) * 50.0)))
-    except Exception:
-        return float("nan")
+def fetch_metrics(ticker: str) -> dict:
+    """Trae métricas simples (caché en screener.db → yfinance). Devuelve dict con NaN si falta algo."""
+    return fundamentals.get_metrics(ticker)
 
-def score_calidad_roe(roe_ratio: float) -> float:
-    """Calidad por ROE (para bancos): 5%→0; 10%→50; 15%→100 (cap 0..100)."""
-    if pd.isna(roe_ratio):
-        return float("nan")
+def refresh_prices(tickers: list) -> None:
+    """Precios de toda la lista en una request multi-símbolo; P/E y P/B se recalculan al leer la caché."""
     try:
-        r = float(roe_ratio)
-        if r > 1.0:  # por si viniera en %
-            r = r / 100.0
-        score = (r - 0.05) / 0.10 * 100.0
-        return float(max(0.0, min(100.0, score)))
+        fetcher.refresh_prices(tickers)
     except Exception:
-        return float("nan")
-
-def calidad_router(row: pd.Series) -> pd.Series:
-    """Devuelve score de calidad y la métrica usada (ROE para bancos, D/E para resto)."""
-    if is_financial_row(row):
-        sc = score_calidad_roe(row.get("ROE"))
-        metric = "ROE"
-    else:
-        sc = score_calidad_de(row.get("Debt/Equity"))
-        metric = "D/E"
-    return pd.Series({"Score Calidad": sc, "Calidad por": metric})
+        pass  # quedan los precios guardados; get_metrics los reintenta por ticker
 
 # --- Formato hora local (Buenos Aires) sin microsegundos ---
 TZ_LOCAL = "America/Argentina/Buenos_Aires"
@@ -268,33 +60,192 @@ def fmt_local(ts):
 
 
 # ======================== Alertas (universo) =======================
-@st.cache_data(ttl=60, show_spinner=False)
-def load_alerts_df() -> pd.DataFrame:
-    """Lee la tabla 'alerts' creada por el escáner externo. Devuelve df vacío si no existe."""
+ALERTS_POLL = 15  # segundos entre chequeos de versión (sólo lee una fila de scan_version)
+
+def sync_alerts() -> bool:
+    """
+    Trae a la sesión sólo las filas de 'alerts' que cambiaron desde la última versión vista
+    (y el estado del escáner). False, sin más lecturas, si el escáner no publicó nada nuevo.
+    """
+    ss = st.session_state
     try:
-        with sqlite3.connect(DB_PATH) as c:
-            df = pd.read_sql_query(
-                """
-                SELECT ticker, empresa, ivr, etiqueta, ts
-                FROM alerts
-                ORDER BY ivr DESC, ticker ASC
-                """,
-                c,
-            )
-        if "ts" in df.columns:
-            df["ts"] = pd.to_datetime(df["ts"], errors="coerce")
-        if "ticker" in df.columns:
-            df["ticker"] = df["ticker"].str.upper()
-        return df
+        v, chg = alerts.changes_since(ss.get("alerts_v", -1))
+    except Exception:
+        return False
+    if v == ss.get("alerts_v"):
+        return False
+    chg["ts"] = pd.to_datetime(chg["ts"], errors="coerce")
+    chg["ticker"] = chg["ticker"].str.upper()
+    old = ss.get("alerts_df")
+    if old is not None and not old.empty:
+        chg = pd.concat([old[~old["ticker"].isin(chg["ticker"])], chg], ignore_index=True) if not chg.empty else old
+    ss["alerts_df"] = chg.sort_values(["ivr", "ticker"], ascending=[False, True], ignore_index=True)
+    ss["alerts_v"] = v
+    ss["scanner_status"] = load_scanner_status()
+    return True
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_ticker_history(ticker: str, version: int) -> pd.DataFrame:
+    """Alertas por día de un ticker (resúmenes diarios + detalle reciente); vale hasta otra versión."""
+    try:
+        return alerts.ticker_history(ticker)
+    except Exception:
+        return pd.DataFrame(columns=alerts.HISTORY_COLS)
+
+def load_scanner_status() -> dict:
+    """Fila de 'scanner_status' que publica scanner_service.py. Dict vacío si no existe."""
+    try:
+        df = pd.read_sql_query("SELECT * FROM scanner_status WHERE id = 1", db.get_conn())
+        return df.iloc[0].to_dict() if not df.empty else {}
+    except Exception:
+        return {}
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_history_panel() -> pd.DataFrame:
+    """Historial diario de snapshots (último año) para el qué-hubiera-pasado."""
+    start = (pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=365)).strftime("%Y-%m-%d")
+    return backtest.load_panel(start=start)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_scan_universes() -> dict:
+    """Universos del escáner ({nombre: [tickers]}); vacío si falta algún archivo."""
+    try:
+        return scan_universe.load_universes()
+    except OSError:
+        return {}
+
+@st.cache_resource(show_spinner=False)
+def shared_universe() -> universe_store.UniverseStore:
+    """Universo puntuado compacto: uno por proceso, compartido por todas las sesiones."""
+    return universe_store.UniverseStore()
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_peer_stats(version: int) -> peer_stats.PeerStats:
+    """Percentiles por sector/industria del último scan (se releen sólo con una versión nueva)."""
+    try:
+        return peer_stats.load()
     except Exception:
-        return pd.DataFrame(columns=["ticker", "empresa", "ivr", "etiqueta", "ts"])
+        return peer_stats.PeerStats()
+
+def measured(source: str):
+    """
+    Fragmento con su propio colector: sus reruns no suman al render que lo dibujó por primera
+    vez. Se guarda como `source` en 'perf_runs' con el mismo intervalo que el render.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kw):
+            with perf.scope() as c:
+                try:
+                    return fn(*args, **kw)
+                finally:
+                    try:
+                        perf.save(source, snap=c.snapshot(), every=APP_PERF_EVERY)
+                    except Exception:
+                        pass
+        return run
+    return wrap
+
+@st.fragment(run_every=2)
+@measured("app.prefetch")
+def prefetch_status() -> None:
+    """
+    Mientras se bajan los importados muestra el avance; al terminar, un solo rerun completo.
+    Sólo se dibuja con un prefetch en curso: sin él no queda ningún fragmento consultando cada 2 s.
+    """
+    th = st.session_state.get("prefetch")
+    if th is None:
+        return
+    if th.is_alive():
+        st.caption(f"Bajando datos de {len(st.session_state.get('prefetching', ()))} tickers nuevos en segundo plano…")
+    else:
+        st.session_state.pop("prefetch")
+        st.session_state.pop("prefetching", None)
+        st.rerun()
 
 # ======================== Cargar settings =======================
+render_collector = perf.use()  # desglose de tiempos de este render (panel "Rendimiento"), sólo de esta sesión
 S = load_settings()
 pe_cap, pb_cap, eve_cap = float(S["pe_cap"]), float(S["pb_cap"]), float(S["eve_cap"])
 val_th, qual_th = int(S["val_th"]), int(S["qual_th"])
 w_val, w_qual = float(S["w_val"]), float(S["w_qual"])
-caro_th = max(10, min(90, 100 - val_th))
+caro_th = scoring.caro_threshold(val_th)
+
+# ======================== Panel de alertas (fragmento) ==========
+@st.fragment(run_every=ALERTS_POLL)
+@measured("app.alerts")
+def alerts_panel(current: list) -> None:
+    """
+    Se re-ejecuta solo (no el script entero) cada ALERTS_POLL segundos; si la versión
+    publicada por el escáner no cambió, re-dibuja lo que ya está en la sesión sin tocar la DB.
+    Cuando hubo un scan y la lista propia tiene datos vencidos, pide un rerun completo.
+    """
+    if sync_alerts() and st.session_state.get("alerts_seen"):
+        cached = fundamentals.load_cached(current)
+        if any(t not in cached or cached[t][1] for t in current):
+            st.rerun()
+    st.session_state["alerts_seen"] = True
+
+    st.subheader("Alertas")
+    alerts_df = st.session_state.get("alerts_df", pd.DataFrame(columns=alerts.ALERT_COLS))
+    if alerts_df.empty:
+        st.info("Todavía no hay alertas. Ejecutá scanner_service.py o esperá al próximo escaneo.")
+    else:
+        only_mine = st.checkbox("Mostrar solo mis tickers", value=True)
+        view_df = alerts_df.copy()
+        if only_mine:
+            mine = set([t.upper() for t in current])
+            view_df = view_df[view_df["ticker"].isin(mine)]
+
+        last_ts = view_df["ts"].max() if not view_df.empty else alerts_df["ts"].max()
+        if pd.notna(last_ts):
+            st.caption(f"Último scan: {fmt_local(last_ts)}")
+
+
+        view_df = view_df.rename(columns={
+            "ticker": "Ticker",
+            "empresa": "Empresa",
+            "ivr": "IVR",
+            "etiqueta": "Etiqueta",
+            "ts": "Scan",
+            "universe": "Universo",
+            "rule": "Regla",
+        })
+        st.dataframe(
+            view_df.set_index("Ticker")[["Empresa", "IVR", "Etiqueta", "Regla", "Universo", "Scan"]],
+            use_container_width=True, height=320
+        )
+
+        opciones = sorted(set(alerts_df["ticker"]) | set(current))
+        hist_t = st.selectbox("Historial de alertas de", opciones, index=None, placeholder="Elegí un ticker")
+        if hist_t:
+            hist = load_ticker_history(hist_t, st.session_state.get("alerts_v", 0))
+            if hist.empty:
+                st.caption(f"{hist_t} no alertó en el período guardado.")
+            else:
+                hist = hist.set_index(pd.to_datetime(hist["date"]))
+                st.line_chart(hist[["ivr_min", "ivr_max", "ivr_last"]], height=180)
+                st.dataframe(
+                    hist.rename(columns={
+                        "n": "Scans", "ivr_min": "IVR mín", "ivr_max": "IVR máx", "ivr_avg": "IVR prom",
+                        "ivr_last": "IVR cierre", "etiqueta_last": "Etiqueta",
+                    }).set_index("date")[["Scans", "IVR mín", "IVR máx", "IVR prom", "IVR cierre", "Etiqueta"]]
+                      .sort_index(ascending=False),
+                    use_container_width=True, height=240,
+                )
+
+    svc = st.session_state.get("scanner_status", {})
+    if svc.get("last_finished"):
+        st.caption(
+            f"Escáner ({svc.get('state') or '?'}): última corrida {fmt_local(svc['last_finished'])}, "
+            f"{svc.get('last_duration') or 0:.1f}s, {svc.get('tickers_per_sec') or 0:.0f} tickers/s, "
+            f"{int(svc.get('last_failed') or 0)} fallidos, {int(svc.get('errors') or 0)} errores"
+        )
+
+    if st.button("Actualizar alertas"):
+        st.session_state.pop("alerts_v", None)
+        st.session_state.pop("alerts_df", None)
+        st.rerun(scope="fragment")
 
 # ======================== Header (logo + título) ================
 left_header, mid_header, right_header = st.columns([0.25, 2.2, 1])
@@ -348,146 +299,299 @@ with st.sidebar:
             st.success("Ajustes restablecidos.")
             st.rerun()
 
+    st.markdown("---")
+    if st.toggle("¿Qué hubiera pasado? (historial de scans)"):
+        panel = load_history_panel()
+        if panel.empty:
+            st.caption("Todavía no hay snapshots del escáner.")
+        else:
+            cur = dict(pe_cap=pe_cap, pb_cap=pb_cap, eve_cap=eve_cap, val_th=val_th,
+                       qual_th=qual_th, w_val=w_val, w_qual=w_qual)
+            r = backtest.what_if([cur], base=S, panel=panel).iloc[0]
+            st.caption(
+                f"{panel['date'].nunique()} días: {r['alerts_per_day']} alertas/día, "
+                f"{r['tickers']} nombres, {r['churn']} cambios de etiqueta (vs ajustes guardados)."
+            )
+            if r["added"]:
+                st.caption("Entrarían: " + ", ".join(r["added"]))
+            if r["dropped"]:
+                st.caption("Saldrían: " + ", ".join(r["dropped"]))
+
 # ======================== UI principal ==========================
 with st.form("add"):
     new_ticker = st.text_input("Agregar ticker (ej: AAPL, MELI, GGAL.BA, BMA.BA, NU)", value="")
     submitted = st.form_submit_button("Agregar")
     if submitted:
-        agregar_ticker(new_ticker)
+        watchlist.add([new_ticker])
         st.rerun()
 
-current = listar_tickers()
+current = watchlist.list_tickers()
 
 col1, col2 = st.columns([3, 1])
 
 with col1:
     st.subheader("Mis tickers")
 
-    # Tags clickeables para quitar
-    if current:
-        st.caption("Click en un tag para quitar el ticker:")
-        n_cols = 6
-        cols = st.columns(n_cols)
-        for i, t in enumerate(current):
-            col = cols[i % n_cols]
-            with col:
-                if st.button(f"✕ {t}", key=f"tag_{t}"):
-                    eliminar_ticker(t)
+    # Import / export / diff: todo en una transacción y un rerun; los nuevos se bajan en segundo plano
+    universes = load_scan_universes()
+    with st.expander("Importar / exportar / comparar con el universo"):
+        t_imp, t_exp, t_diff = st.tabs(["Importar", "Exportar", "Vs. universo"])
+        with t_imp:
+            with st.form("import"):
+                pasted = st.text_area("Pegar tickers (separados por coma, espacio o línea)", height=100)
+                upload = st.file_uploader("…o un CSV / archivo de universo", type=["csv", "txt"])
+                uni = st.selectbox("…o un universo del escáner", [""] + list(universes))
+                if st.form_submit_button("Importar"):
+                    parts = [pasted, upload.getvalue().decode("utf-8", "replace") if upload else ""]
+                    parts.append("\n".join(universes.get(uni, [])))
+                    known = {t for ts in universes.values() for t in ts}
+                    rep = watchlist.import_symbols("\n".join(p for p in parts if p), known=known)
+                    have = fundamentals.load_cached(rep["added"])
+                    todo = [t for t in rep["added"] if t not in have]
+                    if todo:
+                        st.session_state["prefetch"] = watchlist.prefetch(todo)
+                        st.session_state["prefetching"] = set(todo)
+                    st.session_state["import_msg"] = rep
                     st.rerun()
+            rep = st.session_state.pop("import_msg", None)
+            if rep:
+                st.success(f"{len(rep['added'])} agregados ({len(rep['cached'])} con datos en caché, "
+                           f"{len(rep['new'])} nuevos).")
+                if rep["invalid"]:
+                    st.warning("Ignorados (formato inválido): " + " ".join(rep["invalid"]))
+                if rep.get("unknown"):
+                    st.warning("Ignorados (Yahoo no los conoce): " + " ".join(rep["unknown"]))
+        with t_exp:
+            st.download_button("Descargar CSV", watchlist.export_csv(current), file_name="mis_tickers.csv",
+                               mime="text/csv", disabled=not current)
+        with t_diff:
+            if not universes:
+                st.caption("No se encontraron los archivos de universo del escáner.")
+            for name, tks in universes.items():
+                d = watchlist.diff(current, tks)
+                st.markdown(f"**{name}**: {len(d['both'])} en ambos, {len(d['only_mine'])} sólo en mi lista, "
+                            f"{len(d['only_universe'])} sólo en el universo")
+                if d["only_mine"]:
+                    st.caption("Sólo en mi lista (el escáner no los alerta): " + " ".join(d["only_mine"]))
+    if "prefetch" in st.session_state:
+        prefetch_status()
+
+    # Quitar: un solo multiselect (no un botón por ticker)
+    if current:
+        with st.form("remove"):
+            quitar = st.multiselect("Quitar tickers", current, placeholder="Elegí uno o más")
+            if st.form_submit_button("Quitar seleccionados") and quitar:
+                watchlist.remove(quitar)
+                st.rerun()
     else:
         st.info("Aún no agregaste nada.")
 
     # Tabla
     if current:
-        rows = [fetch_metrics(t) for t in current]
-        df = pd.DataFrame(rows)
-
-        # Valoración: mixto (bancos vs no bancos)
-        df["Score (0-100)"] = df.apply(lambda r: calcular_val_score_mixto(r, pe_cap, pb_cap, eve_cap), axis=1)
-
-        # Calidad: ROE para bancos, D/E para resto
-        qual_df = df.apply(calidad_router, axis=1, result_type="expand")
-        qual_df.columns = ["Score Calidad", "Calidad por"]
-        df = pd.concat([df, qual_df], axis=1)
-
-                # Etiqueta con bandas: Barato / Neutral / Caro (y "sano"/"frágil" según Calidad)
-        def etiqueta(row):
-            sv = row["Score (0-100)"]   # Valor
-            sc = row["Score Calidad"]   # Calidad
-            if pd.isna(sv):
-                return "Sin datos"
-            # Barato
-            if sv >= val_th and (not pd.isna(sc)) and sc >= qual_th:
-                return "Barato y sano"
-            if sv >= val_th:
-                return "Barato pero frágil"
-            # Caro
-            if sv <= caro_th and (not pd.isna(sc)) and sc >= qual_th:
-                return "Caro pero sano"
-            if sv <= caro_th:
-                return "Caro y frágil"
-            # Resto
-            return "Neutral"
-
-        df["Etiqueta"] = df.apply(etiqueta, axis=1)
-
-        # Señal operativa mínima a partir de la Etiqueta
-        def senal_simple(et):
-            if et.startswith("Barato"):
-                return "Comprar"
-            if et.startswith("Caro"):
-                return "Vender"
-            return "Mantener"
-
-        df["Señal"] = df["Etiqueta"].apply(senal_simple)
-
-        # IVR final con pesos configurables; si falta calidad, tomamos 0 (conservador)
-        def calc_ivr(row):
-            sv = row["Score (0-100)"]
-            sc = row["Score Calidad"]
-            if pd.isna(sv):
-                return float("nan")
-            if pd.isna(sc):
-                sc = 0.0
-            return round(w_val * float(sv) + w_qual * float(sc), 2)
-
-        df["IVR"] = df.apply(calc_ivr, axis=1)
-
-
-        # Orden: mejores primero por IVR
-        df = df.sort_values(by=["IVR", "Ticker"], ascending=[False, True], na_position="last")
-
         # Columnas a mostrar
         cols_show = [
     "Empresa","Sector","Precio","P/E","P/B","EV/EBITDA","Debt/Equity","ROE",
-    "Calidad por","Score (0-100)","Score Calidad","IVR","Etiqueta","Señal"
+    "Calidad por","Score (0-100)","Score Calidad","Valor vs pares","IVR","Etiqueta","Señal"
         ]
-        st.dataframe(
-            df.set_index("Ticker")[cols_show],
-            use_container_width=True, height=520
-        )
+        try:
+            peers = load_peer_stats(alerts.current_version())
+        except Exception:
+            peers = peer_stats.PeerStats()
+
+        # Lo que hay en disco se muestra ya; después los precios vencidos en una sola request
+        # (los ratios se recalculan con el precio nuevo) y por último, en paralelo, los
+        # fundamentales vencidos/faltantes, que van completando la tabla
+        cached = fundamentals.load_cached(current)
+        rows = {t: cached[t][0] if t in cached else fundamentals.empty_metrics(t) for t in current}
+
+        # Filtro, orden y paginado del lado del servidor: al navegador va sólo la página visible
+        f1, f2, f3 = st.columns([2, 2, 2])
+        with f1:
+            f_sectors = st.multiselect("Sector", sorted({m["Sector"] for m in rows.values() if m["Sector"]}))
+            f_search = st.text_input("Buscar (ticker o empresa)", value="")
+        with f2:
+            f_labels = st.multiselect("Etiqueta", scoring.ETIQUETAS)
+            f_ivr = st.slider("IVR", min_value=0.0, max_value=100.0, value=(0.0, 100.0), step=1.0)
+        with f3:
+            f_sort = st.selectbox("Ordenar por", watchlist.SORTABLE)
+            f_asc = st.toggle("Ascendente", value=f_sort in ("Ticker", "Empresa", "Sector"))
+            p1, p2 = st.columns(2)
+            f_size = p1.selectbox("Filas", watchlist.PAGE_SIZES, index=1)
+            f_page = p2.number_input("Página", min_value=1, value=1, step=1)
+
+        def render_table(slot, rows: dict) -> None:
+            df = pd.DataFrame(list(rows.values()))
+            df = statements.apply_ratios(df)  # ratios propios (TTM de estados + precio) donde hay
+
+            # Scores (valor mixto bancos/no bancos, calidad ROE/D-E, etiqueta, señal, IVR) en una pasada vectorizada
+            with perf.timer("panel.score"):
+                df = scoring.score_frame(df, pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual, caro_th=caro_th,
+                                         fin_map=peers.fin_map)
+            # posición contra sus pares: lookup en las grillas precomputadas por el escáner
+            with perf.timer("panel.peers"):
+                df["Valor vs pares"] = peers.relative_value(df) if peers else float("nan")
+
+            with perf.timer("panel.query"):
+                page, total, pages = watchlist.query(
+                    df, sectors=f_sectors, labels=f_labels, search=f_search,
+                    ivr_range=None if f_ivr == (0.0, 100.0) else f_ivr,  # rango completo: también los sin IVR
+                    sort_by=f_sort, ascending=f_asc, page=f_page, page_size=f_size,
+                )
+
+            with perf.timer("panel.render"), slot.container():
+                st.caption(f"{total} de {len(df)} tickers — página {min(f_page, pages)} de {pages}")
+                st.dataframe(
+                    page.set_index("Ticker")[cols_show],
+                    use_container_width=True, height=min(520, 38 + 35 * max(len(page), 1))
+                )
+
+        table_slot = st.empty()
+        render_table(table_slot, rows)
+
+        price_due = [t for t in current if t not in cached or "price" in cached[t][1]]
+        if price_due:
+            with perf.timer("panel.prices"):
+                refresh_prices(price_due)
+            cached = fundamentals.load_cached(current)
+            rows = {t: cached[t][0] if t in cached else fundamentals.empty_metrics(t) for t in current}
+            render_table(table_slot, rows)
+        prefetching = st.session_state.get("prefetching", set())  # ya los baja prefetch_status
+        pending = [t for t in current if (t not in cached or cached[t][1]) and t not in prefetching]
+
+        if pending:
+            prog = st.progress(0.0, text=f"Actualizando {len(pending)} tickers…")
+            last = time.time()
+            with perf.timer("panel.fetch"), ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+                futs = {ex.submit(perf.bind(fetch_metrics), t): t for t in pending}
+                for i, fu in enumerate(as_completed(futs), 1):
+                    rows[futs[fu]] = fu.result()
+                    if i == len(futs) or time.time() - last >= 0.5:  # no re-renderizar por cada ticker
+                        render_table(table_slot, rows)
+                        last = time.time()
+                    prog.progress(i / len(futs), text=f"Actualizando… {i}/{len(futs)}")
+            prog.empty()
+
+        # estados trimestrales: sólo si hay balance nuevo esperado (normalmente ninguno)
+        stmt_due = [t for t in statements.due(current) if t not in prefetching]
+        if stmt_due:
+            with st.spinner(f"Bajando estados contables de {len(stmt_due)} tickers…"):
+                try:
+                    with perf.timer("panel.statements"):
+                        statements.refresh(stmt_due, deadline=60)
+                except Exception:
+                    pass
+            render_table(table_slot, rows)
+
+    # Universo del escáner: la tabla compartida (universe_store), paginada del lado del servidor
+    with st.expander("Universo del escáner"):
+        try:
+            uni_df = shared_universe().scored(dict(pe_cap=pe_cap, pb_cap=pb_cap, eve_cap=eve_cap, val_th=val_th,
+                                                   qual_th=qual_th, w_val=w_val, w_qual=w_qual))
+        except Exception:
+            uni_df = pd.DataFrame()
+        if uni_df.empty:
+            st.caption("Todavía no hay datos del universo en la caché (corré scanner_service.py).")
+        else:
+            u1, u2, u3 = st.columns([2, 2, 1])
+            u_labels = u1.multiselect("Etiqueta", scoring.ETIQUETAS, default=["Barato y sano"], key="u_labels")
+            u_unis = u2.multiselect("Universo", universe_store.universe_names(uni_df["Universo"]), key="u_unis")
+            u_page = u3.number_input("Página", min_value=1, value=1, step=1, key="u_page")
+            page, total, pages = watchlist.query(
+                uni_df[universe_store.in_universes(uni_df["Universo"], u_unis)] if u_unis else uni_df,
+                labels=u_labels, page=u_page, page_size=50,
+            )
+            st.caption(f"{total} de {len(uni_df)} tickers — página {min(u_page, pages)} de {pages}")
+            st.dataframe(
+                page.set_index("Ticker")[["Empresa", "Sector", "Universo", "Precio", "P/E", "P/B", "ROE",
+                                          "Score (0-100)", "Score Calidad", "Valor vs pares", "IVR", "Etiqueta"]],
+                use_container_width=True, height=min(520, 38 + 35 * max(len(page), 1)),
+            )
 
 with col2:
     st.subheader("Actualizar")
     if st.button("Refrescar datos"):
-        fetch_metrics.clear()
+        fundamentals.invalidate(current)
         st.rerun()
 
-    st.subheader("Alertas")
-    alerts_df = load_alerts_df()
-    if alerts_df.empty:
-        st.info("Todavía no hay alertas. Ejecutá la tarea programada o esperá al próximo escaneo.")
-    else:
-        only_mine = st.checkbox("Mostrar solo mis tickers", value=True)
-        view_df = alerts_df.copy()
-        if only_mine:
-            mine = set([t.upper() for t in current])
-            view_df = view_df[view_df["ticker"].isin(mine)]
-
-        last_ts = view_df["ts"].max() if not view_df.empty else alerts_df["ts"].max()
-        if pd.notna(last_ts):
-            st.caption(f"Último scan: {fmt_local(last_ts)}")
-
-
-        view_df = view_df.rename(columns={
-            "ticker": "Ticker",
-            "empresa": "Empresa",
-            "ivr": "IVR",
-            "etiqueta": "Etiqueta",
-            "ts": "Scan"
-        })
-        st.dataframe(
-            view_df.set_index("Ticker")[["Empresa", "IVR", "Etiqueta", "Scan"]],
-            use_container_width=True, height=320
-        )
+    alerts_panel(current)
+
+    # Reglas de alerta del escáner (tabla 'alert_rules'): las toma en su próxima corrida
+    with st.expander("Reglas de alerta"):
+        st.caption('Ej.: `IVR >= 80 and Sector == "Energy"`, `Ticker in ("AAPL", "MSFT") and IVR >= 70`, '
+                   '`cruza_arriba(IVR, 90)`, `` ROE > 0.2 and `P/B` < 1 ``. Columnas: '
+                   + ", ".join(rules.COLUMNS) + "; alias: " + ", ".join(rules.ALIASES) + ".")
+        with st.form("add_rule", clear_on_submit=True):
+            r_name = st.text_input("Nombre")
+            r_expr = st.text_input("Expresión")
+            if st.form_submit_button("Agregar regla") and r_expr.strip():
+                try:
+                    rules.add(r_name, r_expr)
+                    st.rerun()
+                except rules.RuleError as e:
+                    st.error(f"Regla inválida: {e}")
+        rule_df = rules.list_rules()
+        if rule_df.empty:
+            st.caption("Sin reglas: el escáner no va a registrar alertas.")
+        else:
+            st.dataframe(rule_df.assign(enabled=rule_df["enabled"].astype(bool))
+                         .rename(columns={"name": "Nombre", "expr": "Expresión", "enabled": "Activa"})
+                         .set_index("id")[["Nombre", "Expresión", "Activa"]], use_container_width=True)
+            with st.form("edit_rules"):
+                sel = st.multiselect("Reglas", rule_df["id"].tolist(),
+                                     format_func=lambda i: rule_df.set_index("id").at[i, "name"])
+                c_on, c_off, c_rm = st.columns(3)
+                act = {"on": c_on.form_submit_button("Activar"), "off": c_off.form_submit_button("Desactivar"),
+                       "rm": c_rm.form_submit_button("Eliminar")}
+                if sel and any(act.values()):
+                    if act["rm"]:
+                        rules.remove(sel)
+                    else:
+                        rules.set_enabled(sel, act["on"])
+                    st.rerun()
 
-    if st.button("Actualizar alertas"):
-        load_alerts_df.clear()
-        st.rerun()
+# ======================== Rendimiento ===========================
+def perf_table(snap: dict) -> pd.DataFrame:
+    df = pd.DataFrame(perf.rows(snap), columns=["name", "n", "total", "avg", "p50", "p95", "max"])
+    for c in ("avg", "p50", "p95", "max"):
+        df[c] = df[c] * 1000.0
+    return df.rename(columns={
+        "name": "Etapa", "n": "Veces", "total": "Total (s)", "avg": "Prom (ms)",
+        "p50": "p50 (ms)", "p95": "p95 (ms)", "max": "Máx (ms)",
+    }).set_index("Etapa")
+
+def perf_counters(snap: dict) -> str:
+    c = snap["counters"]
+    seen = c.get("cache.hit", 0) + c.get("cache.stale", 0) + c.get("cache.miss", 0)
+    parts = [f"caché: {c.get('cache.hit', 0)} frescos, {c.get('cache.stale', 0)} vencidos, "
+             f"{c.get('cache.miss', 0)} sin dato" + (f" ({c.get('cache.hit', 0) / seen:.0%} hits)" if seen else "")]
+    parts += [f"{k}: {v}" for k, v in sorted(c.items()) if not k.startswith("cache.")]
+    return " · ".join(parts)
+
+render_perf = render_collector.snapshot()
+try:
+    perf.save("app", snap=render_perf, every=APP_PERF_EVERY)
+except Exception:
+    pass
+with st.expander("Rendimiento"):
+    st.markdown("**Este render**")
+    if render_perf["timers"]:
+        st.dataframe(perf_table(render_perf), use_container_width=True)
+        st.caption(perf_counters(render_perf))
+    try:
+        scan_ts, scan_perf = perf.last("scanner")
+    except Exception:
+        scan_ts, scan_perf = None, {"timers": {}, "counters": {}}
+    if scan_ts:
+        st.markdown(f"**Último scan** ({fmt_local(scan_ts)})")
+        st.dataframe(perf_table(scan_perf), use_container_width=True)
+        st.caption(perf_counters(scan_perf))
+    else:
+        st.caption("El escáner todavía no registró tiempos.")
 
 st.caption(
     "Notas: en bancos/financieras no se usa EV/EBITDA; valoración pondera P/B (x2) y P/E (x1). "
-    "Calidad: ROE (bancos) o D/E (resto). Umbrales y pesos configurables. Caché 5 minutos. "
-    "El panel 'Alertas (Universo)' lee la tabla 'alerts' generada por el escáner programado."
+    "Calidad: ROE (bancos) o D/E (resto). Umbrales y pesos configurables. Caché en screener.db: precio 5 min (una request para toda la lista; P/E y P/B se recalculan con él), fundamentales 12 h. "
+    "El panel 'Alertas (Universo)' lee la tabla 'alerts' generada por el escáner (scanner_service.py) "
+    f"y sólo trae lo nuevo cuando el escáner publica una versión (chequeo cada {ALERTS_POLL}s)."
 )
 
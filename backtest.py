@@ -0,0 +1,193 @@
+# backtest.py — motor "qué hubiera pasado": re-puntúa el historial de snapshots con una
+# grilla de ajustes (pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual) en una sola
+# pasada vectorizada (K combinaciones × N filas) y reporta alertas, rotación de etiquetas
+# y qué nombres entrarían o saldrían respecto de los ajustes base. Las alertas son las de
+# las reglas activas del escáner (rules.py). Resultados cacheados en screener.db por huella
+# de datos + reglas + huella de ajustes.
+#   python backtest.py --val-th 60 65 70 --pe-cap 15 20 25 [--start 2026-01-01]
+import argparse, hashlib, itertools, json
+
+import numpy as np
+import pandas as pd
+
+import db
+import rules
+import scoring
+import snapshots
+from settings import DEFAULTS, KEYS, load_settings, settings_hash
+
+BLOCK = 2_000_000  # celdas (combinaciones × filas) por bloque, acota la memoria
+
+
+def load_panel(start: str = None, end: str = None) -> pd.DataFrame:
+    """
+    Historial diario: el último estado de cada ticker en cada fecha (cierre), ordenado por
+    ticker y fecha. Columnas de input del score + 'date'.
+    """
+    cols = ["Sector", "Industry", "P/E", "P/B", "EV/EBITDA", "Debt/Equity", "ROE"]
+    df = snapshots.read_snapshots(cols + ["date"], start, end)
+    if df.empty:
+        return pd.DataFrame(columns=["ticker", "date"] + cols)
+    df["ticker"] = df["ticker"].astype(str)
+    df = df.sort_values(["ticker", "ts"]).drop_duplicates(["ticker", "date"], keep="last")
+    return df.drop(columns="ts").reset_index(drop=True)
+
+def settings_grid(base: dict = None, **values) -> list:
+    """Producto cartesiano: cada kwarg es una lista de valores; lo que no se pasa sale de `base`."""
+    base = base or load_settings()
+    keys = [k for k in KEYS if k in values]
+    return [{**base, **dict(zip(keys, combo))} for combo in itertools.product(*(values[k] for k in keys))]
+
+def _normalized(s: dict) -> dict:
+    """Mismos pesos que usa el panel: normalizados a suma 1 (0/0 → defaults)."""
+    s = dict(s)
+    w = s["w_val"] + s["w_qual"]
+    if w == 0:
+        s["w_val"], s["w_qual"] = DEFAULTS["w_val"], DEFAULTS["w_qual"]
+    else:
+        s["w_val"], s["w_qual"] = s["w_val"] / w, s["w_qual"] / w
+    return s
+
+def _data_key(panel: pd.DataFrame, ruleset) -> str:
+    h = pd.util.hash_pandas_object(panel, index=False).to_numpy()
+    raw = h.tobytes() + ruleset.hash.encode()
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+# ======================== Caché ========================
+def _cache_get(conn, data_key: str, hashes: list) -> dict:
+    out = {}
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        q = f"SELECT settings_hash, result FROM whatif_cache WHERE data_key = ? AND settings_hash IN ({','.join('?' * len(chunk))})"
+        for h, r in conn.execute(q, [data_key] + chunk):
+            out[h] = json.loads(r)
+    return out
+
+def _cache_put(conn, data_key: str, results: dict) -> None:
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO whatif_cache (data_key, settings_hash, result) VALUES (?,?,?)",
+            [(data_key, h, json.dumps(r)) for h, r in results.items()],
+        )
+
+# ======================== Motor ========================
+def _alerts(frame: pd.DataFrame, iv: np.ndarray, sv: np.ndarray, codes: np.ndarray, same_prev: np.ndarray,
+            ruleset) -> np.ndarray:
+    """
+    Alertas [K, N] de un bloque de combinaciones con las reglas del escáner, en una sola
+    pasada por broadcasting (las columnas que dependen de los ajustes van como (K, N) sin
+    copiar el panel). El "scan anterior" de las reglas de cruce es el día anterior del mismo
+    ticker. Columnas que el historial no guarda (Señal, Calidad por, Universo, Valor vs pares)
+    quedan vacías: esas reglas no disparan.
+    """
+    cols = {"Score (0-100)": sv, "IVR": iv, "Etiqueta": rules.Coded(codes, scoring.ETIQUETAS)}
+    if ruleset.needs_previous:
+        prev_iv = np.full_like(iv, np.nan)
+        prev_iv[:, 1:] = iv[:, :-1]
+        prev_iv[:, ~same_prev] = np.nan
+        none = len(scoring.ETIQUETAS)  # código extra: "" (sin scan anterior)
+        prev_codes = np.full(codes.shape, none, dtype=np.int16)
+        prev_codes[:, 1:] = codes[:, :-1]
+        prev_codes[:, ~same_prev] = none
+        cols[rules.PREV["IVR"]] = prev_iv
+        cols[rules.PREV["Etiqueta"]] = rules.Coded(prev_codes, scoring.ETIQUETAS + [""])
+    return ruleset.mask(frame, cols=cols)
+
+def _evaluate(panel: pd.DataFrame, grid: list, ruleset) -> tuple:
+    """
+    Devuelve (alerta por ticker [K, M] bool, métricas por combinación [dicts]) puntuando
+    todas las combinaciones contra todas las filas del panel, por bloques de combinaciones.
+    """
+    n = len(panel)
+    tickers, starts = np.unique(panel["ticker"].to_numpy(), return_index=True)
+    same_prev = np.zeros(n, dtype=bool)
+    same_prev[1:] = panel["ticker"].to_numpy()[1:] == panel["ticker"].to_numpy()[:-1]
+    n_days = max(panel["date"].nunique(), 1)
+
+    # lo que no depende de los ajustes, una sola vez
+    fin = scoring.is_financial(panel["Sector"], panel["Industry"])
+    sc, _ = scoring.score_calidad(panel["Debt/Equity"], panel["ROE"], fin)
+    pe, pb, eve = (pd.to_numeric(panel[c], errors="coerce").to_numpy(dtype="float64") for c in ("P/E", "P/B", "EV/EBITDA"))
+    frame = panel.rename(columns={"ticker": "Ticker"}).assign(**{"Score Calidad": sc})
+
+    stats, by_ticker = [], []
+    step = max(1, BLOCK // max(n, 1))
+    for i in range(0, len(grid), step):
+        g = [_normalized(s) for s in grid[i:i + step]]
+        col = lambda k: np.array([s[k] for s in g], dtype="float64")[:, None]  # (K, 1)
+        sv = scoring.score_valor(pe, pb, eve, fin, col("pe_cap"), col("pb_cap"), col("eve_cap"))
+        codes = scoring.etiqueta_codes(sv, sc, col("val_th"), col("qual_th"), scoring.caro_threshold(col("val_th")))
+        iv = scoring.ivr(sv, sc, col("w_val"), col("w_qual"))
+
+        alert = np.broadcast_to(_alerts(frame, iv, sv, codes, same_prev, ruleset), (len(g), n))
+        churn = ((codes[:, 1:] != codes[:, :-1]) & same_prev[1:]).sum(axis=1)
+        by_ticker.append(np.logical_or.reduceat(alert, starts, axis=1) if n else np.zeros((len(g), 0), bool))
+        for k in range(len(g)):
+            stats.append({
+                "alerts": int(alert[k].sum()),
+                "alerts_per_day": round(float(alert[k].sum()) / n_days, 2),
+                "churn": int(churn[k]),
+            })
+    return tickers, (np.vstack(by_ticker) if by_ticker else np.zeros((0, len(tickers)), bool)), stats
+
+def what_if(grid: list, base: dict = None, panel: pd.DataFrame = None, start: str = None, end: str = None,
+            ruleset=None, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Re-puntúa el historial con cada combinación de `grid` (lista de dicts de ajustes) y la
+    compara con `base` (por defecto los ajustes guardados). Alerta = alguna de `ruleset`
+    (por defecto las reglas activas, rules.load()). Una fila por combinación con:
+    alerts (ticker-días en alerta), alerts_per_day, tickers (nombres que alertaron alguna vez),
+    churn (cambios de etiqueta día a día), added / dropped (nombres vs base).
+    """
+    base = base or load_settings()
+    panel = load_panel(start, end) if panel is None else panel
+    ruleset = rules.load() if ruleset is None else ruleset
+    data_key = _data_key(panel, ruleset)
+    hashes = [settings_hash(s) for s in grid]
+    base_h = settings_hash(base)
+
+    conn = db.get_conn()
+    cached = _cache_get(conn, data_key, hashes + [base_h]) if use_cache else {}
+    todo = [s for s, h in zip(grid, hashes) if h not in cached]
+    if todo or base_h not in cached:
+        todo_all = todo + ([base] if base_h not in cached else [])
+        tickers, alerting, stats = _evaluate(panel, todo_all, ruleset)
+        fresh = {}
+        for s, a, st in zip(todo_all, alerting, stats):
+            fresh[settings_hash(s)] = {**st, "names": tickers[a].tolist()}
+        cached.update(fresh)
+        if use_cache:
+            _cache_put(conn, data_key, fresh)
+
+    base_names = set(cached[base_h]["names"])
+    rows = []
+    for s, h in zip(grid, hashes):
+        r = cached[h]
+        names = set(r["names"])
+        rows.append({
+            **{k: s[k] for k in KEYS},
+            "alerts": r["alerts"],
+            "alerts_per_day": r["alerts_per_day"],
+            "tickers": len(names),
+            "churn": r["churn"],
+            "added": sorted(names - base_names),
+            "dropped": sorted(base_names - names),
+        })
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Qué hubiera pasado con otros ajustes (sobre snapshots)")
+    for k in KEYS:
+        ap.add_argument("--" + k.replace("_", "-"), type=float, nargs="+", dest=k)
+    ap.add_argument("--start")
+    ap.add_argument("--end")
+    args = vars(ap.parse_args())
+    values = {k: args[k] for k in KEYS if args[k]}
+    rs = rules.load()
+    res = what_if(settings_grid(**values), start=args["start"], end=args["end"], ruleset=rs)
+    for rid, err in rs.errors.items():
+        print(f"Regla {rid} ignorada: {err}")
+    res["added"] = res["added"].map(len)
+    res["dropped"] = res["dropped"].map(len)
+    with pd.option_context("display.max_rows", 500, "display.width", 200):
+        print(res.sort_values("alerts", ascending=False).to_string(index=False))
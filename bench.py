@@ -0,0 +1,514 @@
+# bench.py — benchmarks offline con payloads de Yahoo grabados (info / fast_info / history /
+# estados trimestrales) que se reproducen con un yfinance falso: nada sale a la red.
+# Mide el scan completo (scan_universe.main), el armado de la tabla del panel
+# (fetch_metrics → scoring → orden) a 50, 500 y 5.000 tickers, microbenchmarks de scoring
+# y la memoria del universo puntuado a 10.000 tickers (dicts vs. DataFrame vs. compacto).
+# También el arranque del escáner sin trabajo en un proceso nuevo (intérprete + imports) y
+# la evaluación de cientos de reglas de alerta sobre 5.000 tickers.
+# Los resultados quedan en JSON (bench_results/) para comparar corridas.
+#   python bench.py record [--universe universe_500.txt]   # una vez, con red: graba el fixture
+#   python bench.py run [--sizes 50 500 5000] [--repeat 3] [--latency 0] [--synthetic]
+#   python bench.py compare bench_results/a.json bench_results/b.json
+# Sin fixture grabado `run` falla; con --synthetic usa payloads sintéticos deterministas (sin
+# símbolos caídos, throttling ni datos faltantes reales; queda anotado en el JSON).
+# Más de los tickers del fixture: se clonan con sufijo "_k" (ej. AAPL_3 reproduce AAPL).
+import argparse, contextlib, gzip, io, json, os, platform, random, shutil, statistics
+import subprocess, sys, tempfile, time, types
+
+import numpy as np
+import pandas as pd
+
+FIXTURE_PATH = os.path.join("fixtures", "yahoo_500.json.gz")
+RESULTS_DIR = "bench_results"
+UNIVERSE_FILE = "universe_500.txt"
+SIZES = (50, 500, 5000)
+SCORE_SIZES = (500, 5000, 50000)
+MEMORY_SIZE = 10000
+STARTUP_SIZE = 500
+RULES_SIZE = 5000
+RULE_COUNTS = (1, 100, 500)
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "yfinance", "streamlit")  # no deberían cargarse sin trabajo
+APP_FETCH_WORKERS = 8  # mismo FETCH_WORKERS que app.py (no se puede importar: es el script de Streamlit)
+
+
+# ======================== Fixture ========================
+def _frame_to_json(df) -> dict:
+    """Estado trimestral de yfinance (filas = conceptos, columnas = cierres) -> {cierre: {concepto: valor}}."""
+    if df is None or getattr(df, "empty", True):
+        return {}
+    df = df.astype("float64")
+    return {pd.Timestamp(c).strftime("%Y-%m-%d"): {k: (None if v != v else v) for k, v in df[c].items()}
+            for c in df.columns}
+
+def _frame_from_json(d: dict) -> pd.DataFrame:
+    df = pd.DataFrame(d, dtype="float64")
+    df.columns = pd.to_datetime(df.columns)
+    return df
+
+def record(tickers: list, path: str = FIXTURE_PATH) -> int:
+    """Graba de Yahoo (red real, secuencial) los payloads de cada ticker. Devuelve cuántos vinieron."""
+    import yfinance as yf
+    out = {}
+    for i, t in enumerate(tickers, 1):
+        try:
+            tk = yf.Ticker(t)
+            hist = tk.history(period="5d")
+            out[t] = {
+                "info": tk.info or {},
+                "fast_info": {"last_price": tk.fast_info.get("last_price")},
+                "history": {
+                    "index": [d.strftime("%Y-%m-%d") for d in hist.index],
+                    **{c: [None if v != v else float(v) for v in hist[c]] for c in ("Open", "High", "Low", "Close", "Volume")},
+                },
+                "income": _frame_to_json(tk.quarterly_income_stmt),
+                "balance": _frame_to_json(tk.quarterly_balance_sheet),
+            }
+        except Exception as e:
+            print(f"{t}: {e}")
+        if i % 50 == 0:
+            print(f"{i}/{len(tickers)}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"source": "yahoo", "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "tickers": out}, f,
+                  default=str)
+    return len(out)
+
+def synthetic(tickers: list, seed: int = 0) -> dict:
+    """Payloads con la misma forma que los grabados (valores al azar pero deterministas por ticker)."""
+    out = {}
+    for t in tickers:
+        r = random.Random(f"{seed}:{t}")
+        bank = r.random() < 0.15
+        price = round(r.uniform(5, 500), 2)
+        shares = r.uniform(5e7, 5e9)
+        eps = price / r.uniform(5, 60)
+        bvps = price / r.uniform(0.5, 8)
+        ends = pd.date_range(end="2026-06-30", periods=8, freq="QE")
+        income = {d.strftime("%Y-%m-%d"): {"Net Income": eps * shares / 4 * r.uniform(0.7, 1.3),
+                                           "EBITDA": None if bank else eps * shares / 4 * r.uniform(1.5, 3)}
+                  for d in ends}
+        balance = {d.strftime("%Y-%m-%d"): {"Total Debt": bvps * shares * r.uniform(0, 2),
+                                            "Stockholders Equity": bvps * shares,
+                                            "Cash And Cash Equivalents": bvps * shares * r.uniform(0, 0.5),
+                                            "Ordinary Shares Number": shares}
+                   for d in ends}
+        days = pd.bdate_range(end="2026-10-16", periods=5)
+        closes = [round(price * r.uniform(0.97, 1.03), 2) for _ in days[:-1]] + [price]
+        out[t] = {
+            "info": {
+                "longName": f"{t} Corp", "sector": "Financial Services" if bank else r.choice(
+                    ["Technology", "Industrials", "Energy", "Healthcare", "Consumer Defensive"]),
+                "industry": "Banks - Regional" if bank else "Other",
+                "currentPrice": price, "trailingPE": price / eps, "priceToBook": price / bvps,
+                "enterpriseToEbitda": None if bank else r.uniform(3, 30),
+                "debtToEquity": r.uniform(0, 300), "returnOnEquity": r.uniform(-0.05, 0.35),
+                "trailingEps": eps, "bookValue": bvps, "currency": "USD", "financialCurrency": "USD",
+            },
+            "fast_info": {"last_price": price},
+            "history": {"index": [d.strftime("%Y-%m-%d") for d in days], "Open": closes, "High": closes,
+                        "Low": closes, "Close": closes, "Volume": [1e6] * len(days)},
+            "income": income,
+            "balance": balance,
+        }
+    return {"source": "synthetic", "recorded_at": None, "tickers": out}
+
+def load_fixture(path: str = FIXTURE_PATH) -> dict:
+    """Fixture grabado. FileNotFoundError si no existe (no se cae a sintético sin avisar)."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No hay fixture en {path}: grabalo con `python bench.py record` (requiere red) "
+            "o corré con --synthetic para usar payloads sintéticos"
+        )
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+# ======================== yfinance falso ========================
+class FixtureTicker:
+    """Lo que el código usa de yf.Ticker, servido desde el fixture (ticker ausente = Yahoo sin datos)."""
+
+    def __init__(self, symbol: str, payloads: dict, latency: float = 0.0):
+        self.symbol = symbol
+        self.p = payloads.get(symbol.split("_")[0]) or {}
+        self.latency = latency
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def info(self):
+        self._wait()
+        return dict(self.p.get("info") or {})
+
+    @property
+    def fast_info(self):
+        self._wait()
+        return dict(self.p.get("fast_info") or {})
+
+    def history(self, period="1d", **_):
+        self._wait()
+        h = self.p.get("history") or {}
+        if not h.get("index"):
+            return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"])
+        df = pd.DataFrame({k: v for k, v in h.items() if k != "index"}, index=pd.to_datetime(h["index"]))
+        return df.tail(1) if period == "1d" else df
+
+    @property
+    def quarterly_income_stmt(self):
+        self._wait()
+        return _frame_from_json(self.p.get("income") or {})
+
+    @property
+    def quarterly_balance_sheet(self):
+        self._wait()
+        return _frame_from_json(self.p.get("balance") or {})
+
+def fake_yfinance(payloads: dict, latency: float = 0.0) -> types.ModuleType:
+    """Módulo con Ticker / Tickers / download como los de yfinance, leyendo de `payloads`."""
+    yf = types.ModuleType("yfinance")
+    yf.Ticker = lambda s: FixtureTicker(s, payloads, latency)
+
+    def tickers(spec: str):
+        return types.SimpleNamespace(tickers={s: FixtureTicker(s, payloads, latency) for s in spec.split()})
+
+    def download(symbols, period="5d", **_):
+        if latency:
+            time.sleep(latency)
+        frames = {s: FixtureTicker(s, payloads).history(period) for s in symbols}
+        frames = {s: h for s, h in frames.items() if not h.empty}
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+    yf.Tickers = tickers
+    yf.download = download
+    return yf
+
+def install(payloads: dict, latency: float = 0.0) -> None:
+    """Reemplaza yfinance en sys.modules ANTES de importar los módulos del proyecto."""
+    sys.modules["yfinance"] = fake_yfinance(payloads, latency)
+
+# ======================== Medición ========================
+def _time(fn, repeat: int, setup=None) -> dict:
+    runs = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        t = time.perf_counter()
+        fn(arg) if setup else fn()
+        runs.append(time.perf_counter() - t)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": [round(r, 6) for r in runs]}
+
+class Sandbox:
+    """screener.db y snapshots/ en un directorio temporal; fresh() arranca con caché vacía."""
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix="omaha-bench-")
+        self.cwd = os.getcwd()
+        self.n = 0
+
+    def fresh(self) -> str:
+        import db
+        self.n += 1
+        path = os.path.join(self.root, f"run{self.n}")
+        os.makedirs(path)
+        os.chdir(path)
+        db.DB_PATH = os.path.join(path, "screener.db")  # get_conn abre una conexión nueva por ruta
+        return path
+
+    def close(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+def universe(base: list, n: int) -> list:
+    """n tickers: los del universo y, si faltan, clones con sufijo _k."""
+    out, k = list(base[:n]), 1
+    while len(out) < n:
+        out.extend(f"{t}_{k}" for t in base[:n - len(out)])
+        k += 1
+    return out
+
+# ======================== Benchmarks ========================
+def bench_scan(box: Sandbox, tickers: list, repeat: int) -> dict:
+    """scan_universe.main de punta a punta: en frío (caché vacía) y en caliente (todo fresco)."""
+    import scan_universe
+    path = os.path.join(box.root, f"universe_{len(tickers)}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(tickers))
+    run = lambda *_: scan_universe.main(universes={"bench": path})
+    with contextlib.redirect_stdout(io.StringIO()):
+        cold = _time(run, repeat, setup=box.fresh)
+        box.fresh()
+        run()
+        warm = _time(run, repeat)
+    return {"cold": cold, "warm": warm}
+
+# corre el script como __main__ y deja en stderr qué módulos pesados terminaron cargados
+_WHICH_MODULES = ("import json, runpy, sys; sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__'); "
+                  "sys.stderr.write(json.dumps([m for m in %r if m in sys.modules]))" % (HEAVY_MODULES,))
+
+def bench_startup(box: Sandbox, tickers: list, repeat: int) -> dict:
+    """
+    Arranque del escáner en un proceso nuevo con la caché al día: el intérprete solo
+    (`python -c pass`), `import scan_universe` y `python scan_universe.py` sin nada vencido.
+    Anota qué módulos pesados quedaron cargados en esa última (debería ser ninguno).
+    """
+    import scan_universe
+    repo = os.path.dirname(os.path.abspath(__file__))
+    path = box.fresh()
+    uni = os.path.join(path, "universe.txt")
+    with open(uni, "w", encoding="utf-8") as f:
+        f.write("\n".join(tickers))
+    with contextlib.redirect_stdout(io.StringIO()):
+        scan_universe.main(universes={"bench": uni})  # en este proceso, con el yfinance falso: deja todo fresco
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (repo, os.environ.get("PYTHONPATH")) if p))
+    script = [os.path.join(repo, "scan_universe.py"), "--universe", f"bench={uni}"]
+    proc = lambda *args: subprocess.run([sys.executable, *args], cwd=path, env=env, check=True,
+                                        capture_output=True, text=True)
+    out = {
+        "python": _time(lambda: proc("-c", "pass"), repeat),
+        "import": _time(lambda: proc("-c", "import scan_universe"), repeat),
+        "no_work": _time(lambda: proc(*script), repeat),
+    }
+    r = proc("-c", _WHICH_MODULES, *script)
+    out["skipped"] = "nada vencido" in r.stdout
+    out["heavy_modules"] = json.loads(r.stderr.strip().splitlines()[-1])
+    return out
+
+def _app_rows(tickers: list) -> dict:
+    """Lo que hace app.py para la lista: caché, precios en una request y fundamentales en paralelo."""
+    from concurrent.futures import ThreadPoolExecutor
+    import fetcher, fundamentals
+    cached = fundamentals.load_cached(tickers)
+    price_due = [t for t in tickers if t not in cached or "price" in cached[t][1]]
+    if price_due:
+        fetcher.refresh_prices(price_due)
+        cached = fundamentals.load_cached(tickers)
+    rows = {t: cached[t][0] if t in cached else fundamentals.empty_metrics(t) for t in tickers}
+    pending = [t for t in tickers if t not in cached or cached[t][1]]
+    if pending:
+        with ThreadPoolExecutor(max_workers=APP_FETCH_WORKERS) as ex:
+            rows.update(zip(pending, ex.map(fundamentals.get_metrics, pending)))
+    return rows
+
+def bench_table(box: Sandbox, tickers: list, repeat: int) -> dict:
+    """Tabla del panel: fetch_metrics (frío / caliente) → ratios + scoring → orden por IVR."""
+    import scoring, statements
+    from settings import load_settings
+    out = {"fetch_cold": _time(lambda *_: _app_rows(tickers), repeat, setup=box.fresh)}
+    box.fresh()
+    statements.refresh(tickers)
+    rows = _app_rows(tickers)
+    out["fetch_warm"] = _time(lambda: _app_rows(tickers), repeat)
+    S = load_settings()
+    df = pd.DataFrame(list(rows.values()))
+    out["ratios"] = _time(lambda: statements.apply_ratios(df), repeat)
+    scored = scoring.score_frame(statements.apply_ratios(df), **S)
+    out["score"] = _time(lambda: scoring.score_frame(statements.apply_ratios(df), **S), repeat)
+    out["sort"] = _time(lambda: scored.sort_values(by=["IVR", "Ticker"], ascending=[False, True],
+                                                   na_position="last"), repeat)
+    return out
+
+def bench_scoring(payloads: dict, sizes, repeat: int) -> dict:
+    """Microbenchmarks del modelo sobre frames armados con los payloads (sin DB)."""
+    import fetcher, scoring
+    from settings import DEFAULTS
+    base = list(fetcher._to_metrics({t: p.get("info") or {} for t, p in payloads.items()}).values())
+    out = {}
+    for n in sizes:
+        df = pd.DataFrame([dict(base[i % len(base)], Ticker=f"T{i}") for i in range(n)])
+        fin = scoring.is_financial(df["Sector"], df["Industry"])
+        fin_map = dict(zip(scoring.fin_key(df["Sector"], df["Industry"]), fin))  # como industry_map
+        sv = scoring.score_valor(df["P/E"], df["P/B"], df["EV/EBITDA"], fin, 25.0, 5.0, 15.0)
+        sc, _ = scoring.score_calidad(df["Debt/Equity"], df["ROE"], fin)
+        grid = np.linspace(5, 80, 32).reshape(-1, 1)  # 32 combinaciones de tope P/E a la vez (backtest)
+        out[n] = {
+            "score_frame": _time(lambda: scoring.score_frame(df, **DEFAULTS), repeat),
+            "is_financial": _time(lambda: scoring.is_financial(df["Sector"], df["Industry"]), repeat),
+            "is_financial_map": _time(lambda: scoring.is_financial(df["Sector"], df["Industry"], fin_map), repeat),
+            "score_valor": _time(lambda: scoring.score_valor(df["P/E"], df["P/B"], df["EV/EBITDA"], fin,
+                                                             25.0, 5.0, 15.0), repeat),
+            "score_valor_grid32": _time(lambda: scoring.score_valor(df["P/E"], df["P/B"], df["EV/EBITDA"], fin,
+                                                                    grid, 5.0, 15.0), repeat),
+            "etiqueta": _time(lambda: scoring.etiqueta(sv, sc, 70, 50, 30), repeat),
+        }
+    return out
+
+def _bench_rules(sectors: list, tickers: list, n: int, seed: int = 0) -> list:
+    """n reglas variadas: umbral por ticker, por sector, combinaciones de métricas y cruces."""
+    r = random.Random(seed)
+    kinds = [
+        lambda: f'Ticker == "{r.choice(tickers)}" and IVR >= {r.randint(50, 95)}',
+        lambda: f'Sector == "{r.choice(sectors)}" and IVR >= {r.randint(50, 95)} and PE < {r.randint(8, 30)}',
+        lambda: f'IVR >= {r.randint(60, 95)} and Etiqueta == "Barato y sano"',
+        lambda: f'ROE > {r.uniform(0.05, 0.3):.2f} and `P/B` < {r.uniform(0.5, 3):.1f} and DE < {r.uniform(0.5, 2):.1f}',
+        lambda: f'cruza_arriba(IVR, {r.randint(60, 95)})',
+        lambda: f'Ticker in ("{r.choice(tickers)}", "{r.choice(tickers)}") and abs(IVR - previo(IVR)) > {r.randint(3, 15)}',
+    ]
+    return [(i, f"r{i}", r.choice(kinds)()) for i in range(n)]
+
+def bench_rules(payloads: dict, repeat: int, n: int = RULES_SIZE, counts=RULE_COUNTS) -> dict:
+    """Compilar y evaluar N reglas sobre n tickers puntuados: de una vez y en tandas como las del sink."""
+    import fetcher, pipeline, rules, scoring
+    from settings import DEFAULTS
+    base = list(fetcher._to_metrics({t: p.get("info") or {} for t, p in payloads.items()}).values())
+    df = scoring.score_frame(pd.DataFrame([dict(base[i % len(base)], Ticker=f"T{i}") for i in range(n)]), **DEFAULTS)
+    rng = np.random.default_rng(0)
+    df[rules.PREV["IVR"]] = df["IVR"] + rng.normal(0, 5, n)
+    df[rules.PREV["Etiqueta"]] = df["Etiqueta"]
+    sectors = sorted(set(df["Sector"]) - {""}) or ["Energy"]
+    chunk = pipeline.RULE_BATCH
+    out = {}
+    for k in counts:
+        spec = _bench_rules(sectors, list(df["Ticker"]), k)
+        rs = rules.RuleSet(spec)
+        out[k] = {
+            "compile": _time(lambda: rules.RuleSet(spec), repeat),
+            "evaluate": _time(lambda: rs.evaluate(df), repeat),
+            "evaluate_flushes": _time(lambda: [rs.evaluate(df.iloc[i:i + chunk]) for i in range(0, n, chunk)], repeat),
+            "alerts": int(rs.evaluate(df)[0].sum()),
+        }
+    return out
+
+def bench_memory(payloads: dict, n: int = MEMORY_SIZE) -> dict:
+    """Bytes del universo puntuado de n tickers en cada representación (y el buffer del snapshot)."""
+    import fetcher, scoring, snapshots, universe_store
+    from settings import DEFAULTS
+    base = list(fetcher._to_metrics({t: p.get("info") or {} for t, p in payloads.items()}).values())
+    ms = [dict(base[i % len(base)], Ticker=f"T{i}") for i in range(n)]
+    scored = scoring.score_frame(pd.DataFrame(ms), **DEFAULTS)
+    compact = universe_store.compact(scored)
+    snap = snapshots.SnapshotWriter(DEFAULTS)
+    for i in range(0, n, 50):  # lotes como los del pipeline
+        snap.add(ms[i:i + 50])
+    return {
+        "n": n,
+        "dicts": universe_store.memory(ms),
+        "dataframe": universe_store.memory(scored),
+        "compact": universe_store.memory(compact),
+        "snapshot_buffer": sum(t.nbytes for t in snap.tables),
+        "compact_build": _time(lambda: universe_store.compact(scored), 3),
+    }
+
+# ======================== CLI ========================
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def run(sizes=SIZES, repeat: int = 3, latency: float = 0.0, fixture: str = FIXTURE_PATH,
+        out_dir: str = RESULTS_DIR, skip=(), use_synthetic: bool = False) -> str:
+    """
+    Corre todo y guarda el JSON. Devuelve la ruta del archivo. Usa el fixture grabado;
+    `use_synthetic` lo reemplaza por payloads sintéticos (hay que pedirlo explícitamente).
+    """
+    with open(UNIVERSE_FILE, "r", encoding="utf-8") as f:
+        base = [ln.strip().upper() for ln in f if ln.strip()]
+    fx = synthetic(base) if use_synthetic else load_fixture(fixture)
+    payloads = fx["tickers"]
+    base = [t for t in base if t in payloads] or sorted(payloads)
+    install(payloads, latency)
+
+    res = {
+        "meta": {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": _git_rev(), "python": platform.python_version(),
+            "pandas": pd.__version__, "numpy": np.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "fixture": fx["source"], "fixture_recorded_at": fx.get("recorded_at"),
+            "latency": latency, "repeat": repeat,
+        },
+        "scan": {}, "table": {}, "scoring": {}, "memory": {}, "startup": {}, "rules": {},
+    }
+    out_dir = os.path.abspath(out_dir)
+    box = Sandbox()
+    try:
+        for n in sizes:
+            tickers = universe(base, n)
+            if "scan" not in skip:
+                res["scan"][n] = bench_scan(box, tickers, repeat)
+                print(f"scan {n}: frío {res['scan'][n]['cold']['median']:.3f}s, "
+                      f"caliente {res['scan'][n]['warm']['median']:.3f}s")
+            if "table" not in skip:
+                res["table"][n] = bench_table(box, tickers, repeat)
+                t = res["table"][n]
+                print(f"tabla {n}: fetch frío {t['fetch_cold']['median']:.3f}s, caliente "
+                      f"{t['fetch_warm']['median']:.3f}s, score {t['score']['median']:.4f}s, "
+                      f"orden {t['sort']['median']:.4f}s")
+        if "startup" not in skip:
+            st = res["startup"] = bench_startup(box, universe(base, STARTUP_SIZE), repeat)
+            print(f"arranque {STARTUP_SIZE}: python {st['python']['median']:.3f}s, import {st['import']['median']:.3f}s, "
+                  f"sin trabajo {st['no_work']['median']:.3f}s (salteado: {st['skipped']}, "
+                  f"pesados: {', '.join(st['heavy_modules']) or 'ninguno'})")
+        if "scoring" not in skip:
+            res["scoring"] = bench_scoring(payloads, SCORE_SIZES, max(repeat, 5))
+            for n, r in res["scoring"].items():
+                print(f"score_frame {n}: {r['score_frame']['median'] * 1000:.2f} ms")
+        if "rules" not in skip:
+            res["rules"] = bench_rules(payloads, max(repeat, 5))
+            for k, r in res["rules"].items():
+                print(f"reglas {k} x {RULES_SIZE}: compilar {r['compile']['median'] * 1000:.2f} ms, evaluar "
+                      f"{r['evaluate']['median'] * 1000:.2f} ms (en tandas {r['evaluate_flushes']['median'] * 1000:.2f} ms)")
+        if "memory" not in skip:
+            m = res["memory"] = bench_memory(payloads)
+            print(f"memoria {m['n']}: dicts {m['dicts'] / 2**20:.1f} MB, DataFrame {m['dataframe'] / 2**20:.1f} MB, "
+                  f"compacto {m['compact'] / 2**20:.1f} MB, buffer del snapshot {m['snapshot_buffer'] / 2**20:.1f} MB")
+    finally:
+        box.close()
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(res, f, indent=1)
+    return path
+
+def _flatten(d: dict, prefix: str = "") -> dict:
+    """{"scan": {"500": {"cold": {"median": x}}}} -> {"scan/500/cold": x}."""
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict) and "median" in v:
+            out[prefix + str(k)] = v["median"]
+        elif isinstance(v, dict):
+            out.update(_flatten(v, f"{prefix}{k}/"))
+    return out
+
+def compare(old_path: str, new_path: str, threshold: float = 0.10) -> list:
+    """[(clave, antes, después, cambio relativo)] de las medianas; imprime las que empeoraron > threshold."""
+    with open(old_path, encoding="utf-8") as f:
+        old = _flatten({k: v for k, v in json.load(f).items() if k != "meta"})
+    with open(new_path, encoding="utf-8") as f:
+        new = _flatten({k: v for k, v in json.load(f).items() if k != "meta"})
+    rows = [(k, old[k], new[k], new[k] / old[k] - 1 if old[k] else 0.0) for k in sorted(old.keys() & new.keys())]
+    for k, a, b, rel in rows:
+        flag = "  <-- más lento" if rel > threshold else ""
+        print(f"{k:45s} {a:10.4f}s {b:10.4f}s {rel:+7.1%}{flag}")
+    return rows
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmarks offline de scan, tabla del panel y scoring")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record", help="grabar el fixture desde Yahoo (requiere red)")
+    rec.add_argument("--universe", default=UNIVERSE_FILE)
+    rec.add_argument("--out", default=FIXTURE_PATH)
+    r = sub.add_parser("run", help="correr los benchmarks contra el fixture")
+    r.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    r.add_argument("--repeat", type=int, default=3)
+    r.add_argument("--latency", type=float, default=0.0, help="segundos simulados por request a Yahoo")
+    r.add_argument("--fixture", default=FIXTURE_PATH)
+    r.add_argument("--synthetic", action="store_true",
+                   help="payloads sintéticos en vez del fixture grabado (no reproducen fallas reales de Yahoo)")
+    r.add_argument("--out-dir", default=RESULTS_DIR)
+    r.add_argument("--skip", nargs="*", default=[], choices=["scan", "table", "startup", "scoring", "rules", "memory"])
+    c = sub.add_parser("compare", help="comparar dos corridas (medianas)")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.10)
+    args = ap.parse_args()
+    if args.cmd == "record":
+        with open(args.universe, "r", encoding="utf-8") as f:
+            print(f"Grabados {record([ln.strip().upper() for ln in f if ln.strip()], args.out)} tickers en {args.out}")
+    elif args.cmd == "run":
+        try:
+            path = run(args.sizes, args.repeat, args.latency, args.fixture, args.out_dir, args.skip, args.synthetic)
+        except FileNotFoundError as e:
+            raise SystemExit(str(e))
+        print("Resultados:", path)
+    else:
+        compare(args.old, args.new, args.threshold)
@@ -0,0 +1,292 @@
+# db.py — acceso a screener.db compartido por el panel, el escáner y el servicio.
+# Una conexión por hilo (reutilizada entre llamadas, así el caché de sentencias preparadas
+# de sqlite3 sirve de algo), modo WAL para que los lectores nunca esperen a un scan, y el
+# esquema versionado con PRAGMA user_version: las migraciones corren una vez por proceso,
+# no un CREATE TABLE en cada rerun.
+import sqlite3, threading
+
+DB_PATH = "screener.db"
+
+BUSY_TIMEOUT_MS = 30_000
+CACHED_STATEMENTS = 256
+
+# Cada migración es una lista de sentencias; se aplican en orden dentro de una transacción.
+MIGRATIONS = [
+    # 1: esquema base (las tablas que antes creaba cada módulo por su cuenta)
+    [
+        """CREATE TABLE IF NOT EXISTS tickers (
+            ticker TEXT PRIMARY KEY,
+            created_at TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS settings (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            pe_cap REAL,
+            pb_cap REAL,
+            eve_cap REAL,
+            val_th INTEGER,
+            qual_th INTEGER,
+            w_val REAL,
+            w_qual REAL
+        )""",
+        """CREATE TABLE IF NOT EXISTS fundamentals (
+            ticker TEXT PRIMARY KEY,
+            empresa TEXT,
+            sector TEXT,
+            industry TEXT,
+            precio REAL,
+            pe REAL,
+            pb REAL,
+            eve REAL,
+            de REAL,
+            roe REAL,
+            price_fetched_at REAL,
+            fund_fetched_at REAL
+        )""",
+        """CREATE TABLE IF NOT EXISTS alerts (
+            ticker TEXT PRIMARY KEY,
+            empresa TEXT,
+            ivr REAL,
+            etiqueta TEXT,
+            ts TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS alerts_log (
+            ticker TEXT,
+            empresa TEXT,
+            ivr REAL,
+            etiqueta TEXT,
+            ts TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS scan_state (
+            ticker TEXT PRIMARY KEY,
+            inputs_hash INTEGER,
+            settings_hash TEXT,
+            ivr REAL,
+            etiqueta TEXT,
+            scored_at REAL
+        )""",
+        """CREATE TABLE IF NOT EXISTS scanner_status (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            state TEXT,
+            pid INTEGER,
+            runs INTEGER,
+            skipped INTEGER,
+            errors INTEGER,
+            last_started TEXT,
+            last_finished TEXT,
+            last_duration REAL,
+            last_tickers INTEGER,
+            tickers_per_sec REAL,
+            last_fetched INTEGER,
+            last_failed INTEGER,
+            last_throttled INTEGER,
+            last_alerts INTEGER,
+            last_error TEXT,
+            next_run TEXT
+        )""",
+        "INSERT OR IGNORE INTO scanner_status (id, runs, skipped, errors) VALUES (1, 0, 0, 0)",
+        """CREATE TABLE IF NOT EXISTS whatif_cache (
+            data_key TEXT,
+            settings_hash TEXT,
+            result TEXT,
+            PRIMARY KEY (data_key, settings_hash)
+        )""",
+    ],
+    # 2: índices de alerts_log y resúmenes diarios para la retención
+    [
+        "CREATE INDEX IF NOT EXISTS alerts_log_ticker_ts ON alerts_log (ticker, ts)",
+        "CREATE INDEX IF NOT EXISTS alerts_log_ts ON alerts_log (ts)",
+        """CREATE TABLE IF NOT EXISTS alerts_daily (
+            ticker TEXT,
+            date TEXT,
+            empresa TEXT,
+            n INTEGER,
+            ivr_min REAL,
+            ivr_max REAL,
+            ivr_sum REAL,
+            ivr_last REAL,
+            etiqueta_last TEXT,
+            last_ts TEXT,
+            PRIMARY KEY (ticker, date)
+        ) WITHOUT ROWID""",
+    ],
+    # 3: versión de publicación (cada flush de alertas y cada scan la incrementan) para que
+    # el panel pida sólo lo que cambió desde la última versión que vio
+    [
+        """CREATE TABLE IF NOT EXISTS scan_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            ts TEXT
+        )""",
+        "INSERT OR IGNORE INTO scan_version (id, version) VALUES (1, 0)",
+        "ALTER TABLE alerts ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS alerts_version ON alerts (version)",
+    ],
+    # 4: EPS y valor libro por acción, para recalcular P/E y P/B con el precio nuevo
+    [
+        "ALTER TABLE fundamentals ADD COLUMN eps REAL",
+        "ALTER TABLE fundamentals ADD COLUMN bvps REAL",
+    ],
+    # 5: estados contables trimestrales crudos (una fila por ticker y cierre de trimestre)
+    [
+        """CREATE TABLE IF NOT EXISTS statements (
+            ticker TEXT,
+            period_end TEXT,
+            net_income REAL,
+            ebitda REAL,
+            total_debt REAL,
+            equity REAL,
+            cash REAL,
+            shares REAL,
+            PRIMARY KEY (ticker, period_end)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS statements_meta (
+            ticker TEXT PRIMARY KEY,
+            checked_at REAL,
+            last_period TEXT,
+            ccy_ok INTEGER
+        )""",
+    ],
+    # 6: varios universos: de qué universo salió cada alerta + cola de shards del escáner
+    [
+        "ALTER TABLE alerts ADD COLUMN universe TEXT",
+        "ALTER TABLE alerts_log ADD COLUMN universe TEXT",
+        """CREATE TABLE IF NOT EXISTS scan_queue (
+            run_id TEXT,
+            shard INTEGER,
+            universe TEXT,
+            tickers TEXT,
+            state TEXT,
+            attempts INTEGER,
+            worker TEXT,
+            claimed_at REAL,
+            finished_at REAL,
+            result TEXT,
+            PRIMARY KEY (run_id, shard)
+        )""",
+        "CREATE INDEX IF NOT EXISTS scan_queue_state ON scan_queue (state, run_id)",
+    ],
+    # 7: desglose de tiempos por corrida (perf.py)
+    [
+        """CREATE TABLE IF NOT EXISTS perf_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT,
+            run_id TEXT,
+            ts TEXT,
+            data TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS perf_runs_source ON perf_runs (source, id)",
+        "CREATE INDEX IF NOT EXISTS perf_runs_run ON perf_runs (source, run_id)",
+    ],
+    # 8: estadísticas por sector/industria y clasificación de financieras (peer_stats.py)
+    [
+        """CREATE TABLE IF NOT EXISTS peer_stats (
+            level TEXT,
+            name TEXT,
+            metric TEXT,
+            n INTEGER,
+            p50 REAL,
+            quantiles TEXT,
+            computed_at REAL,
+            PRIMARY KEY (level, name, metric)
+        )""",
+        """CREATE TABLE IF NOT EXISTS industry_map (
+            key TEXT PRIMARY KEY,
+            sector TEXT,
+            industry TEXT,
+            financial INTEGER
+        )""",
+    ],
+    # 9: reglas de alerta (rules.py) y qué regla disparó cada alerta
+    [
+        """CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            expr TEXT,
+            enabled INTEGER DEFAULT 1,
+            created_at TEXT
+        )""",
+        # la que estaba fija en scan_universe (ALERT_IVR_MIN / ALERT_REQUIRE)
+        """INSERT INTO alert_rules (name, expr, enabled, created_at)
+           VALUES ('Barato y sano', 'IVR >= 85 and Etiqueta == "Barato y sano"', 1,
+                   strftime('%Y-%m-%dT%H:%M:%S', 'now'))""",
+        "ALTER TABLE alerts ADD COLUMN rule TEXT",
+        "ALTER TABLE alerts_log ADD COLUMN rule TEXT",
+    ],
+    # 10: símbolos que Yahoo no resuelve (caché negativa, ver freshness.py)
+    [
+        """CREATE TABLE IF NOT EXISTS fetch_failures (
+            ticker TEXT,
+            kind TEXT,
+            attempts INTEGER,
+            failed_at REAL,
+            PRIMARY KEY (ticker, kind)
+        )""",
+    ],
+    # 11: con qué reglas de alerta se evaluó cada ticker (un cambio de reglas re-evalúa todo)
+    [
+        "ALTER TABLE scan_state ADD COLUMN rules_hash TEXT",
+    ],
+    # 12: último chequeo del servicio, aunque no haya habido nada que escanear
+    [
+        "ALTER TABLE scanner_status ADD COLUMN last_checked TEXT",
+    ],
+    # 13: monedas del blob `info` (statements.py las necesita sin volver a pedir `info`)
+    [
+        "ALTER TABLE fundamentals ADD COLUMN currency TEXT",
+        "ALTER TABLE fundamentals ADD COLUMN fin_currency TEXT",
+    ],
+    # 14: todos los universos de los tickers de un shard que están en más de uno (shards.split)
+    [
+        "ALTER TABLE scan_queue ADD COLUMN members TEXT",
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """Conexión nueva con los PRAGMA del proyecto (WAL, busy timeout). Preferí get_conn()."""
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS)
+    conn.execute("PRAGMA journal_mode=WAL")   # persistente en el archivo; lectores no bloquean al escritor
+    conn.execute("PRAGMA synchronous=NORMAL")  # seguro con WAL y bastante más rápido que FULL
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Aplica las migraciones pendientes (serializado entre procesos con BEGIN IMMEDIATE)."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for v, stmts in enumerate(MIGRATIONS[version:], start=version + 1):
+            for sql in stmts:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {v}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return SCHEMA_VERSION
+
+def get_conn(path: str = None) -> sqlite3.Connection:
+    """
+    Conexión compartida del hilo actual (una por hilo y por archivo). La primera del
+    proceso aplica las migraciones pendientes.
+    """
+    path = path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
+        if path not in _migrated:
+            with _migrate_lock:
+                if path not in _migrated:
+                    migrate(conn)
+                    _migrated.add(path)
+    return conn
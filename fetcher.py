@@ -0,0 +1,258 @@
+# fetcher.py — capa de descarga de Yahoo! por lotes, con concurrencia adaptativa
+# (sube mientras la latencia es buena, baja a la mitad ante throttling/errores),
+# backoff + reintento por símbolo y reporte de fallidos en vez de filas vacías.
+import random, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import fundamentals
+import perf
+
+
+def _yf():
+    """yfinance (y pandas detrás) recién al primer pedido a Yahoo: importarlo cuesta ~1 s."""
+    import yfinance
+    return yfinance
+
+def is_throttle(e: Exception) -> bool:
+    # si yfinance no se cargó, la excepción no puede ser suya (y yfinance viejo no la tiene)
+    rate_limit = getattr(sys.modules.get("yfinance.exceptions"), "YFRateLimitError", None)
+    if rate_limit and isinstance(e, rate_limit):
+        return True
+    msg = str(e).lower()
+    return "429" in msg or "too many requests" in msg or "rate limit" in msg
+
+# ======================== Fuente (Yahoo o stub) ========================
+class YahooSource:
+    """
+    Fuente real. Cualquier objeto con los mismos métodos sirve (ej. un stub local en tests):
+      info(symbols)       -> {symbol: info_dict}   ({} si ese símbolo no vino)
+      prices(symbols)     -> {symbol: precio}      (ausente si no vino)
+      statements(symbols, currencies=None)
+                          -> {symbol: {"income": df, "balance": df, "ccy_ok": bool}} (trimestrales)
+    Cualquiera puede devolver también `(datos, errores)` con {symbol: excepción}: un símbolo
+    que falló por red / HTTP se reintenta pero no cuenta como "Yahoo no lo conoce".
+    Las excepciones de throttling se dejan subir para que el fetcher reduzca la concurrencia.
+    """
+
+    def info(self, symbols: list) -> tuple:
+        # yf.Tickers comparte sesión/cookies/crumb entre los símbolos del lote
+        tks = _yf().Tickers(" ".join(symbols))
+        out, errors = {}, {}
+        for s in symbols:
+            try:
+                out[s] = tks.tickers[s].info or {}
+            except Exception as e:
+                if is_throttle(e):
+                    raise
+                errors[s] = e
+        return out, errors
+
+    def prices(self, symbols: list) -> dict:
+        # una sola request multi-símbolo
+        df = _yf().download(symbols, period="5d", group_by="ticker", threads=False,
+                         progress=False, auto_adjust=False)
+        out = {}
+        if df is None or df.empty:
+            return out
+        for s in symbols:
+            try:
+                close = df[s]["Close"].dropna()
+                if not close.empty:
+                    out[s] = float(close.iloc[-1])
+            except Exception:
+                continue
+        return out
+
+    def statements(self, symbols: list, currencies: dict = None) -> tuple:
+        # currencies: {symbol: (financialCurrency, currency)} ya conocidas (fundamentals.load_currencies)
+        currencies = currencies or {}
+        tks = _yf().Tickers(" ".join(symbols))
+        out, errors = {}, {}
+        for s in symbols:
+            try:
+                tk = tks.tickers[s]
+                if s in currencies:
+                    fin_ccy, ccy = currencies[s]
+                else:  # sin monedas en la caché: recién ahí el blob `info` (un request más)
+                    info = tk.info or {}
+                    fin_ccy, ccy = info.get("financialCurrency"), info.get("currency")
+                out[s] = {
+                    "income": tk.quarterly_income_stmt,
+                    "balance": tk.quarterly_balance_sheet,
+                    "ccy_ok": not fin_ccy or not ccy or fin_ccy == ccy,
+                }
+            except Exception as e:
+                if is_throttle(e):
+                    raise
+                errors[s] = e
+        return out, errors
+
+# ======================== Concurrencia adaptativa ========================
+class AdaptiveLimit:
+    """
+    AIMD: +1 lote en vuelo cuando un lote termina rápido y sin errores,
+    /2 ante throttling o tasa de error alta. Acotado a [min_limit, max_limit].
+    """
+
+    def __init__(self, start=4, min_limit=1, max_limit=16, target_latency=2.0, max_error_rate=0.2):
+        self.limit = start
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float, n: int, n_err: int, throttled: bool = False) -> int:
+        with self._lock:
+            err_rate = n_err / n if n else 0.0
+            if throttled or err_rate > self.max_error_rate:
+                self.limit = max(self.min_limit, self.limit // 2)
+            elif latency <= self.target_latency:
+                self.limit = min(self.max_limit, self.limit + 1)
+            return self.limit
+
+def _run(kind: str, symbols: list, source, batch_size: int, limit: AdaptiveLimit,
+         max_retries: int, backoff: float, deadline: float, on_batch=None, call_kw: dict = None) -> tuple:
+    """
+    Motor común: reparte `symbols` en lotes, los despacha con `limit.limit` lotes en vuelo,
+    reencola (con backoff exponencial + jitter) los símbolos que no vinieron.
+    Devuelve (datos {symbol: payload}, reporte dict). Con `on_batch`, cada lote exitoso se
+    entrega ahí apenas llega (streaming) y no se acumula en `datos`. `call_kw` va a cada
+    llamada a la fuente.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    t0 = time.time()
+    stop_at = t0 + deadline if deadline else None
+    call = getattr(source, kind)
+    call_kw = call_kw or {}
+
+    # cola de trabajo: (listo_desde, intento, [símbolos])
+    pending = [(0.0, 0, symbols[i:i + batch_size]) for i in range(0, len(symbols), batch_size)]
+    data, failed, unresolved = {}, [], []
+    n_ok = 0
+    rep = {"requested": len(symbols), "batches": 0, "retries": 0, "throttled": 0, "max_concurrency": limit.limit}
+
+    errored = set()  # símbolos con algún error de red / HTTP: nunca van a `unresolved`
+
+    def one(batch):
+        t = time.time()
+        try:
+            got = call(batch, **call_kw)
+            errs = {}
+            if isinstance(got, tuple):
+                got, errs = got
+            return batch, got, errs, None, time.time() - t
+        except Exception as e:
+            return batch, {}, {}, e, time.time() - t
+
+    def requeue(batch, attempt):
+        if attempt >= max_retries or (stop_at and time.time() >= stop_at):
+            failed.extend(batch)
+            if attempt >= max_retries:  # sólo los que Yahoo contestó sin datos en cada intento
+                unresolved.extend(s for s in batch if s not in errored)
+            return
+        delay = backoff * (2 ** attempt) * (1 + random.random())
+        pending.append((time.time() + delay, attempt + 1, batch))
+        rep["retries"] += len(batch)
+
+    with ThreadPoolExecutor(max_workers=limit.max_limit) as ex:
+        running = {}
+        while pending or running:
+            now = time.time()
+            if stop_at and now >= stop_at:
+                for _, _, b in pending:
+                    failed.extend(b)
+                pending.clear()
+            ready = sorted((p for p in pending if p[0] <= now), key=lambda p: p[0])
+            while ready and len(running) < limit.limit:
+                p = ready.pop(0)
+                pending.remove(p)
+                running[ex.submit(one, p[2])] = p[1]
+                rep["batches"] += 1
+            if not running:
+                if pending:  # todo en backoff: dormir hasta el próximo
+                    time.sleep(max(0.0, min(p[0] for p in pending) - time.time()))
+                continue
+            done, _ = wait(list(running), timeout=0.25, return_when=FIRST_COMPLETED)
+            for fu in done:
+                attempt = running.pop(fu)
+                batch, got, errs, err, lat = fu.result()
+                throttled = err is not None and is_throttle(err)
+                rep["throttled"] += int(throttled)
+                missing = [s for s in batch if not got.get(s)]
+                errored.update(batch if err is not None else errs)
+                perf.count(f"yahoo.{kind}.errors", len(batch) if err is not None else len(errs))
+                perf.observe(f"yahoo.{kind}", lat)  # latencia por lote y endpoint
+                perf.count(f"yahoo.{kind}.symbols", len(batch))
+                perf.count(f"yahoo.{kind}.missing", len(missing))
+                perf.count(f"yahoo.{kind}.throttled", int(throttled))
+                ok = {s: got[s] for s in batch if got.get(s)}
+                n_ok += len(ok)
+                if ok:
+                    if on_batch:
+                        on_batch(ok)
+                    else:
+                        data.update(ok)
+                lim = limit.observe(lat, len(batch), len(missing), throttled)
+                rep["max_concurrency"] = max(rep["max_concurrency"], lim)
+                if missing:
+                    requeue(missing, attempt)
+
+    rep["ok"] = n_ok
+    rep["failed"] = len(failed)
+    rep["failed_symbols"] = sorted(failed)
+    rep["unresolved_symbols"] = sorted(unresolved)  # contestados sin datos en todos los intentos
+    rep["elapsed"] = round(time.time() - t0, 3)
+    return data, rep
+
+# ======================== API ========================
+def _to_metrics(raw: dict) -> dict:
+    out = {}
+    for s, info in raw.items():
+        m = fundamentals.empty_metrics(s)
+        m.update(fundamentals.parse_info(info))
+        # el blob `info` ya trae el precio: sirve para los ratios propios (statements.py)
+        price = info.get("currentPrice") or info.get("regularMarketPrice")
+        m["Precio"] = float(price) if isinstance(price, (int, float)) else float("nan")
+        out[s] = m
+    return out
+
+def fetch_fundamentals(symbols, source=None, batch_size=20, limit=None, max_retries=3,
+                       backoff=1.0, deadline=None, on_batch=None) -> tuple:
+    """
+    Trae el grupo 'fund' de muchos símbolos. Devuelve ({symbol: metrics}, reporte).
+    `deadline` (segundos) acota el tiempo total: lo que no llegó para entonces cuenta como fallido.
+    `on_batch(metrics_por_symbol)` recibe cada lote apenas llega (el dict devuelto queda vacío).
+    """
+    cb = (lambda raw: on_batch(_to_metrics(raw))) if on_batch else None
+    raw, rep = _run("info", symbols, source or YahooSource(), batch_size, limit or AdaptiveLimit(),
+                    max_retries, backoff, deadline, on_batch=cb)
+    return _to_metrics(raw), rep
+
+def fetch_prices(symbols, source=None, batch_size=100, limit=None, max_retries=3,
+                 backoff=1.0, deadline=None, on_batch=None) -> tuple:
+    """Último precio de muchos símbolos con download multi-símbolo. Devuelve ({symbol: precio}, reporte)."""
+    return _run("prices", symbols, source or YahooSource(), batch_size, limit or AdaptiveLimit(max_limit=4),
+                max_retries, backoff, deadline, on_batch=on_batch)
+
+def fetch_statements(symbols, source=None, batch_size=10, limit=None, max_retries=2,
+                     backoff=1.0, deadline=None, on_batch=None, currencies=None) -> tuple:
+    """
+    Estados trimestrales (income + balance) de muchos símbolos. Devuelve ({symbol: crudo}, reporte).
+    `currencies` ({symbol: (financialCurrency, currency)}) evita pedir `info` sólo por las monedas.
+    """
+    return _run("statements", symbols, source or YahooSource(), batch_size, limit or AdaptiveLimit(max_limit=8),
+                max_retries, backoff, deadline, on_batch=on_batch,
+                call_kw={"currencies": currencies} if currencies else None)
+
+def refresh_prices(symbols, source=None, **kw) -> dict:
+    """
+    Capa rápida: baja el precio de todos los símbolos con download multi-símbolo y lo guarda
+    en la caché (sólo el grupo 'price'; los fundamentales no se tocan). Devuelve {symbol: precio}.
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    if not symbols:
+        return {}
+    got, _ = fetch_prices(symbols, source=source, **kw)
+    fundamentals.save_many([{"Ticker": s, "Precio": p} for s, p in got.items()], groups=("price",))
+    return got
@@ -0,0 +1,132 @@
+# freshness.py — política de vencimiento del escáner (cada cuánto se re-bajan fundamentales
+# según la cercanía al umbral y cuándo se espera un balance nuevo) y un chequeo barato, sólo
+# con sqlite3, de si un scan tendría algo que hacer. Sin pandas ni yfinance: scan_universe lo
+# usa antes de cargar las dependencias pesadas, así una corrida sin trabajo arranca y
+# termina en milisegundos.
+import hashlib, json, time
+
+import db
+import fundamentals
+
+# Agenda de refresco por prioridad: (distancia máx. del IVR al umbral de alerta, segundos).
+# Los que no entran en ninguna banda (o sin IVR) usan fundamentals.FUND_TTL.
+SCHEDULE = [(5.0, 15 * 60), (15.0, 60 * 60)]
+
+# estados contables: período -> próxima consulta
+QUARTER_DAYS = 91
+FILING_LAG_DAYS = 45        # la SEC da 40–45 días para el 10-Q
+RETRY_SECS = 24 * 60 * 60   # si el balance nuevo todavía no salió, reintentar al día siguiente
+EMPTY_RETRY_SECS = 7 * 24 * 60 * 60  # tickers sin estados (ETFs, etc.)
+
+# símbolos que Yahoo no resuelve (deslistados, mal escritos): reintento a las 6 h, 12 h, 24 h…
+# con tope de una semana, en vez de reintentarlos (con backoff) en cada scan
+FAIL_RETRY_SECS = 6 * 60 * 60
+FAIL_MAX_SECS = 7 * 24 * 60 * 60
+
+
+def fund_ttl(ivr, threshold: float, schedule=SCHEDULE) -> float:
+    """TTL de fundamentales de un ticker según qué tan cerca quedó su IVR del umbral."""
+    ttl = float(fundamentals.FUND_TTL)
+    if ivr is None:
+        return ttl
+    for band, secs in sorted(schedule, reverse=True):  # la banda más angosta gana
+        if abs(ivr - threshold) <= band:
+            ttl = float(secs)
+    return ttl
+
+def fail_retry(attempts: int) -> float:
+    """Segundos hasta reintentar un símbolo que falló `attempts` veces seguidas."""
+    return float(min(FAIL_RETRY_SECS * 2 ** max(attempts - 1, 0), FAIL_MAX_SECS))
+
+def failed(kind: str, tickers, now: float = None) -> set:
+    """Tickers con un fallo de `kind` ("fund" / "statements") todavía dentro del plazo de reintento."""
+    now = time.time() if now is None else now
+    tickers = list(dict.fromkeys(tickers))
+    out = set()
+    conn = db.get_conn()
+    for i in range(0, len(tickers), 500):
+        chunk = tickers[i:i + 500]
+        out.update(t for t, n, at in conn.execute(
+            f"SELECT ticker, attempts, failed_at FROM fetch_failures WHERE kind = ? "
+            f"AND ticker IN ({','.join('?' * len(chunk))})", [kind, *chunk],
+        ) if now - at < fail_retry(n))
+    return out
+
+def record_failures(kind: str, tickers, now: float = None) -> None:
+    """Anota (o suma un intento a) los símbolos que no vinieron."""
+    now = time.time() if now is None else now
+    conn = db.get_conn()
+    with conn:
+        conn.executemany(
+            """INSERT INTO fetch_failures (ticker, kind, attempts, failed_at) VALUES (?, ?, 1, ?)
+               ON CONFLICT(ticker, kind) DO UPDATE SET attempts = attempts + 1, failed_at = excluded.failed_at""",
+            [(t, kind, now) for t in dict.fromkeys(tickers)],
+        )
+
+def clear_failures(kind: str, tickers) -> None:
+    """Los que volvieron a responder salen de la caché negativa."""
+    conn = db.get_conn()
+    with conn:
+        conn.executemany("DELETE FROM fetch_failures WHERE ticker = ? AND kind = ?",
+                         [(t, kind) for t in dict.fromkeys(tickers)])
+
+def active_rules(conn=None) -> list:
+    """Reglas de alerta activas [(id, nombre, expr)] (rules.load las compila)."""
+    conn = conn or db.get_conn()
+    return conn.execute("SELECT id, name, expr FROM alert_rules WHERE enabled = 1 ORDER BY id").fetchall()
+
+def rules_hash(rules) -> str:
+    """Huella de un juego de reglas [(id, nombre, expr)]: cambia al agregar, borrar, activar o desactivar."""
+    return hashlib.sha1(json.dumps([[r[0], r[2]] for r in rules]).encode()).hexdigest()[:16]
+
+def pending(tickers, settings_hash: str, threshold: float, now: float = None, rules_hash: str = None) -> dict:
+    """
+    Cuánto trabajo tendría un scan incremental sobre `tickers`, sin tocar Yahoo:
+      fund       sin fundamentales o vencidos (con la agenda por cercanía al umbral)
+      rescore    nunca puntuados, con otros ajustes u otras reglas (si se pasa `rules_hash`), o con
+                 precio / estados más nuevos que el score
+      statements con balance nuevo esperado
+    Los que fallaron hace poco (ver failed) no cuentan hasta que vence su reintento.
+    Todo en cero = el scan no cambiaría nada.
+    """
+    now = time.time() if now is None else now
+    tickers = list(dict.fromkeys(tickers))
+    out = {"fund": 0, "rescore": 0, "statements": 0}
+    conn = db.get_conn()
+    for i in range(0, len(tickers), 500):  # límite de variables de SQLite
+        chunk = tickers[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        seen = set()
+        bad_fund, bad_stmt = failed("fund", chunk, now), failed("statements", chunk, now)
+        for t, fund_at, price_at, ivr, sh, rh, scored_at, stmt_at in conn.execute(
+            f"""SELECT f.ticker, f.fund_fetched_at, f.price_fetched_at, s.ivr, s.settings_hash, s.rules_hash,
+                       s.scored_at, m.checked_at
+                FROM fundamentals f
+                LEFT JOIN scan_state s ON s.ticker = f.ticker
+                LEFT JOIN statements_meta m ON m.ticker = f.ticker
+                WHERE f.ticker IN ({marks})""",
+            chunk,
+        ):
+            seen.add(t)
+            if now - (fund_at or 0.0) > fund_ttl(ivr, threshold) and t not in bad_fund:
+                out["fund"] += 1
+            elif sh != settings_hash or (rules_hash is not None and rh != rules_hash) or scored_at is None or max(price_at or 0.0, stmt_at or 0.0) > scored_at:
+                out["rescore"] += 1
+        out["fund"] += len(set(chunk) - seen - bad_fund)
+
+        lag = (QUARTER_DAYS + FILING_LAG_DAYS) * 86400
+        meta = {t: (c or 0.0, p) for t, c, p in conn.execute(
+            f"""SELECT ticker, checked_at, CAST(strftime('%s', last_period) AS REAL) FROM statements_meta
+                WHERE ticker IN ({marks})""", chunk)}
+        for t in chunk:
+            if t in bad_stmt:
+                continue
+            if t not in meta:
+                out["statements"] += 1
+                continue
+            checked, period = meta[t]
+            if period is None:
+                out["statements"] += now - checked >= EMPTY_RETRY_SECS
+            else:
+                out["statements"] += now >= period + lag and now - checked >= RETRY_SECS
+    return out
@@ -0,0 +1,272 @@
+# fundamentals.py — caché persistente (screener.db) de métricas de Yahoo! Finance,
+# compartida por app.py y scan_universe.py. Write-through: se lee primero del disco y
+# sólo se va a Yahoo por los grupos de campos vencidos. Dos velocidades: el precio
+# (barato, multi-símbolo, TTL corto) y los fundamentales (`info`, TTL largo); P/E y P/B
+# se recalculan con el último precio y el EPS / valor libro guardados.
+import time
+
+import db
+import perf
+
+# TTL por grupo de campos (segundos)
+PRICE_TTL = 5 * 60          # precio: se mueve todo el día
+FUND_TTL = 12 * 60 * 60     # ratios / datos de la empresa: cambian lento
+
+GROUPS = ("price", "fund")
+
+# clave del dict de métricas -> columna en la tabla
+PRICE_COLS = {"Precio": "precio"}
+FUND_COLS = {
+    "Empresa": "empresa",
+    "Sector": "sector",
+    "Industry": "industry",
+    "P/E": "pe",
+    "P/B": "pb",
+    "EV/EBITDA": "eve",
+    "Debt/Equity": "de",
+    "ROE": "roe",
+    "EPS": "eps",    # trailingEps (para recalcular P/E con el precio)
+    "BVPS": "bvps",  # bookValue por acción (para recalcular P/B)
+    "Moneda": "currency",           # de cotización
+    "Moneda EEFF": "fin_currency",  # de los estados contables (financialCurrency)
+}
+TEXT_KEYS = ("Empresa", "Sector", "Industry", "Moneda", "Moneda EEFF")
+
+
+def empty_metrics(ticker: str) -> dict:
+    """Dict de métricas con NaN / vacío (mismo formato que usa la tabla del panel)."""
+    return {
+        "Ticker": ticker,
+        "Empresa": "",
+        "Sector": "",
+        "Industry": "",
+        "Precio": float("nan"),
+        "P/E": float("nan"),
+        "P/B": float("nan"),
+        "EV/EBITDA": float("nan"),
+        "Debt/Equity": float("nan"),
+        "ROE": float("nan"),  # Return on Equity (ratio, ej. 0.15 = 15%)
+        "EPS": float("nan"),
+        "BVPS": float("nan"),
+        "Moneda": "",
+        "Moneda EEFF": "",
+    }
+
+def _num(x) -> float:
+    return float(x) if isinstance(x, (int, float)) else float("nan")
+
+def _ratio(price: float, per_share: float, cached: float) -> float:
+    if per_share != per_share or price != price:  # sin dato: queda el ratio de Yahoo
+        return cached
+    return price / per_share if per_share > 0 else float("nan")  # EPS/libro <= 0: sin ratio (como Yahoo)
+
+def reprice(m: dict) -> dict:
+    """Recalcula en el lugar P/E y P/B con el precio actual y el EPS / valor libro guardados."""
+    m["P/E"] = _ratio(m["Precio"], m.get("EPS", float("nan")), m["P/E"])
+    m["P/B"] = _ratio(m["Precio"], m.get("BVPS", float("nan")), m["P/B"])
+    return m
+
+def load_cached(tickers, now: float = None, fund_ttl: dict = None) -> dict:
+    """
+    Lee de disco las métricas guardadas. Devuelve {ticker: (metrics, stale_groups)}
+    sólo para los tickers que están en la tabla; stale_groups es un set con los
+    grupos ("price", "fund") cuyo TTL venció. `fund_ttl` permite un TTL de
+    fundamentales por ticker ({ticker: segundos}); el resto usa FUND_TTL.
+    """
+    fund_ttl = fund_ttl or {}
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    if not tickers:
+        return {}
+    now = time.time() if now is None else now
+    cols = list(PRICE_COLS.values()) + list(FUND_COLS.values())
+    keys = list(PRICE_COLS) + list(FUND_COLS)
+    out = {}
+    conn = db.get_conn()
+    t0 = time.perf_counter()
+    for i in range(0, len(tickers), 500):  # límite de variables de SQLite
+        chunk = tickers[i:i + 500]
+        q = (
+            f"SELECT ticker, {', '.join(cols)}, price_fetched_at, fund_fetched_at "
+            f"FROM fundamentals WHERE ticker IN ({','.join('?' * len(chunk))})"
+        )
+        for r in conn.execute(q, chunk):
+            m = empty_metrics(r[0])
+            for k, v in zip(keys, r[1:1 + len(keys)]):
+                if k in TEXT_KEYS:
+                    m[k] = v or ""
+                else:
+                    m[k] = _num(v)
+            price_at, fund_at = r[-2] or 0.0, r[-1] or 0.0
+            if price_at > fund_at:  # precio más nuevo que el `info`: ratios con ese precio
+                reprice(m)
+            stale = set()
+            if now - price_at > PRICE_TTL:
+                stale.add("price")
+            if now - fund_at > fund_ttl.get(r[0], FUND_TTL):
+                stale.add("fund")
+            out[r[0]] = (m, stale)
+    perf.observe("db.fundamentals.read", time.perf_counter() - t0)
+    n_stale = sum(bool(s) for _, s in out.values())
+    perf.count("cache.hit", len(out) - n_stale)
+    perf.count("cache.stale", n_stale)
+    perf.count("cache.miss", len(tickers) - len(out))
+    return out
+
+def load_currencies(tickers) -> dict:
+    """
+    {ticker: (moneda de los estados, moneda de cotización)} guardadas con el último `info`
+    ("" = Yahoo no la informa). Ausente si el ticker nunca trajo `info` con monedas.
+    """
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    out = {}
+    conn = db.get_conn()
+    for i in range(0, len(tickers), 500):  # límite de variables de SQLite
+        chunk = tickers[i:i + 500]
+        q = (
+            "SELECT ticker, fin_currency, currency FROM fundamentals "
+            f"WHERE currency IS NOT NULL AND ticker IN ({','.join('?' * len(chunk))})"
+        )
+        out.update((r[0], (r[1] or "", r[2])) for r in conn.execute(q, chunk))
+    return out
+
+def save_cached(metrics: dict, groups=GROUPS, now: float = None) -> None:
+    """Upsert de los grupos indicados (sólo esas columnas y su fetched_at)."""
+    save_many([metrics], groups=groups, now=now)
+
+def save_many(metrics_list, groups=GROUPS, now: float = None) -> None:
+    """Como save_cached pero para muchos tickers en una sola transacción (executemany)."""
+    metrics_list = list(metrics_list)
+    now = time.time() if now is None else now
+    colmap = {}
+    if "price" in groups:
+        colmap.update(PRICE_COLS)
+    if "fund" in groups:
+        colmap.update(FUND_COLS)
+    if not colmap or not metrics_list:
+        return
+    cols = list(colmap.values())
+    stamps = [f"{g}_fetched_at" for g in GROUPS if g in groups]
+    all_cols = ["ticker"] + cols + stamps
+    rows = []
+    for m in metrics_list:
+        vals = [m["Ticker"].upper()] + [m.get(k) for k in colmap] + [now] * len(stamps)
+        rows.append([None if isinstance(v, float) and v != v else v for v in vals])  # NaN -> NULL
+    upd = ", ".join(f"{c}=excluded.{c}" for c in all_cols[1:])
+    conn = db.get_conn()
+    with perf.timer("db.fundamentals.write"), conn:
+        conn.executemany(
+            f"INSERT INTO fundamentals ({', '.join(all_cols)}) VALUES ({','.join('?' * len(all_cols))}) "
+            f"ON CONFLICT(ticker) DO UPDATE SET {upd}",
+            rows,
+        )
+
+def invalidate(tickers) -> None:
+    """Marca como vencidos todos los grupos (los valores quedan como respaldo)."""
+    tickers = [t.upper() for t in tickers]
+    if not tickers:
+        return
+    conn = db.get_conn()
+    with conn:
+        conn.executemany(
+            "UPDATE fundamentals SET price_fetched_at = 0, fund_fetched_at = 0 WHERE ticker = ?",
+            [(t,) for t in tickers],
+        )
+
+# ======================== Yahoo! ============================
+def fetch_price(tk):
+    """Precio vía fast_info; si falla, último cierre de history(1d). None si no hay."""
+    price = None
+    try:
+        fi = tk.fast_info
+        price = fi.get("last_price")
+    except Exception:
+        price = None
+    if price is None:
+        try:
+            h = tk.history(period="1d")
+            if not h.empty:
+                price = float(h["Close"].iloc[-1])
+        except Exception:
+            price = None
+    return float(price) if price is not None else None
+
+def parse_info(info: dict) -> dict:
+    """Extrae del blob `info` los campos del grupo 'fund' (formato del panel)."""
+    out = {}
+    out["Empresa"] = info.get("longName") or info.get("shortName") or ""
+    out["Sector"]  = info.get("sector") or ""
+    out["Industry"]= info.get("industry") or ""
+
+    out["P/E"] = _num(info.get("trailingPE"))
+    out["P/B"] = _num(info.get("priceToBook"))
+    out["EV/EBITDA"] = _num(info.get("enterpriseToEbitda"))
+
+    de_val = _num(info.get("debtToEquity"))  # a veces en %
+    if de_val > 10:  # si parece porcentaje, pásalo a veces
+        de_val = de_val / 100.0
+    out["Debt/Equity"] = de_val
+    out["ROE"] = _num(info.get("returnOnEquity"))  # ratio (0.12 = 12%)
+
+    # por acción, sólo si están en la moneda de cotización (en ADRs suelen venir en la local)
+    fin_ccy = info.get("financialCurrency")
+    same_ccy = not fin_ccy or not info.get("currency") or fin_ccy == info.get("currency")
+    out["EPS"] = _num(info.get("trailingEps")) if same_ccy else float("nan")
+    out["BVPS"] = _num(info.get("bookValue")) if same_ccy else float("nan")
+    out["Moneda"] = info.get("currency") or ""
+    out["Moneda EEFF"] = fin_ccy or ""
+    return out
+
+def fetch_yahoo(ticker: str, groups=GROUPS) -> tuple:
+    """
+    Trae de Yahoo los grupos pedidos. Devuelve (metrics, ok_groups): ok_groups son
+    los grupos que efectivamente llegaron (los demás quedan en NaN).
+    """
+    out = empty_metrics(ticker)
+    ok = set()
+    try:
+        import yfinance as yf  # diferido: el arranque del escáner sin trabajo no lo carga
+        tk = yf.Ticker(ticker)
+        if "price" in groups:
+            with perf.timer("yahoo.fast_info"):
+                price = fetch_price(tk)
+            if price is not None:
+                out["Precio"] = price
+                ok.add("price")
+        if "fund" in groups:
+            try:
+                with perf.timer("yahoo.info"):
+                    info = tk.info or {}
+            except Exception:
+                info = {}
+            if info:
+                out.update(parse_info(info))
+                ok.add("fund")
+    except Exception:
+        pass
+    return out, ok
+
+# ======================== API ============================
+def get_metrics(ticker: str, groups=GROUPS) -> dict:
+    """
+    Métricas de un ticker: disco primero; a Yahoo sólo por los grupos vencidos.
+    Lo que llega se escribe en screener.db; si Yahoo falla se devuelve lo último guardado.
+    """
+    ticker = (ticker or "").strip().upper()
+    cached = load_cached([ticker]).get(ticker)
+    if cached is None:
+        m, stale = empty_metrics(ticker), set(groups)
+    else:
+        m, stale = cached
+        stale = stale & set(groups)
+    if not stale:
+        return m
+
+    fresh, ok = fetch_yahoo(ticker, stale)
+    if ok:
+        keys = (list(PRICE_COLS) if "price" in ok else []) + (list(FUND_COLS) if "fund" in ok else [])
+        for k in keys:
+            m[k] = fresh[k]
+        save_cached(m, groups=ok)
+        if ok == {"price"}:
+            reprice(m)
+    return m
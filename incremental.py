@@ -0,0 +1,117 @@
+# incremental.py — escaneo delta: guarda por ticker la huella de los inputs y el último
+# score (tabla 'scan_state'), refresca antes los tickers cerca del umbral de alerta,
+# re-puntúa sólo si cambiaron inputs, ajustes o reglas de alerta y marca qué filas cambiaron
+# de IVR/etiqueta.
+import time
+
+import numpy as np
+import pandas as pd
+
+import alerts
+import freshness
+import fundamentals
+import rules
+import scoring
+from settings import settings_hash
+
+INPUT_COLS = ["Sector", "Industry", "P/E", "P/B", "EV/EBITDA", "Debt/Equity", "ROE"]
+
+SCHEDULE = freshness.SCHEDULE  # agenda de refresco por cercanía al umbral (ver freshness.py)
+
+
+def load_state(conn, tickers) -> pd.DataFrame:
+    """Estado guardado de esos tickers (índice = ticker). Vacío si no hay nada."""
+    tickers = list(dict.fromkeys(tickers))
+    frames = []
+    for i in range(0, len(tickers), 500):  # límite de variables de SQLite
+        chunk = tickers[i:i + 500]
+        frames.append(pd.read_sql_query(
+            f"""SELECT ticker, inputs_hash, settings_hash, rules_hash, ivr, etiqueta FROM scan_state
+                WHERE ticker IN ({','.join('?' * len(chunk))})""",
+            conn, params=chunk,
+        ))
+    cols = ["ticker", "inputs_hash", "settings_hash", "rules_hash", "ivr", "etiqueta"]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=cols)
+    return df.set_index("ticker")
+
+def refresh_ttls(state: pd.DataFrame, threshold: float, schedule=SCHEDULE) -> dict:
+    """TTL de fundamentales por ticker según qué tan cerca quedó su IVR del umbral de alerta."""
+    ivr = pd.to_numeric(state["ivr"], errors="coerce").to_numpy(dtype="float64")
+    dist = np.abs(ivr - threshold)
+    ttl = np.full(len(state), float(fundamentals.FUND_TTL))
+    for band, secs in sorted(schedule, reverse=True):  # la banda más angosta gana
+        ttl = np.where(dist <= band, float(secs), ttl)
+    return dict(zip(state.index, ttl))
+
+def inputs_hash(df: pd.DataFrame) -> np.ndarray:
+    """Huella por fila de los inputs del score (vectorizada)."""
+    cols = df.reindex(columns=INPUT_COLS)
+    return pd.util.hash_pandas_object(cols, index=False).to_numpy().view("int64")
+
+class IncrementalScorer:
+    """
+    Etapa de score para pipeline.run_scan. Sólo puntúa las filas cuyos inputs, ajustes o
+    reglas de alerta (`rules_hash`, ver rules.RuleSet.hash) cambiaron desde el último scan;
+    devuelve esas filas con la columna "Cambió" (IVR o etiqueta distintos a lo guardado),
+    "Reevaluar" (evaluadas con otras reglas: el sink las vuelve a pasar por todas), lo
+    guardado ("IVR previo", "Etiqueta previa") y actualiza 'scan_state'.
+    Con `full` puntúa todas las filas (scan --full) pero igual deja 'scan_state' al día: las
+    reglas de cruce del próximo scan comparan contra este y no contra uno viejo.
+    """
+
+    def __init__(self, S: dict, conn=None, rules_hash: str = None, full: bool = False):
+        self.S = S
+        self.full = full
+        self.sh = settings_hash(S)
+        self.rh = rules_hash
+        self.conn = conn or alerts.connect()
+        self.n_scored = 0
+        self.n_skipped = 0
+        self.n_changed = 0
+
+    def __call__(self, batch: list) -> pd.DataFrame:
+        df = pd.DataFrame(batch)
+        h = inputs_hash(df)
+        state = load_state(self.conn, df["Ticker"])
+        # por dict y no con reindex: el NaN de los faltantes pasaría el hash int64 a float
+        prev = {t: r for t, r in zip(state.index, state.itertuples(index=False))}
+        old = [prev.get(t) for t in df["Ticker"]]
+        new_rules = np.array([o is not None and o.rules_hash != self.rh for o in old], dtype=bool)
+        same = np.array([
+            o is not None and o.inputs_hash == hh and o.settings_hash == self.sh
+            for o, hh in zip(old, h)
+        ], dtype=bool) & ~new_rules & (not self.full)
+        self.n_skipped += int(same.sum())
+
+        out = scoring.score_frame(df.loc[~same], **self.S)
+        old = [o for o, s in zip(old, same) if not s]
+        old_ivr = np.array([np.nan if o is None or o.ivr is None else o.ivr for o in old], dtype="float64")
+        new_ivr = out["IVR"].to_numpy(dtype="float64")
+        same_ivr = (old_ivr == new_ivr) | (np.isnan(old_ivr) & np.isnan(new_ivr))
+        same_lab = np.array([o is not None and o.etiqueta == et for o, et in zip(old, out["Etiqueta"])], dtype=bool)
+        out["Cambió"] = ~(same_ivr & same_lab)
+        out["Reevaluar"] = new_rules[~same]
+        out[rules.PREV["IVR"]] = old_ivr  # para las reglas de cruce (cruza_arriba, ...)
+        out[rules.PREV["Etiqueta"]] = [o.etiqueta if o is not None and o.etiqueta else "" for o in old]
+        self.n_scored += len(out)
+        self.n_changed += int(out["Cambió"].sum())
+
+        now = time.time()
+        rows = [
+            (t, int(hh), self.sh, self.rh, None if np.isnan(iv) else float(iv), et, now)
+            for t, hh, iv, et in zip(out["Ticker"], h[~same], new_ivr, out["Etiqueta"])
+        ]
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO scan_state (ticker, inputs_hash, settings_hash, rules_hash, ivr, etiqueta, scored_at)
+                   VALUES (?,?,?,?,?,?,?)
+                   ON CONFLICT(ticker) DO UPDATE SET
+                     inputs_hash=excluded.inputs_hash, settings_hash=excluded.settings_hash,
+                     rules_hash=excluded.rules_hash, ivr=excluded.ivr, etiqueta=excluded.etiqueta,
+                     scored_at=excluded.scored_at""",
+                rows,
+            )
+            # los que no cambiaron quedan evaluados a esta hora (freshness compara contra scored_at)
+            self.conn.executemany("UPDATE scan_state SET scored_at = ? WHERE ticker = ?",
+                                  [(now, t) for t in df.loc[same, "Ticker"]])
+        return out
@@ -0,0 +1,137 @@
+# peer_stats.py — estadísticas precomputadas por sector e industria (tablas 'peer_stats' e
+# 'industry_map' de screener.db). Después de cada scan se arma, para cada grupo y métrica,
+# una grilla de percentiles del universo; el panel ubica cada ticker entre sus pares con un
+# lookup + interpolación (O(n) por rerun, sin recalcular distribuciones) y clasifica
+# financieras por (sector, industria) sin buscar palabras clave fila por fila.
+import json, time
+
+import numpy as np
+import pandas as pd
+
+import db
+import fundamentals
+import scoring
+import statements
+
+METRICS = ["P/E", "P/B", "EV/EBITDA", "Debt/Equity", "ROE"]
+MULTIPLES = ["P/E", "P/B", "EV/EBITDA"]  # sólo valores > 0 (como los caps del score)
+QUANTILES = np.linspace(0.0, 1.0, 21)  # grilla guardada: p0, p5, ..., p100
+MIN_PEERS = 8  # con menos, se sube de industria a sector y de sector al universo
+ALL = "*"      # nombre del grupo "todo el universo" (nivel 'all')
+LEVELS = [("industry", "Industry"), ("sector", "Sector"), ("all", None)]
+
+
+# ======================== Precomputación ========================
+def _values(df: pd.DataFrame, metric: str) -> pd.Series:
+    v = pd.to_numeric(df[metric], errors="coerce")
+    v = v[np.isfinite(v)]
+    return v[v > 0] if metric in MULTIPLES else v
+
+def build(df: pd.DataFrame) -> tuple:
+    """
+    Del universo (columnas del panel, ratios ya aplicados) arma las filas de 'peer_stats'
+    (level, name, metric, n, p50, grilla de percentiles) y de 'industry_map'.
+    """
+    stats = []
+    for level, col in LEVELS:
+        groups = [(ALL, df)] if col is None else df[df[col].fillna("") != ""].groupby(col, observed=True)
+        for name, g in groups:
+            for m in METRICS:
+                v = _values(g, m)
+                if len(v):
+                    q = np.quantile(v.to_numpy(dtype="float64"), QUANTILES)
+                    stats.append((level, str(name), m, len(v), float(np.median(v)), json.dumps(q.round(6).tolist())))
+    pairs = df[["Sector", "Industry"]].fillna("").astype(str).drop_duplicates()
+    fin = scoring.is_financial(pairs["Sector"], pairs["Industry"])
+    keys = scoring.fin_key(pairs["Sector"], pairs["Industry"])
+    fmap = [(k, s, i, int(f)) for k, s, i, f in zip(keys, pairs["Sector"], pairs["Industry"], fin)]
+    return stats, fmap
+
+def refresh(tickers) -> int:
+    """Recalcula todo desde la caché de los `tickers` (el universo del scan). Devuelve grupos×métricas."""
+    cached = fundamentals.load_cached(tickers)
+    if not cached:
+        return 0
+    df = statements.apply_ratios(pd.DataFrame([m for m, _ in cached.values()]))
+    stats, fmap = build(df)
+    now = time.time()
+    conn = db.get_conn()
+    with conn:
+        conn.execute("DELETE FROM peer_stats")
+        conn.executemany(
+            "INSERT INTO peer_stats (level, name, metric, n, p50, quantiles, computed_at) VALUES (?,?,?,?,?,?,?)",
+            [s + (now,) for s in stats],
+        )
+        conn.executemany(
+            """INSERT INTO industry_map (key, sector, industry, financial) VALUES (?,?,?,?)
+               ON CONFLICT(key) DO UPDATE SET financial=excluded.financial""",
+            fmap,
+        )
+    return len(stats)
+
+# ======================== Lookup ========================
+class PeerStats:
+    """Grillas de percentiles en memoria: {(level, name, metric): (n, quantiles)} + mapa de financieras."""
+
+    def __init__(self, grids: dict = None, fin_map: dict = None):
+        self.grids = grids or {}
+        self.fin_map = fin_map or {}
+
+    def __bool__(self) -> bool:
+        return bool(self.grids)
+
+    def percentile(self, df: pd.DataFrame, metric: str) -> np.ndarray:
+        """
+        Percentil (0..1) de cada fila entre sus pares: industria si tiene MIN_PEERS, si no
+        sector, si no el universo. NaN si el valor falta (o es <= 0 en múltiplos).
+        """
+        x = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype="float64")
+        if metric in MULTIPLES:
+            x = np.where(x > 0, x, np.nan)
+        out = np.full(len(x), np.nan)
+        todo = np.isfinite(x)
+        for level, col in LEVELS:
+            if not todo.any():
+                break
+            names = np.full(len(x), ALL, dtype=object) if col is None else \
+                df[col].astype(object).fillna("").to_numpy()
+            codes, uniq = pd.factorize(names)
+            order = np.argsort(codes, kind="stable")  # filas agrupadas por código (radix: lineal)
+            bounds = np.searchsorted(codes[order], np.arange(len(uniq) + 1))
+            for c, name in enumerate(uniq):
+                g = self.grids.get((level, name, metric))
+                if g is None or (g[0] < MIN_PEERS and level != "all"):
+                    continue
+                rows = order[bounds[c]:bounds[c + 1]]
+                rows = rows[todo[rows]]
+                if len(rows):
+                    out[rows] = np.interp(x[rows], g[1], QUANTILES)
+                    todo[rows] = False
+        return out
+
+    def relative_value(self, df: pd.DataFrame, fin=None) -> np.ndarray:
+        """
+        "Valor vs pares" 0..100: qué tan barato cotiza contra su grupo (100 = el múltiplo más
+        bajo de sus pares). Mismos pesos que scoring.score_valor: no financieras P/E, P/B y
+        EV/EBITDA 1:1:1; financieras P/B x2 y P/E x1.
+        """
+        if fin is None:
+            fin = scoring.is_financial(df["Sector"], df["Industry"], self.fin_map)
+        fin = np.asarray(fin, dtype=bool)
+        num = np.zeros(len(df))
+        den = np.zeros(len(df))
+        for m, w in (("P/E", 1.0), ("P/B", np.where(fin, 2.0, 1.0)), ("EV/EBITDA", np.where(fin, 0.0, 1.0))):
+            sub = 1.0 - self.percentile(df, m)
+            have = ~np.isnan(sub)
+            num = num + w * np.where(have, sub, 0.0)
+            den = den + w * have
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.round(np.where(den > 0, num / den * 100.0, np.nan), 1)
+
+def load() -> PeerStats:
+    """Lee las tablas (un par de cientos de filas) a memoria."""
+    conn = db.get_conn()
+    grids = {(lv, name, m): (n, np.asarray(json.loads(q), dtype="float64"))
+             for lv, name, m, n, q in conn.execute("SELECT level, name, metric, n, quantiles FROM peer_stats")}
+    fin_map = {k: bool(f) for k, f in conn.execute("SELECT key, financial FROM industry_map")}
+    return PeerStats(grids, fin_map)
@@ -0,0 +1,211 @@
+# perf.py — instrumentación del camino caliente: timers por etapa (con histograma de
+# latencias) y contadores (hits/misses de caché, símbolos pedidos a Yahoo, ...), en memoria.
+# Se mide en el colector actual (contextvars): el del proceso por defecto (escáner) o uno
+# propio por render del panel (use()), así las sesiones de Streamlit no se pisan entre sí.
+# Cada corrida del escáner y cada render del panel (a intervalos) guardan su desglose en la
+# tabla 'perf_runs' de screener.db; también se puede exportar como texto Prometheus.
+# Nombres: "yahoo.<endpoint>", "db.<tabla>.read|write", "cache.<hit|stale|miss>", "score", ...
+import contextlib, contextvars, json, os, threading, time
+from datetime import datetime
+
+import db
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # segundos (+ inf)
+KEEP_RUNS = 500  # corridas guardadas por origen
+
+
+def _empty() -> dict:
+    return {"n": 0, "total": 0.0, "max": 0.0, "buckets": [0] * (len(BUCKETS) + 1)}
+
+class Collector:
+    """Timers y contadores de una corrida (o de un render del panel)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}    # nombre -> {"n", "total", "max", "buckets"}
+        self.counters = {}  # nombre -> int
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "timers": {k: dict(v, buckets=list(v["buckets"])) for k, v in self.timers.items()},
+                "counters": dict(self.counters),
+            }
+
+_process = Collector()  # escáner, hilos de fondo y todo lo que no pidió uno propio
+_current = contextvars.ContextVar("perf_collector", default=_process)
+_saved_at = {}  # source -> última vez que save(every=...) escribió
+
+def use(collector: Collector = None) -> Collector:
+    """
+    Mide en un colector propio (nuevo si no se pasa) en el contexto actual: en el panel, al
+    empezar cada render. Los hilos nuevos arrancan con el del proceso (ver bind).
+    """
+    collector = Collector() if collector is None else collector
+    _current.set(collector)
+    return collector
+
+@contextlib.contextmanager
+def scope(collector: Collector = None):
+    """use() sólo dentro del bloque (ej. un fragmento del panel); al salir vuelve el colector anterior."""
+    collector = Collector() if collector is None else collector
+    token = _current.set(collector)
+    try:
+        yield collector
+    finally:
+        _current.reset(token)
+
+def bind(fn):
+    """`fn` midiendo en el colector de quien llama (para mandarla a un ThreadPoolExecutor)."""
+    collector = _current.get()
+
+    def run(*args, **kw):
+        token = _current.set(collector)
+        try:
+            return fn(*args, **kw)
+        finally:
+            _current.reset(token)
+    return run
+
+def observe(name: str, secs: float) -> None:
+    """Suma una medición (segundos) al timer `name`."""
+    i = next((i for i, b in enumerate(BUCKETS) if secs <= b), len(BUCKETS))
+    c = _current.get()
+    with c.lock:
+        t = c.timers.get(name)
+        if t is None:
+            t = c.timers[name] = _empty()
+        t["n"] += 1
+        t["total"] += secs
+        t["max"] = max(t["max"], secs)
+        t["buckets"][i] += 1
+
+@contextlib.contextmanager
+def timer(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t)
+
+def count(name: str, n: int = 1) -> None:
+    if n:
+        c = _current.get()
+        with c.lock:
+            c.counters[name] = c.counters.get(name, 0) + n
+
+def reset() -> None:
+    c = _current.get()
+    with c.lock:
+        c.timers.clear()
+        c.counters.clear()
+
+def snapshot() -> dict:
+    """Copia de lo medido en el colector actual desde el último reset(): {"timers": {...}, "counters": {...}}."""
+    return _current.get().snapshot()
+
+def merge(snaps) -> dict:
+    """Suma varios snapshots (ej. los de cada worker de una misma corrida)."""
+    out = {"timers": {}, "counters": {}}
+    for s in snaps:
+        for k, v in s.get("timers", {}).items():
+            t = out["timers"].setdefault(k, _empty())
+            t["n"] += v["n"]
+            t["total"] += v["total"]
+            t["max"] = max(t["max"], v["max"])
+            t["buckets"] = [a + b for a, b in zip(t["buckets"], v["buckets"])]
+        for k, v in s.get("counters", {}).items():
+            out["counters"][k] = out["counters"].get(k, 0) + v
+    return out
+
+def quantile(t: dict, q: float) -> float:
+    """Cuantil aproximado por el histograma (límite superior del bucket; el máximo en el último)."""
+    if not t["n"]:
+        return float("nan")
+    acc = 0
+    for b, c in zip(BUCKETS, t["buckets"]):
+        acc += c
+        if acc >= q * t["n"]:
+            return min(b, t["max"])
+    return t["max"]
+
+def rows(snap: dict) -> list:
+    """Una fila por timer (para mostrar): nombre, n, total, promedio, p50, p95 y máximo en segundos."""
+    return [
+        {"name": k, "n": t["n"], "total": t["total"], "avg": t["total"] / t["n"] if t["n"] else float("nan"),
+         "p50": quantile(t, 0.5), "p95": quantile(t, 0.95), "max": t["max"]}
+        for k, t in sorted(snap["timers"].items(), key=lambda kv: -kv[1]["total"])
+    ]
+
+# ======================== Persistencia ========================
+def save(source: str, run_id: str = None, snap: dict = None, every: float = None) -> None:
+    """
+    Guarda lo medido (o `snap`) como una corrida de `source` ("scanner", "app"). Con `every`
+    (segundos) escribe a lo sumo una por intervalo y proceso: el panel no inserta (y poda)
+    'perf_runs' en cada rerun.
+    """
+    snap = snapshot() if snap is None else snap
+    if not snap["timers"] and not snap["counters"]:
+        return
+    if every is not None:
+        now = time.time()
+        with _process.lock:
+            if now - _saved_at.get(source, 0.0) < every:
+                return
+            _saved_at[source] = now
+    conn = db.get_conn()
+    with conn:
+        conn.execute(
+            "INSERT INTO perf_runs (source, run_id, ts, data) VALUES (?,?,?,?)",
+            (source, run_id, datetime.utcnow().isoformat(), json.dumps(snap)),
+        )
+        conn.execute(
+            """DELETE FROM perf_runs WHERE source = ? AND id <= (
+                 SELECT id FROM perf_runs WHERE source = ? ORDER BY id DESC LIMIT 1 OFFSET ?)""",
+            (source, source, KEEP_RUNS),
+        )
+
+def last(source: str) -> tuple:
+    """(ts, snapshot) de la última corrida de `source`, sumando las filas de todos sus procesos."""
+    conn = db.get_conn()
+    row = conn.execute(
+        "SELECT id, run_id, ts FROM perf_runs WHERE source = ? ORDER BY id DESC LIMIT 1", (source,)
+    ).fetchone()
+    if row is None:
+        return None, {"timers": {}, "counters": {}}
+    if row[1] is None:
+        data = [conn.execute("SELECT data FROM perf_runs WHERE id = ?", (row[0],)).fetchone()[0]]
+    else:
+        data = [d for (d,) in conn.execute(
+            "SELECT data FROM perf_runs WHERE source = ? AND run_id = ?", (source, row[1]))]
+    return row[2], merge(json.loads(d) for d in data)
+
+# ======================== Prometheus ========================
+def _metric(name: str) -> str:
+    return "omaha_" + "".join(c if c.isalnum() else "_" for c in name)
+
+def to_prometheus(snap: dict, source: str) -> str:
+    """Formato de texto de Prometheus: un histograma por timer y un counter por contador."""
+    lines = []
+    for k, t in sorted(snap["timers"].items()):
+        m = _metric(k) + "_seconds"
+        lines.append(f"# TYPE {m} histogram")
+        acc = 0
+        for b, c in zip(BUCKETS, t["buckets"]):
+            acc += c
+            lines.append(f'{m}_bucket{{source="{source}",le="{b}"}} {acc}')
+        lines.append(f'{m}_bucket{{source="{source}",le="+Inf"}} {t["n"]}')
+        lines.append(f'{m}_sum{{source="{source}"}} {t["total"]:.6f}')
+        lines.append(f'{m}_count{{source="{source}"}} {t["n"]}')
+    for k, v in sorted(snap["counters"].items()):
+        m = _metric(k) + "_total"
+        lines.append(f"# TYPE {m} counter")
+        lines.append(f'{m}{{source="{source}"}} {v}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str, snap: dict, source: str) -> None:
+    """Escribe el archivo de forma atómica (para el textfile collector de node_exporter)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(to_prometheus(snap, source))
+    os.replace(tmp, path)
@@ -0,0 +1,224 @@
+# pipeline.py — escaneo en streaming con asyncio: fetch → score → sink.
+# Cada lote se puntúa apenas llega y las alertas se escriben por tandas (executemany, una
+# sola conexión), así las primeras alertas aparecen a segundos de empezar y la memoria queda
+# acotada por el tamaño de las colas. Las tres etapas son intercambiables:
+#   fetch(tickers)  -> async iterator de listas de metrics (dicts formato fundamentals)
+#   score(batch)    -> DataFrame puntuado (columnas de scoring.SCORE_COLS)
+#   sink.add(df) / sink.close()
+# y opcionalmente "taps" que ven cada lote crudo antes del score (tap.add(batch) / tap.close()).
+import asyncio, time
+from datetime import datetime
+
+import pandas as pd
+
+import alerts
+import fetcher
+import freshness
+import fundamentals
+import peer_stats
+import perf
+import rules
+import scoring
+import statements
+
+
+# ======================== Fetch ========================
+class CachedYahooFetch:
+    """
+    Etapa de fetch por defecto: primero lo fresco de la caché de screener.db (un lote por
+    `batch_size`), después lo vencido vía fetcher, entregado lote a lote a medida que llega.
+    Si Yahoo falla para un ticker se usa lo último guardado; los que no resuelve quedan en la
+    caché negativa (freshness.failed) y no se vuelven a pedir hasta su reintento. `report`
+    queda con el resumen.
+    `fund_ttl` ({ticker: segundos}) permite refrescar algunos tickers más seguido que otros.
+    Cada lote sale con los ratios propios de statements.py donde hay estados contables.
+    """
+
+    def __init__(self, batch_size=50, deadline=None, queue_size=8, fund_ttl=None, **fetch_kw):
+        self.batch_size = batch_size
+        self.deadline = deadline
+        self.queue_size = queue_size
+        self.fund_ttl = fund_ttl
+        self.fetch_kw = fetch_kw
+        self.report = {}
+
+    async def __call__(self, tickers):
+        cached = await asyncio.to_thread(fundamentals.load_cached, tickers, fund_ttl=self.fund_ttl)
+        fresh = [m for m, stale in cached.values() if "fund" not in stale]
+        for i in range(0, len(fresh), self.batch_size):
+            yield self._ratios(fresh[i:i + self.batch_size])
+        bad = await asyncio.to_thread(freshness.failed, "fund", tickers)
+        todo = [t for t in dict.fromkeys(tickers) if (t not in cached or "fund" in cached[t][1]) and t not in bad]
+
+        loop = asyncio.get_running_loop()
+        q = asyncio.Queue(maxsize=self.queue_size)
+
+        def on_batch(got: dict):  # corre en el hilo del fetcher
+            ms = list(got.values())
+            fundamentals.save_many(ms, groups=("fund",))
+            fundamentals.save_many([m for m in ms if m["Precio"] == m["Precio"]], groups=("price",))
+            # bloquea el fetcher si el consumidor va atrasado (backpressure)
+            asyncio.run_coroutine_threadsafe(q.put(ms), loop).result()
+
+        async def drive():
+            try:
+                return await asyncio.to_thread(
+                    fetcher.fetch_fundamentals, todo, deadline=self.deadline, on_batch=on_batch, **self.fetch_kw
+                )
+            finally:
+                await q.put(None)
+
+        task = asyncio.create_task(drive())
+        while (ms := await q.get()) is not None:
+            yield self._ratios(ms)
+        _, rep = await task
+        await asyncio.to_thread(freshness.record_failures, "fund", rep["unresolved_symbols"])
+        await asyncio.to_thread(freshness.clear_failures, "fund", set(todo) - set(rep["failed_symbols"]))
+
+        skipped = [t for t in bad if t in cached and "fund" in cached[t][1]]
+        stale = [cached[t][0] for t in [*rep["failed_symbols"], *skipped] if t in cached]
+        if stale:
+            yield self._ratios(stale)
+        rep["cached"] = len(fresh)
+        rep["known_failed"] = len(bad)
+        self.report = rep
+
+    @staticmethod
+    def _ratios(ms: list) -> list:
+        return statements.apply_ratios(pd.DataFrame(ms)).to_dict("records")
+
+# ======================== Score ========================
+def make_scorer(S: dict):
+    """Etapa de score: el mismo modelo vectorizado del panel, por lote."""
+    def score(batch: list) -> pd.DataFrame:
+        return scoring.score_frame(pd.DataFrame(batch), **S)
+    return score
+
+# ======================== Sink ========================
+RULE_BATCH = 2000  # filas candidatas que junta el sink antes de evaluar las reglas de una pasada
+
+class AlertSink:
+    """
+    Filtra las alertas de cada lote puntuado y las escribe por tandas en una sola conexión:
+    flush cada `flush_rows` filas o `flush_secs` segundos, y al cerrar. Con `only_changes`
+    sólo se escriben las filas marcadas en la columna "Cambió" (IVR o etiqueta distintos) o
+    "Reevaluar" (puntuadas con otras reglas; ver incremental.IncrementalScorer).
+    Con `rules` (rules.RuleSet) las filas candidatas se juntan (hasta `eval_rows` o el flush
+    por tiempo) y ahí se evalúan todas las reglas de una vez sobre lo acumulado; sin reglas,
+    el umbral fijo ivr_min / require. `members` ({ticker: "u1,u2"}) da el "Universo" de los
+    tickers que están en varios; el resto es `universe`.
+    """
+
+    def __init__(self, ivr_min=85.0, require="Barato y sano", flush_rows=200, flush_secs=2.0, conn=None,
+                 only_changes=False, universe=None, rules=None, eval_rows=RULE_BATCH, members=None):
+        self.ivr_min = ivr_min
+        self.universe = universe
+        self.members = members or {}
+        self.require = require
+        self.rules = rules
+        self.eval_rows = eval_rows
+        self.only_changes = only_changes
+        self.flush_rows = flush_rows
+        self.flush_secs = flush_secs
+        self.conn = conn or alerts.connect()
+        self.buf = []
+        self.pending = []  # lotes candidatos todavía sin evaluar contra las reglas
+        self.peers = None  # peer_stats, al primer lote si alguna regla usa "Valor vs pares"
+        self.n_pending = 0
+        self.last_flush = time.time()
+        self.n_alerts = 0
+
+    def universes(self, tickers) -> list:
+        """Columna "Universo" de un lote: todos los universos de cada ticker."""
+        return [self.members.get(t, self.universe) for t in tickers]
+
+    def changed(self, df: pd.DataFrame) -> pd.Series:
+        """Filas candidatas con only_changes: cambió IVR / etiqueta o hay reglas nuevas que evaluar."""
+        m = df["Cambió"] if "Cambió" in df.columns else pd.Series(True, index=df.index)
+        return m | df["Reevaluar"] if "Reevaluar" in df.columns else m
+
+    def hits(self, df: pd.DataFrame) -> pd.DataFrame:
+        hit = df["IVR"] >= self.ivr_min
+        if self.require is not None:
+            hit &= df["Etiqueta"] == self.require
+        if self.only_changes:
+            hit &= self.changed(df)
+        return df.loc[hit]
+
+    def add(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        if self.rules is None:
+            ts = datetime.utcnow().isoformat()
+            h = self.hits(df)
+            self.buf.extend(
+                (r.Ticker, r.Empresa, float(r.IVR), r.Etiqueta, ts, u, None)
+                for r, u in zip(h[["Ticker", "Empresa", "IVR", "Etiqueta"]].itertuples(index=False),
+                                self.universes(h["Ticker"]))
+            )
+        else:
+            if self.only_changes:
+                df = df.loc[self.changed(df)]
+            if not df.empty:
+                self.pending.append(df)
+                self.n_pending += len(df)
+        if len(self.buf) >= self.flush_rows or self.n_pending >= self.eval_rows \
+                or time.time() - self.last_flush >= self.flush_secs:
+            self.flush()
+
+    def _evaluate(self) -> None:
+        """Las reglas sobre todos los candidatos acumulados (una pasada de máscaras por flush)."""
+        if not self.pending:
+            return
+        df = pd.concat(self.pending, ignore_index=True)
+        self.pending, self.n_pending = [], 0
+        with perf.timer("alerts.rules"):
+            if self.rules.needs_previous:
+                df = rules.with_previous(df, self.conn)
+            if self.rules.needs_peers:
+                self.peers = peer_stats.load() if self.peers is None else self.peers
+                df = rules.with_peers(df, self.peers)
+            if self.members and "Universo" not in df.columns:
+                df = df.assign(Universo=self.universes(df["Ticker"]))
+            hit, names = self.rules.evaluate(df, self.universe)
+        ts = datetime.utcnow().isoformat()
+        h = df.loc[hit, ["Ticker", "Empresa", "IVR", "Etiqueta"]]
+        self.buf.extend(
+            (r.Ticker, r.Empresa, float(r.IVR), r.Etiqueta, ts, u, name)
+            for r, name, u in zip(h.itertuples(index=False), names, self.universes(h["Ticker"]))
+        )
+
+    def flush(self) -> None:
+        self._evaluate()
+        alerts.upsert_many(self.conn, self.buf)
+        self.n_alerts += len(self.buf)
+        self.buf = []
+        self.last_flush = time.time()
+
+    def close(self) -> None:
+        self.flush()  # la conexión es compartida (db.get_conn): no se cierra acá
+
+# ======================== Run ========================
+async def run_scan(tickers, fetch, score, sink, taps=()) -> dict:
+    """Conecta las etapas. Devuelve contadores del escaneo (y el desglose por etapa en perf)."""
+    n, t0 = 0, time.time()
+    waited = time.perf_counter()
+    try:
+        async for batch in fetch(tickers):
+            perf.observe("scan.fetch_wait", time.perf_counter() - waited)  # esperando al fetch
+            if batch:
+                with perf.timer("scan.taps"):
+                    for tap in taps:
+                        tap.add(batch)
+                with perf.timer("scan.score"):
+                    scored = score(batch)
+                with perf.timer("scan.sink"):
+                    sink.add(scored)
+                n += len(batch)
+            waited = time.perf_counter()
+    finally:
+        with perf.timer("scan.close"):
+            sink.close()
+            for tap in taps:
+                tap.close()
+    return {"scored": n, "elapsed": round(time.time() - t0, 3)}
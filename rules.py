@@ -0,0 +1,453 @@
+# rules.py — reglas de alerta del escáner (tabla 'alert_rules' de screener.db). Cada regla
+# es una expresión sobre las columnas del lote puntuado:
+#   IVR >= 85 and Etiqueta == "Barato y sano"          (la regla por defecto)
+#   Sector == "Energy" and IVR >= 75 and PE < 12        (umbral por sector, combinando métricas)
+#   Ticker in ("AAPL", "MSFT") and IVR >= 70            (umbral por ticker)
+#   cruza_arriba(IVR, 90)                               (el IVR pasó de < 90 a >= 90 en este scan)
+#   Universo == "merval" and ROE > 0.2 and `P/B` < 1
+# Se compilan una vez por scan (ast -> funciones de numpy, sin eval) y se evalúan sobre el
+# lote entero con máscaras vectorizadas; las comparaciones repetidas entre reglas (ej. el
+# mismo `IVR >= 85`) se calculan una sola vez por lote.
+#   python rules.py list | add NOMBRE EXPR | rm ID | on ID | off ID | test EXPR
+import argparse, ast, operator
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import db
+import freshness
+import fundamentals
+import scoring
+
+# nombre en la expresión -> columna (cualquier columna también va entre `backticks`)
+ALIASES = {
+    "PE": "P/E", "PB": "P/B", "EV_EBITDA": "EV/EBITDA", "DE": "Debt/Equity",
+    "Score": "Score (0-100)", "Calidad": "Score Calidad", "Industria": "Industry",
+    "Valor_pares": "Valor vs pares",
+}
+COLUMNS = list(fundamentals.empty_metrics("")) + scoring.SCORE_COLS + ["Valor vs pares", "Universo"]
+# columnas con valor del scan anterior (de 'scan_state'): previo(), cruza_arriba(), cruza_abajo()
+PREV = {"IVR": "IVR previo", "Etiqueta": "Etiqueta previa"}
+
+_CMP = {
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Eq: operator.eq, ast.NotEq: operator.ne,
+}
+_ARITH = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
+
+class RuleError(ValueError):
+    pass
+
+# ======================== Compilación ========================
+GUARD_COLS = ("Ticker", "Sector", "Industry", "Universo")  # `col == x` / `col in (...)` al tope: índice
+# texto con varios valores separados por coma: `col == x` es "x es uno de ellos" (ver shards.split)
+MULTI_COLS = ("Universo",)
+
+
+class Coded:
+    """Columna de texto como códigos (array de cualquier forma, ej. (K, N)) + sus etiquetas."""
+
+    def __init__(self, codes: np.ndarray, labels: list):
+        self.codes = np.asarray(codes)
+        self.labels = list(labels)
+
+class _Batch:
+    """
+    Columnas de un lote ya convertidas (float64 / str), códigos de las de texto para
+    igualdades y resultados compartidos entre reglas (memo por subexpresión). `cols` agrega
+    o reemplaza columnas sin copiar `df`; pueden ser (K, N) (numéricas o Coded) y entonces
+    todo se evalúa por broadcasting contra las (N,) del lote.
+    """
+
+    def __init__(self, df: pd.DataFrame, universe: str = None, cols: dict = None):
+        self.df = df
+        self.n = len(df)
+        self.universe = universe
+        self.cols = cols or {}
+        self.memo = {}
+
+    def col(self, name: str):
+        key = ("col", name)
+        if key not in self.memo:
+            if name in self.cols:
+                v = self.cols[name]
+                if isinstance(v, Coded):
+                    v = np.asarray(v.labels, dtype=object)[v.codes]
+            elif name == "Universo" and name not in self.df.columns:
+                v = self.universe or ""
+            elif name not in self.df.columns:
+                v = np.full(self.n, np.nan)
+            elif pd.api.types.is_numeric_dtype(self.df[name]):
+                v = self.df[name].to_numpy(dtype="float64", na_value=np.nan)
+            else:
+                v = self.df[name].astype(object).fillna("").astype(str).to_numpy()
+            self.memo[key] = v
+        return self.memo[key]
+
+    def index(self, name: str) -> tuple:
+        """
+        Índice de una columna de texto, una vez por lote: ({valor: código}, filas ordenadas por
+        código, límites); las filas del código c son order[bounds[c]:bounds[c + 1]].
+        """
+        key = ("index", name)
+        if key not in self.memo:
+            v = self.col(name)
+            multi = name in MULTI_COLS
+            if isinstance(v, str):
+                keys = v.split(",") if multi else [v]
+                self.memo[key] = (dict.fromkeys(keys, 0), np.arange(self.n), np.array([0, self.n]))
+            else:
+                rows = np.arange(self.n)
+                if multi and any("," in x for x in v):  # una fila por valor: la fila queda en cada código
+                    parts = [x.split(",") for x in v]
+                    rows = np.repeat(rows, [len(p) for p in parts])
+                    v = np.array([x for p in parts for x in p], dtype=object)
+                codes, uniq = pd.factorize(v)
+                srt = np.argsort(codes, kind="stable")
+                bounds = np.searchsorted(codes[srt], np.arange(len(uniq) + 1))
+                self.memo[key] = (dict(zip(uniq, range(len(uniq)))), rows[srt], bounds)
+        return self.memo[key]
+
+    def isin(self, name: str, vals: list):
+        """Máscara de `name in vals`. En texto va por índice: False escalar si ningún valor está."""
+        c = self.cols.get(name)
+        if isinstance(c, Coded):
+            hit = [i for i, lab in enumerate(c.labels) if lab in vals]
+            return np.isin(c.codes, hit) if hit else False
+        v = self.col(name)
+        if isinstance(v, np.ndarray) and v.dtype.kind == "f":
+            return np.isin(v, [x for x in vals if isinstance(x, (int, float))])
+        codes, order, bounds = self.index(name)
+        hit = [codes[x] for x in vals if isinstance(x, str) and x in codes]
+        if not hit:
+            return False
+        m = np.zeros(self.n, dtype=bool)
+        for c in hit:
+            m[order[bounds[c]:bounds[c + 1]]] = True
+        return m
+
+def _column(node) -> str:
+    if isinstance(node, ast.Name):
+        name = ALIASES.get(node.id, node.id)
+    elif isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.startswith("\0"):
+        name = node.value[1:]  # `columna` (ver _parse)
+    else:
+        return None
+    if name not in COLUMNS and name not in PREV.values():
+        raise RuleError(f"columna desconocida: {name!r}")
+    return name
+
+def _const(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant) \
+            and isinstance(node.operand.value, (int, float)):
+        return -node.operand.value
+    return None
+
+def _consts(node) -> list:
+    """Lista de constantes de un `in (...)` / `== x`; None si no lo es."""
+    if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        vals = [_const(e) for e in node.elts]
+        return None if any(v is None for v in vals) else vals
+    c = _const(node)
+    return None if c is None else [c]
+
+def _compile(node):
+    """Nodo de ast -> (función(batch) -> array o escalar, clave para memo o None)."""
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(v)[0] for v in node.values]
+        conj = isinstance(node.op, ast.And)
+
+        def boolop(b):
+            out = None
+            for p in parts:
+                m = p(b)
+                out = m if out is None else (np.logical_and(out, m) if conj else np.logical_or(out, m))
+                if (not np.any(out)) if conj else np.all(out):  # ya no puede cambiar: cortar
+                    break
+            return out
+        return boolop, None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        f = _compile(node.operand)[0]
+        return (lambda b: np.logical_not(f(b))), None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        f = _compile(node.operand)[0]
+        return (lambda b: -f(b)), None
+    if isinstance(node, ast.Compare):
+        return _compare(node), None
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITH:
+        op, left, right = _ARITH[type(node.op)], _compile(node.left)[0], _compile(node.right)[0]
+
+        def arith(b):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return op(left(b), right(b))
+        return arith, None
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return _call(node), None
+    name = _column(node)
+    if name is not None:
+        return (lambda b: b.col(name)), ("col", name)
+    c = _const(node)
+    if c is not None:
+        return (lambda b: c), ("const", c)
+    raise RuleError(f"expresión no soportada: {ast.unparse(node)!r}")
+
+def _compare(node: ast.Compare):
+    """a < b <= c ... -> and de cada par; `x in (...)` con constantes. Memo por (izq, op, der)."""
+    steps, left = [], node.left
+    for op, right in zip(node.ops, node.comparators):
+        lf, lk = _compile(left)
+        name = _column(left)
+        vals = _consts(right)
+        if isinstance(op, (ast.In, ast.NotIn)) and vals is None:
+            raise RuleError(f"`in` necesita una lista de constantes: {ast.unparse(right)!r}")
+        if name is not None and vals is not None and isinstance(op, (ast.In, ast.NotIn, ast.Eq, ast.NotEq)):
+            neg = isinstance(op, (ast.NotIn, ast.NotEq))
+            fn = lambda b, name=name, vals=vals, neg=neg: np.logical_not(b.isin(name, vals)) if neg \
+                else b.isin(name, vals)
+            key = (lk, type(op).__name__, tuple(vals))
+        elif type(op) in _CMP:
+            rf, rk = _compile(right)
+            fn = lambda b, lf=lf, rf=rf, f=_CMP[type(op)]: f(lf(b), rf(b))
+            key = (lk, type(op).__name__, rk) if lk and rk else None
+        else:
+            raise RuleError(f"comparación no soportada: {ast.unparse(node)!r}")
+        steps.append((fn, key))
+        left = right
+
+    def cmp(b):
+        out = None
+        for fn, key in steps:
+            if key is None:
+                m = fn(b)
+            elif key in b.memo:
+                m = b.memo[key]
+            else:
+                m = b.memo[key] = fn(b)
+            out = m if out is None else np.logical_and(out, m)
+        return out
+    return cmp
+
+def _call(node: ast.Call):
+    fname = node.func.id
+    args = node.args
+    if fname == "abs" and len(args) == 1:
+        f = _compile(args[0])[0]
+        return lambda b: np.abs(f(b))
+    if fname in ("previo", "cruza_arriba", "cruza_abajo"):
+        name = _column(args[0]) if args else None
+        if name not in PREV:
+            raise RuleError(f"{fname}() sólo admite {', '.join(PREV)}")
+        prev = PREV[name]
+        if fname == "previo" and len(args) == 1:
+            return lambda b: b.col(prev)
+        level = _const(args[1]) if len(args) == 2 else None
+        if not isinstance(level, (int, float)):
+            raise RuleError(f"{fname}(columna, nivel) necesita un nivel numérico")
+        if fname == "cruza_arriba":  # sin valor previo (ticker nuevo) no hay cruce
+            return lambda b: (b.col(prev) < level) & (b.col(name) >= level)
+        return lambda b: (b.col(prev) >= level) & (b.col(name) < level)
+    raise RuleError(f"función desconocida: {fname}()")
+
+def _guard(node) -> tuple:
+    """(columna, valores) si la regla exige `col == x` / `col in (...)` de GUARD_COLS al tope; si no None."""
+    for c in node.values if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And) else [node]:
+        if isinstance(c, ast.Compare) and len(c.ops) == 1 and isinstance(c.ops[0], (ast.Eq, ast.In)):
+            name, vals = _column(c.left), _consts(c.comparators[0])
+            if name in GUARD_COLS and vals is not None:
+                return name, frozenset(vals)
+    return None
+
+def _parse(expr: str) -> ast.AST:
+    # `P/E` -> "\0P/E": una constante marcada que _column reconoce como nombre de columna
+    parts = expr.split("`")
+    if len(parts) % 2 == 0:
+        raise RuleError("backtick sin cerrar")
+    src = "".join(p if i % 2 == 0 else repr("\0" + p) for i, p in enumerate(parts))
+    try:
+        return ast.parse(src.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise RuleError(f"sintaxis inválida: {e.msg}") from None
+
+def compile_rule(expr: str):
+    """Expresión -> función(batch) -> máscara. RuleError si no es válida."""
+    return _compile(_parse(expr))[0]
+
+def uses_previous(expr: str) -> bool:
+    """Si la regla mira el scan anterior (previo(), cruza_*() o `IVR previo` / `Etiqueta previa`)."""
+    return any(s in expr for s in ("previo", "previa", "cruza_"))
+
+def uses_peers(expr: str) -> bool:
+    """Si la regla usa "Valor vs pares" (se calcula con peer_stats sólo si alguna regla lo pide)."""
+    return any(s in expr for s in ("Valor vs pares", "Valor_pares"))
+
+# ======================== Evaluación ========================
+class RuleSet:
+    """
+    Reglas compiladas (una vez por scan). evaluate() da, por fila, qué reglas dispararon.
+    Las reglas atadas a tickers / sectores / industrias / universos puntuales (ver _guard)
+    ni se evalúan en los lotes donde no aparece ninguno de sus valores.
+    """
+
+    def __init__(self, rules: list):
+        self.rules = []   # [(id, nombre, función, guarda)]
+        self.errors = {}  # id -> mensaje (reglas inválidas o que fallan con los datos: no disparan)
+        self.needs_previous = False
+        self.needs_peers = False
+        self.hash = freshness.rules_hash(rules)  # scan_state la guarda: reglas nuevas -> re-evaluar todo
+        for rid, name, expr in rules:
+            try:
+                tree = _parse(expr)
+                self.rules.append((rid, name, _compile(tree)[0], _guard(tree)))
+                self.needs_previous |= uses_previous(expr)
+                self.needs_peers |= uses_peers(expr)
+            except RuleError as e:
+                self.errors[rid] = str(e)
+        self.names = np.array([r[1] for r in self.rules], dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def masks(self, df: pd.DataFrame, universe: str = None) -> np.ndarray:
+        """Matriz bool (reglas x filas)."""
+        b = _Batch(df, universe)
+        out = np.zeros((len(self.rules), len(df)), dtype=bool)
+        for i, (rid, _, fn, guard) in enumerate(self.rules):
+            if guard is not None:
+                present = b.index(guard[0])[0]
+                if not any(v in present for v in guard[1]):
+                    continue
+            try:
+                m = fn(b)
+            except Exception as e:  # ej. comparar texto con número: la regla no dispara, el scan sigue
+                self.errors[rid] = f"{type(e).__name__}: {e}"
+                continue
+            if m is not False:
+                out[i] = m
+        return out
+
+    def mask(self, df: pd.DataFrame, universe: str = None, cols: dict = None) -> np.ndarray:
+        """
+        Sólo la máscara "alguna regla disparó", sin nombres. `cols` (ver _Batch) agrega columnas
+        sin copiar `df`; con columnas (K, N) devuelve (K, N): K variantes del lote de una pasada.
+        """
+        b = _Batch(df, universe, cols)
+        shapes = [np.shape(v.codes if isinstance(v, Coded) else v) for v in (cols or {}).values()]
+        out = np.zeros(np.broadcast_shapes((len(df),), *shapes), dtype=bool)
+        for rid, _, fn, guard in self.rules:
+            if guard is not None:
+                present = b.index(guard[0])[0]
+                if not any(v in present for v in guard[1]):
+                    continue
+            try:
+                m = fn(b)
+            except Exception as e:
+                self.errors[rid] = f"{type(e).__name__}: {e}"
+                continue
+            if m is not False:
+                out |= m
+            if out.all():
+                break
+        return out
+
+    def evaluate(self, df: pd.DataFrame, universe: str = None) -> tuple:
+        """(máscara de filas con alguna regla, nombres de las reglas que dispararon por fila con alerta)."""
+        if not self.rules or df.empty:
+            return np.zeros(len(df), dtype=bool), []
+        m = self.masks(df, universe)
+        hit = m.any(axis=0)
+        names = [", ".join(self.names[m[:, j]]) for j in np.flatnonzero(hit)]
+        return hit, names
+
+def with_previous(df: pd.DataFrame, conn=None) -> pd.DataFrame:
+    """Agrega IVR / Etiqueta del último scan incremental (de 'scan_state') si el lote no los trae."""
+    if all(c in df.columns for c in PREV.values()):
+        return df
+    conn = conn or db.get_conn()
+    tickers = list(dict.fromkeys(df["Ticker"]))
+    prev = {}
+    for i in range(0, len(tickers), 500):  # límite de variables de SQLite
+        chunk = tickers[i:i + 500]
+        prev.update((t, (ivr, et)) for t, ivr, et in conn.execute(
+            f"SELECT ticker, ivr, etiqueta FROM scan_state WHERE ticker IN ({','.join('?' * len(chunk))})", chunk))
+    old = [prev.get(t, (None, None)) for t in df["Ticker"]]
+    return df.assign(**{
+        PREV["IVR"]: np.array([np.nan if o[0] is None else o[0] for o in old], dtype="float64"),
+        PREV["Etiqueta"]: [o[1] or "" for o in old],
+    })
+
+def with_peers(df: pd.DataFrame, peers) -> pd.DataFrame:
+    """Agrega "Valor vs pares" (peer_stats.PeerStats.relative_value) si el lote no lo trae."""
+    if "Valor vs pares" in df.columns:
+        return df
+    return df.assign(**{"Valor vs pares": peers.relative_value(df) if peers else np.nan})
+
+# ======================== Tabla 'alert_rules' ========================
+RULE_COLS = ["id", "name", "expr", "enabled", "created_at"]
+
+def list_rules(conn=None) -> pd.DataFrame:
+    return pd.read_sql_query(f"SELECT {', '.join(RULE_COLS)} FROM alert_rules ORDER BY id", conn or db.get_conn())
+
+def add(name: str, expr: str, enabled: bool = True, conn=None) -> int:
+    """Valida y guarda. Devuelve el id. RuleError si la expresión no compila."""
+    compile_rule(expr)
+    conn = conn or db.get_conn()
+    with conn:
+        return conn.execute(
+            "INSERT INTO alert_rules (name, expr, enabled, created_at) VALUES (?,?,?,?)",
+            ((name or expr).strip(), expr.strip(), int(enabled), datetime.utcnow().isoformat()),
+        ).lastrowid
+
+def remove(ids, conn=None) -> int:
+    conn = conn or db.get_conn()
+    with conn:
+        return conn.executemany("DELETE FROM alert_rules WHERE id = ?", [(int(i),) for i in ids]).rowcount
+
+def set_enabled(ids, enabled: bool, conn=None) -> int:
+    conn = conn or db.get_conn()
+    with conn:
+        return conn.executemany("UPDATE alert_rules SET enabled = ? WHERE id = ?",
+                                [(int(enabled), int(i)) for i in ids]).rowcount
+
+def load(conn=None) -> RuleSet:
+    """Las reglas activas, compiladas."""
+    return RuleSet(freshness.active_rules(conn))
+
+# ======================== CLI ========================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Reglas de alerta del escáner")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="listar reglas")
+    a = sub.add_parser("add", help="agregar una regla")
+    a.add_argument("name")
+    a.add_argument("expr")
+    for cmd, help_ in (("rm", "borrar"), ("on", "activar"), ("off", "desactivar")):
+        sub.add_parser(cmd, help=f"{help_} reglas por id").add_argument("ids", type=int, nargs="+")
+    t = sub.add_parser("test", help="validar una expresión y ver qué tickers de la caché dispararía")
+    t.add_argument("expr")
+    args = ap.parse_args()
+    if args.cmd == "list":
+        print(list_rules().to_string(index=False))
+    elif args.cmd == "add":
+        print(f"Regla {add(args.name, args.expr)} agregada")
+    elif args.cmd == "rm":
+        print(f"{remove(args.ids)} borradas")
+    elif args.cmd in ("on", "off"):
+        print(f"{set_enabled(args.ids, args.cmd == 'on')} actualizadas")
+    else:
+        import statements
+        from settings import load_settings
+        rs = RuleSet([(0, "test", args.expr)])
+        if rs.errors:
+            raise SystemExit(f"Inválida: {rs.errors[0]}")
+        cached = fundamentals.load_cached([r[0] for r in db.get_conn().execute("SELECT ticker FROM fundamentals")])
+        df = statements.apply_ratios(pd.DataFrame([m for m, _ in cached.values()]))
+        df = with_previous(scoring.score_frame(df, **load_settings())) if len(df) else df
+        if rs.needs_peers and len(df):
+            import peer_stats
+            df = with_peers(df, peer_stats.load())
+        hit, _ = rs.evaluate(df)
+        print(f"{int(hit.sum())} de {len(df)} tickers en caché:", " ".join(sorted(df.loc[hit, "Ticker"])) if len(df) else "")
@@ -1,130 +1,227 @@
 # scan_universe.py  (ponerlo en C:\Users\paulo\OneDrive\Escritorio\Screener)
-import sqlite3, math
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import yfinance as yf
-
-from streamlit_autorefresh import st_autorefresh
-st_autorefresh(interval=1 * 60 * 1000, key="auto")  # 1 minuto
-DB_PATH = "screener.db"
-UNIVERSE_FILE = "universe_500.txt"
+# Escanea uno o varios universos (archivos de a un ticker por línea). Los universos se
+# parten en shards (shards.py) que toman los workers de un pool de procesos; se pueden
+# sumar workers desde otra terminal con --worker mientras la corrida está en curso.
+# Arranque liviano: antes de cargar pandas / yfinance se mira en screener.db (freshness.py)
+# si hay algo vencido; si no, la corrida termina ahí. El resto se importa al usarse.
+#   python scan_universe.py [--universe sp500=universe_500.txt --universe merval=merval.txt] [--workers 4]
+import argparse, os, time, traceback
+
+import freshness
+import perf
+import shards
+from settings import load_settings, settings_hash
 
-DEFAULTS = (13.0, 5.0, 14.0, 57, 44, 0.64, 0.36)  # pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual
-
-def load_settings():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""CREATE TABLE IF NOT EXISTS settings (
-        id INTEGER PRIMARY KEY CHECK (id=1),
-        pe_cap REAL, pb_cap REAL, eve_cap REAL, val_th INTEGER, qual_th INTEGER, w_val REAL, w_qual REAL
-    )""")
-    conn.commit()
-    cur.execute("SELECT pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual FROM settings WHERE id=1")
-    row = cur.fetchone()
-    conn.close()
-    return row if row else DEFAULTS
-
-def sub_inv(x, cap):
-    try:
-        if x is None or (isinstance(x,float) and math.isnan(x)): return float("nan")
-        return max(0.0, min(1.0, (cap - float(x))/cap))
-    except: return float("nan")
-
-def score_val(pe,pb,eve, caps):
-    pe_cap,pb_cap,eve_cap = caps
-    vals = [sub_inv(pe, pe_cap), sub_inv(pb, pb_cap), sub_inv(eve, eve_cap)]
-    vals = [v for v in vals if not (isinstance(v,float) and math.isnan(v))]
-    return float(sum(vals)/len(vals)*100) if vals else float("nan")
-
-def score_calidad_de(de_ratio):
-    if de_ratio is None or (isinstance(de_ratio,float) and math.isnan(de_ratio)): return float("nan")
-    try:
-        x = float(de_ratio)
-        if x <= 0: return 100.0
-        return max(0.0, min(100.0, (3.0 - x) * 50.0))
-    except: return float("nan")
-
-def fetch_one(t):
+UNIVERSE_FILE = "universe_500.txt"
+UNIVERSES = {"sp500": UNIVERSE_FILE}  # nombre -> archivo
+FETCH_DEADLINE = 5 * 60  # segundos: tope de wall-clock para bajar un shard
+STATEMENTS_DEADLINE = 2 * 60  # tope para estados contables; lo que quede sigue en el próximo scan
+
+# Las alertas salen de las reglas de 'alert_rules' (rules.py; por defecto IVR >= 85 y "Barato
+# y sano"). Este umbral sólo ordena la agenda de refresco: cerca de él se re-baja antes.
+ALERT_IVR_MIN = 85.0
+
+
+def load_universes(universes: dict = None) -> dict:
+    """{nombre: archivo} -> {nombre: [tickers]} (mayúsculas, sin vacíos)."""
+    out = {}
+    for name, path in (universes or UNIVERSES).items():
+        with open(path, "r", encoding="utf-8") as f:
+            out[name] = [ln.strip().upper() for ln in f if ln.strip()]
+    return out
+
+def parse_universes(specs: list) -> dict:
+    """['sp500=universe_500.txt', 'merval.txt'] -> {nombre: archivo} (sin nombre: el del archivo)."""
+    out = {}
+    for spec in specs or []:
+        name, _, path = spec.rpartition("=")
+        out[name or os.path.splitext(os.path.basename(path))[0]] = path
+    return out or None
+
+def scan_shard(tickers: list, universe: str, S: dict, full: bool = False, ruleset=None, members: dict = None) -> dict:
+    """
+    Un shard. Por defecto incremental: re-baja sólo lo vencido (antes si está cerca del
+    umbral), re-puntúa sólo si cambiaron inputs/ajustes/reglas y evalúa las reglas de alerta
+    sólo donde cambió IVR o etiqueta (en todo el shard si cambiaron las reglas).
+    full=True: todo se puntúa y se evalúa (clásico).
+    `ruleset`: reglas ya compiladas (rules.load(); por defecto se cargan acá).
+    `members`: {ticker: "u1,u2"} de los que también están en otros universos (shards.split).
+    """
+    import asyncio
+    import alerts, incremental, pipeline, rules, snapshots, statements  # pandas / yfinance: sólo si hay trabajo
+
+    ruleset = rules.load() if ruleset is None else ruleset
+
+    # estados trimestrales: sólo los tickers con balance nuevo esperado (pocos por día)
+    with perf.timer("scan.statements"):
+        stmt_rep = statements.refresh(tickers, deadline=STATEMENTS_DEADLINE)
+
+    # fetch → score → alertas en streaming (mismo modelo que el panel, por lote)
+    conn = alerts.connect()
+    if full:
+        # todo se puntúa y se evalúa, pero scan_state queda al día (IVR previo de las reglas de cruce)
+        fetch = pipeline.CachedYahooFetch(deadline=FETCH_DEADLINE)
+        score = incremental.IncrementalScorer(S, conn, rules_hash=ruleset.hash, full=True)
+        sink = pipeline.AlertSink(rules=ruleset, conn=conn, universe=universe, members=members)
+    else:
+        ttls = incremental.refresh_ttls(incremental.load_state(conn, tickers), ALERT_IVR_MIN)
+        fetch = pipeline.CachedYahooFetch(deadline=FETCH_DEADLINE, fund_ttl=ttls)
+        score = incremental.IncrementalScorer(S, conn, rules_hash=ruleset.hash)
+        sink = pipeline.AlertSink(rules=ruleset, conn=conn, only_changes=True, universe=universe,
+                                  members=members)
+    snap = snapshots.SnapshotWriter(S, compact=False)  # historial completo; compacta el coordinador
+    stats = asyncio.run(pipeline.run_scan(tickers, fetch, score, sink, taps=[snap]))
+
+    stats.update(
+        tickers=len(tickers),
+        alerts=sink.n_alerts,
+        fetch=fetch.report,
+        statements=stmt_rep,
+        delta=None if full else {"scored": score.n_scored, "changed": score.n_changed, "skipped": score.n_skipped},
+        rule_errors={str(k): v for k, v in ruleset.errors.items()},
+    )
+    return stats
+
+def work(run_id: str = None, full: bool = False) -> int:
+    """Worker: toma shards de la corrida (por defecto la última con pendientes) hasta vaciarla."""
+    run_id = run_id or shards.latest_run()
+    if run_id is None:
+        return 0
+    import rules
+
+    S = load_settings()
+    ruleset = rules.load()  # compiladas una vez por worker y corrida
+    n = 0
+    while (job := shards.claim(run_id)) is not None:
+        shard, universe, tickers, members = job
+        try:
+            shards.finish(run_id, shard, result=scan_shard(tickers, universe, S, full, ruleset, members))
+            n += 1
+        except Exception:
+            shards.finish(run_id, shard, error=traceback.format_exc(limit=5))
+    return n
+
+def worker(run_id: str = None, full: bool = False) -> int:
+    """work() en un proceso aparte (pool o --worker): guarda su desglose de tiempos con el run_id."""
+    run_id = run_id or shards.latest_run()
+    if run_id is None:
+        return 0
+    perf.reset()
     try:
-        tk = yf.Ticker(t)
-        info = {}
-        try: info = tk.info or {}
-        except: pass
-        name = info.get("longName") or info.get("shortName") or ""
-        pe = info.get("trailingPE")
-        pb = info.get("priceToBook")
-        eve = info.get("enterpriseToEbitda")
-        de = info.get("debtToEquity")
-        if isinstance(de,(int,float)) and de>10: de = de/100.0  # % -> veces
-        return t, name, pe, pb, eve, de
-    except:
-        return t, "", None, None, None, None
-
-def ensure_alert_tables():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""CREATE TABLE IF NOT EXISTS alerts (
-        ticker TEXT PRIMARY KEY,
-        empresa TEXT,
-        ivr REAL,
-        etiqueta TEXT,
-        ts TEXT
-    )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS alerts_log (
-        ticker TEXT,
-        empresa TEXT,
-        ivr REAL,
-        etiqueta TEXT,
-        ts TEXT
-    )""")
-    conn.commit(); conn.close()
-
-def upsert_alert(ticker, empresa, ivr, etiqueta):
-    ts = datetime.utcnow().isoformat()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""INSERT INTO alerts (ticker,empresa,ivr,etiqueta,ts)
-                   VALUES (?,?,?,?,?)
-                   ON CONFLICT(ticker) DO UPDATE SET
-                     empresa=excluded.empresa, ivr=excluded.ivr, etiqueta=excluded.etiqueta, ts=excluded.ts
-                """, (ticker,empresa,ivr,etiqueta,ts))
-    cur.execute("""INSERT INTO alerts_log (ticker,empresa,ivr,etiqueta,ts)
-                   VALUES (?,?,?,?,?)""", (ticker,empresa,ivr,etiqueta,ts))
-    conn.commit(); conn.close()
-
-def main():
-    pe_cap,pb_cap,eve_cap,val_th,qual_th,w_val,w_qual = load_settings()
-    ensure_alert_tables()
-
-    # Umbral de ALERTA (independiente del panel)
-    ALERT_IVR_MIN = 85.0
-    ALERT_REQUIRE = "Barato y sano"  # poné None si no lo querés exigir
-
-    with open(UNIVERSE_FILE, "r", encoding="utf-8") as f:
-        tickers = [ln.strip().upper() for ln in f if ln.strip()]
-
-    results = []
-    with ThreadPoolExecutor(max_workers=12) as ex:
-        for fu in as_completed([ex.submit(fetch_one, t) for t in tickers]):
-            results.append(fu.result())
-
-    for t,name,pe,pb,eve,de in results:
-        sv = score_val(pe,pb,eve, (pe_cap,pb_cap,eve_cap))
-        sc = score_calidad_de(de)
-        if isinstance(sv,float) and math.isnan(sv): 
-            continue
-        if sc is None or (isinstance(sc,float) and math.isnan(sc)): sc = 0.0
-        ivr = round(w_val*float(sv) + w_qual*float(sc), 2)
-
-        if sv >= val_th and sc >= qual_th:
-            etiqueta = "Barato y sano"
-        elif sv >= val_th:
-            etiqueta = "Barato pero frágil"
-        else:
-            etiqueta = "No barato"
-
-        if ivr >= ALERT_IVR_MIN and (ALERT_REQUIRE is None or etiqueta == ALERT_REQUIRE):
-            upsert_alert(t, name, ivr, etiqueta)
+        return work(run_id, full)
+    finally:
+        perf.save("scanner", run_id)
+
+# ======================== Resumen ========================
+def _sum(rows: list, key: str, fields) -> dict:
+    return {f: sum((r.get(key) or {}).get(f, 0) for r in rows) for f in fields}
+
+def _merge(results: list) -> dict:
+    """Suma los resúmenes de los shards terminados (misma forma que el de un scan único)."""
+    done = [r for _, state, r in results if state == "done"]
+    fetch = _sum(done, "fetch", ("requested", "batches", "retries", "throttled", "ok", "failed", "cached",
+                                      "known_failed"))
+    fetch["failed_symbols"] = sorted(s for r in done for s in r["fetch"].get("failed_symbols", []))
+    by_universe = {}
+    for u, _, r in results:
+        by_universe[u] = by_universe.get(u, 0) + r.get("tickers", 0)
+    return {
+        "scored": sum(r["scored"] for r in done),
+        "tickers": sum(r["tickers"] for r in done),
+        "alerts": sum(r["alerts"] for r in done),
+        "fetch": fetch,
+        "statements": _sum(done, "statements", ("requested", "ok", "failed")),
+        "delta": _sum(done, "delta", ("scored", "changed", "skipped")) if any(r.get("delta") for r in done) else None,
+        "shards": len(results),
+        "failed_shards": sum(state == "failed" for _, state, _ in results),
+        "universes": by_universe,
+        "rule_errors": {k: v for r in done for k, v in (r.get("rule_errors") or {}).items()},
+        "skipped": False,
+    }
+
+def scan(full: bool = False, universes: dict = None, workers: int = 1) -> dict:
+    """
+    Un escaneo de todos los universos: encola los shards y los reparte entre `workers`
+    procesos (con 1, en este mismo proceso). Devuelve el resumen sumado de los shards.
+    Incremental y sin nada vencido ni ajustes / reglas nuevas (freshness.pending en cero):
+    no encola nada y devuelve un resumen vacío con skipped=True.
+    """
+    t0 = time.time()
+    perf.reset()
+    unis = load_universes(universes)
+    if not full:
+        todo = freshness.pending([t for ts in unis.values() for t in ts], settings_hash(load_settings()),
+                                 ALERT_IVR_MIN, rules_hash=freshness.rules_hash(freshness.active_rules()))
+        if not any(todo.values()):
+            stats = _merge([])
+            stats.update(run_id=None, workers=workers, elapsed=round(time.time() - t0, 3), skipped=True,
+                         universes={u: len(ts) for u, ts in unis.items()})
+            return stats
+    import peer_stats, snapshots  # pandas: recién acá
+
+    run_id = shards.enqueue(unis)
+    if workers > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn: cada worker abre sus propias conexiones (nada heredado por fork)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as ex:
+            for fu in [ex.submit(worker, run_id, full) for _ in range(workers)]:
+                fu.result()
+    while True:
+        work(run_id, full)  # lo que haya vuelto a la cola (errores, workers caídos)
+        if not shards.pending(run_id):
+            break
+        if not shards.requeue_stale(run_id):  # workers externos (--worker) todavía en curso
+            time.sleep(5)
+    with perf.timer("scan.compact"):
+        snapshots.compact()
+    with perf.timer("scan.peer_stats"):  # distribuciones por sector/industria para el panel
+        peer_stats.refresh([t for ts in unis.values() for t in ts])
+    stats = _merge(shards.results(run_id))
+    stats.update(run_id=run_id, workers=workers, elapsed=round(time.time() - t0, 3))
+    perf.observe("scan.total", time.time() - t0)
+    perf.save("scanner", run_id)  # los workers del pool guardan lo suyo con el mismo run_id
+    return stats
+
+def main(full: bool = False, universes: dict = None, workers: int = 1):
+    stats = scan(full=full, universes=universes, workers=workers)
+    if stats["skipped"]:
+        n = sum(stats["universes"].values())
+        print(f"Scan: nada vencido en {n} tickers, sin cambios de ajustes ni reglas ({stats['elapsed']}s)")
+        return
+    rep = stats["fetch"]
+    print(
+        f"Scan: {stats['scored']} puntuados, {stats['alerts']} alertas en {stats['elapsed']}s "
+        f"({stats['shards']} shards, {workers} workers). "
+        f"Fetch: {rep['cached']} de caché, {rep['ok']} de Yahoo, {rep['failed']} fallidos "
+        f"({rep['retries']} reintentos, {rep['throttled']} throttling, "
+        f"{rep['known_failed']} sin resolver esperando reintento)"
+    )
+    print("Universos:", ", ".join(f"{u}={n}" for u, n in stats["universes"].items()))
+    if stats["statements"]["requested"]:
+        s = stats["statements"]
+        print(f"Estados contables: {s['ok']} actualizados, {s['failed']} fallidos")
+    if stats["delta"]:
+        d = stats["delta"]
+        print(f"Delta: {d['scored']} re-puntuados ({d['changed']} con cambios), {d['skipped']} sin cambios")
+    _, snap = perf.last("scanner")
+    print("Tiempos:", ", ".join(f"{r['name']} {r['total']:.2f}s" for r in perf.rows(snap)[:6]))
+    for rid, err in stats["rule_errors"].items():
+        print(f"Regla {rid} ignorada: {err}")
+    if stats["failed_shards"]:
+        print(f"Shards fallidos: {stats['failed_shards']} (ver scan_queue, corrida {stats['run_id']})")
+    if rep["failed"]:
+        print("Fallidos:", " ".join(rep["failed_symbols"]))
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Escanea universos y registra alertas en screener.db")
+    ap.add_argument("--full", action="store_true", help="re-puntuar todo y loguear toda alerta (sin delta)")
+    ap.add_argument("--universe", action="append", metavar="NOMBRE=ARCHIVO", help="universo a escanear (repetible)")
+    ap.add_argument("--workers", type=int, default=1, help="procesos en paralelo")
+    ap.add_argument("--worker", action="store_true", help="sólo sumarse como worker a la corrida en curso")
+    args = ap.parse_args()
+    if args.worker:
+        print(f"Shards escaneados: {worker(full=args.full)}")
+    else:
+        main(full=args.full, universes=parse_universes(args.universe), workers=args.workers)
@@ -0,0 +1,179 @@
+# scanner_service.py — escáner como servicio de larga vida (reemplaza al st_autorefresh
+# y al cold start de Python/yfinance/pandas en cada corrida programada).
+# Corre scan_universe.scan() con una cadencia para horario de mercado y otra fuera de él,
+# no solapa corridas, corta limpio con Ctrl+C / SIGTERM y publica su estado en la
+# tabla 'scanner_status' de screener.db. Una vez por día compacta alerts_log (retención).
+#   python scanner_service.py [--market-every 60] [--off-every 900] [--full] [--keep-days 30]
+#                             [--universe sp500=universe_500.txt ...] [--workers 4] [--prom scanner.prom]
+import argparse, os, signal, threading, time, traceback
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import alerts
+import db
+import perf
+import scan_universe
+
+LOCK_PATH = "screener.scan.lock"
+LOCK_STALE = 30 * 60  # segundos: un lock más viejo que esto se considera abandonado
+
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+
+MARKET_EVERY = 60       # segundos entre scans con el mercado abierto
+OFF_EVERY = 15 * 60     # segundos entre scans con el mercado cerrado
+COMPACT_EVERY = 24 * 60 * 60  # segundos entre compactaciones de alerts_log
+
+
+def market_open(now: datetime = None) -> bool:
+    """NYSE abierto (lunes a viernes, 9:30–16:00 hora de Nueva York; no contempla feriados)."""
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    if now.weekday() >= 5:
+        return False
+    hm = (now.hour, now.minute)
+    return MARKET_OPEN <= hm < MARKET_CLOSE
+
+# ======================== Estado ========================
+def update_status(**fields) -> None:
+    conn = db.get_conn()
+    sets = ", ".join(f"{k}=?" for k in fields)
+    with conn:
+        conn.execute(f"UPDATE scanner_status SET {sets} WHERE id = 1", list(fields.values()))
+
+def read_status() -> dict:
+    cur = db.get_conn().execute("SELECT * FROM scanner_status WHERE id = 1")
+    row = cur.fetchone()
+    cols = [d[0] for d in cur.description]
+    return dict(zip(cols, row))
+
+# ======================== Lock entre procesos ========================
+def acquire_lock() -> bool:
+    """Lock por archivo (O_EXCL, sirve también en Windows) para no solapar con otra corrida."""
+    try:
+        if time.time() - os.path.getmtime(LOCK_PATH) > LOCK_STALE:
+            os.remove(LOCK_PATH)
+    except OSError:
+        pass
+    try:
+        fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(str(os.getpid()))
+    return True
+
+def release_lock() -> None:
+    try:
+        os.remove(LOCK_PATH)
+    except OSError:
+        pass
+
+# ======================== Servicio ========================
+def run_once(full: bool = False, universes: dict = None, workers: int = 1) -> bool:
+    """
+    Un scan con lock y registro de estado. False si se salteó porque había otro corriendo.
+    Las corridas sin nada vencido (stats["skipped"]) suman a `skipped` y a `last_checked`, y
+    no pisan las métricas de la última corrida real.
+    """
+    if not acquire_lock():
+        st = read_status()
+        update_status(skipped=(st["skipped"] or 0) + 1)
+        return False
+    t0 = time.time()
+    update_status(state="running", pid=os.getpid(), last_started=datetime.utcnow().isoformat())
+    changed = True
+    try:
+        stats = scan_universe.scan(full=full, universes=universes, workers=workers)
+        changed = not stats["skipped"]  # nada vencido: el panel no tiene nada nuevo que recargar
+        st = read_status()
+        if not changed:
+            update_status(state="idle", skipped=(st["skipped"] or 0) + 1,
+                          last_checked=datetime.utcnow().isoformat())
+            return True
+        dur = time.time() - t0
+        rep = stats["fetch"]
+        update_status(
+            state="idle",
+            runs=(st["runs"] or 0) + 1,
+            last_finished=datetime.utcnow().isoformat(),
+            last_duration=round(dur, 3),
+            last_tickers=stats["tickers"],
+            tickers_per_sec=round(stats["tickers"] / dur, 2) if dur > 0 else None,
+            last_fetched=rep["ok"],
+            last_failed=rep["failed"],
+            last_throttled=rep["throttled"],
+            last_alerts=stats["alerts"],
+            last_error=None,
+            last_checked=datetime.utcnow().isoformat(),
+        )
+    except Exception:
+        st = read_status()
+        update_status(
+            state="idle",
+            errors=(st["errors"] or 0) + 1,
+            last_finished=datetime.utcnow().isoformat(),
+            last_duration=round(time.time() - t0, 3),
+            last_error=traceback.format_exc(limit=5),
+        )
+    finally:
+        release_lock()
+        if changed:
+            alerts.publish_scan()  # el panel ve el estado nuevo en su próximo chequeo de versión
+    return True
+
+def serve(market_every: int = MARKET_EVERY, off_every: int = OFF_EVERY, full: bool = False,
+          stop: threading.Event = None, keep_days: float = alerts.RETENTION_DAYS,
+          universes: dict = None, workers: int = 1, prom: str = None) -> None:
+    """
+    Loop principal. La cadencia se mide de inicio a inicio; si un scan dura más que el
+    intervalo, los ticks perdidos se saltean (no se encolan ni se solapan). La compactación
+    de alerts_log corre entre scans, en tandas chicas (no frena al panel). Con `prom`, el
+    desglose de tiempos del último scan se escribe ahí en formato Prometheus.
+    """
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    update_status(state="idle", pid=os.getpid())
+    next_at = time.time()
+    compacted_at = 0.0
+    while not stop.is_set():
+        wait = next_at - time.time()
+        if wait > 0:
+            stop.wait(wait)
+            continue
+        started = time.time()
+        if not run_once(full=full, universes=universes, workers=workers):
+            print("Scan salteado: hay otra corrida en curso.")
+        elif prom:
+            try:
+                perf.write_prometheus(prom, perf.last("scanner")[1], "scanner")
+            except Exception:
+                traceback.print_exc()
+        if time.time() - compacted_at >= COMPACT_EVERY:
+            try:
+                alerts.compact_log(keep_days)
+            except Exception:
+                traceback.print_exc()
+            compacted_at = time.time()
+        every = market_every if market_open() else off_every
+        next_at = started + every
+        while next_at <= time.time():  # ticks perdidos
+            next_at += every
+        update_status(next_run=datetime.utcfromtimestamp(next_at).isoformat())
+    update_status(state="stopped", next_run=None)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Escáner de universo como servicio")
+    ap.add_argument("--market-every", type=int, default=MARKET_EVERY, help="segundos entre scans con mercado abierto")
+    ap.add_argument("--off-every", type=int, default=OFF_EVERY, help="segundos entre scans con mercado cerrado")
+    ap.add_argument("--full", action="store_true", help="scans completos (sin delta)")
+    ap.add_argument("--keep-days", type=float, default=alerts.RETENTION_DAYS, help="días de detalle en alerts_log")
+    ap.add_argument("--universe", action="append", metavar="NOMBRE=ARCHIVO", help="universo a escanear (repetible)")
+    ap.add_argument("--workers", type=int, default=1, help="procesos en paralelo por scan")
+    ap.add_argument("--prom", metavar="ARCHIVO", help="escribir métricas del último scan en formato Prometheus")
+    args = ap.parse_args()
+    serve(args.market_every, args.off_every, full=args.full, keep_days=args.keep_days,
+          universes=scan_universe.parse_universes(args.universe), workers=args.workers, prom=args.prom)
@@ -0,0 +1,148 @@
+# scoring.py — modelo de score vectorizado (columnas enteras con NumPy, sin df.apply).
+# Valor: bancos P/B (x2) + P/E (x1); resto P/E + P/B + EV/EBITDA. Calidad: ROE (bancos) o D/E.
+import numpy as np
+import pandas as pd
+
+FIN_KEYS = ["financial", "bank", "insurance", "capital markets", "diversified financial"]
+_FIN_PATTERN = "|".join(FIN_KEYS)
+
+LABELS = ["Barato y sano", "Barato pero frágil", "Caro pero sano", "Caro y frágil", "Neutral"]
+SIN_DATOS = "Sin datos"
+ETIQUETAS = [SIN_DATOS] + LABELS  # índice = código de etiqueta_codes
+
+SCORE_COLS = ["Score (0-100)", "Score Calidad", "Calidad por", "Etiqueta", "Señal", "IVR"]
+
+
+def caro_threshold(val_th):
+    """Umbral 'Caro' simétrico al de Valor (acotado 10..90). Acepta escalar o array."""
+    c = np.clip(100 - np.asarray(val_th, dtype="float64"), 10, 90)
+    return float(c) if c.ndim == 0 else c
+
+def _num(s) -> np.ndarray:
+    return pd.to_numeric(pd.Series(s), errors="coerce").to_numpy(dtype="float64")
+
+def _text(s) -> pd.Series:
+    return pd.Series(s, dtype="object").fillna("").astype(str).str.lower()
+
+def fin_key(sector, industry) -> pd.Series:
+    """Clave "sector|industry" (minúsculas) de la tabla precomputada de financieras."""
+    return _text(sector).reset_index(drop=True) + "|" + _text(industry).reset_index(drop=True)
+
+def is_financial(sector, industry, fin_map: dict = None) -> np.ndarray:
+    """
+    True si Sector o Industry contienen alguna palabra clave de financieras. Con `fin_map`
+    ({fin_key: bool}, ver peer_stats.py) es un lookup; sólo lo que no está en el mapa se busca
+    por palabras clave.
+    """
+    if fin_map:
+        hit = fin_key(sector, industry).map(fin_map)
+        miss = hit.isna().to_numpy()
+        out = hit.fillna(False).to_numpy(dtype=bool)
+        if miss.any():
+            s, i = pd.Series(sector).reset_index(drop=True), pd.Series(industry).reset_index(drop=True)
+            out[miss] = is_financial(s[miss], i[miss])
+        return out
+    s = _text(sector).str.contains(_FIN_PATTERN, regex=True).to_numpy()
+    i = _text(industry).str.contains(_FIN_PATTERN, regex=True).to_numpy()
+    return s | i
+
+def subscore_inverse(x: np.ndarray, cap: float) -> np.ndarray:
+    """Mayor puntaje cuando el múltiplo es bajo. Escala 0..1 con cap simple (NaN se conserva)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.clip((cap - x) / cap, 0.0, 1.0)
+
+def score_valor(pe, pb, eve, fin, pe_cap, pb_cap, eve_cap) -> np.ndarray:
+    """
+    Promedio ponderado de subscores ignorando NaN, x100.
+    No financieras: P/E, P/B, EV/EBITDA (1:1:1). Financieras: P/B x2, P/E x1, sin EV/EBITDA.
+    Los caps pueden ser arrays (K, 1) para puntuar K combinaciones de ajustes a la vez → (K, N).
+    """
+    fin = np.asarray(fin, dtype=bool)
+    num = np.zeros(fin.shape)
+    den = np.zeros(fin.shape)
+    for x, cap, w in (
+        (pe, pe_cap, 1.0),
+        (pb, pb_cap, np.where(fin, 2.0, 1.0)),
+        (eve, eve_cap, np.where(fin, 0.0, 1.0)),
+    ):
+        sub = subscore_inverse(_num(x), cap)
+        have = ~np.isnan(sub)
+        num = num + w * np.where(have, sub, 0.0)
+        den = den + w * have
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, num / den * 100.0, np.nan)
+
+def score_calidad_de(de) -> np.ndarray:
+    """Calidad por D/E: menor deuda mejor. D/E<=0→100; 2→50; 3→0."""
+    return np.clip((3.0 - _num(de)) * 50.0, 0.0, 100.0)
+
+def score_calidad_roe(roe) -> np.ndarray:
+    """Calidad por ROE (para bancos): 5%→0; 10%→50; 15%→100 (cap 0..100)."""
+    r = _num(roe)
+    r = np.where(r > 1.0, r / 100.0, r)  # por si viniera en %
+    return np.clip((r - 0.05) / 0.10 * 100.0, 0.0, 100.0)
+
+def score_calidad(de, roe, fin) -> tuple:
+    """Devuelve (score de calidad, métrica usada): ROE para bancos, D/E para resto."""
+    fin = np.asarray(fin, dtype=bool)
+    sc = np.where(fin, score_calidad_roe(roe), score_calidad_de(de))
+    metric = np.where(fin, "ROE", "D/E").astype(object)
+    return sc, metric
+
+def etiqueta_codes(sv, sc, val_th, qual_th, caro_th) -> np.ndarray:
+    """Como etiqueta() pero devuelve códigos int8 (índices de ETIQUETAS); umbrales escalares o (K, 1)."""
+    sv = np.asarray(sv, dtype="float64")
+    sc = np.asarray(sc, dtype="float64")
+    sano = ~np.isnan(sc) & (sc >= qual_th)
+    barato = sv >= val_th
+    caro = sv <= caro_th
+    return np.select(
+        [np.isnan(sv), barato & sano, barato, caro & sano, caro],
+        [0, 1, 2, 3, 4],
+        default=5,
+    ).astype("int8")
+
+def etiqueta(sv, sc, val_th: float, qual_th: float, caro_th: float) -> np.ndarray:
+    """Etiqueta con bandas: Barato / Neutral / Caro (y "sano"/"frágil" según Calidad)."""
+    return np.array(ETIQUETAS, dtype=object)[etiqueta_codes(sv, sc, val_th, qual_th, caro_th)]
+
+def senal(labels) -> np.ndarray:
+    """Señal operativa mínima a partir de la Etiqueta."""
+    lab = pd.Series(labels, dtype="object").fillna("")
+    out = np.where(lab.str.startswith("Barato"), "Comprar",
+                   np.where(lab.str.startswith("Caro"), "Vender", "Mantener"))
+    return out.astype(object)
+
+def ivr(sv, sc, w_val: float, w_qual: float) -> np.ndarray:
+    """IVR con pesos configurables; si falta calidad, tomamos 0 (conservador)."""
+    sv = np.asarray(sv, dtype="float64")
+    sc = np.nan_to_num(np.asarray(sc, dtype="float64"), nan=0.0)
+    return np.round(w_val * sv + w_qual * sc, 2)
+
+def score_frame(df: pd.DataFrame, pe_cap: float, pb_cap: float, eve_cap: float,
+                val_th: float, qual_th: float, w_val: float, w_qual: float,
+                caro_th: float = None, fin_map: dict = None) -> pd.DataFrame:
+    """
+    Agrega a una copia de `df` (columnas del panel: Sector, Industry, P/E, P/B, EV/EBITDA,
+    Debt/Equity, ROE) las columnas de SCORE_COLS, todo en una pasada vectorizada.
+    `fin_map`: clasificación precomputada de financieras (ver is_financial).
+    """
+    out = df.copy()
+    n = len(out)
+    col = lambda c, fill: out[c] if c in out.columns else pd.Series([fill] * n, index=out.index)
+    if caro_th is None:
+        caro_th = caro_threshold(val_th)
+
+    fin = is_financial(col("Sector", ""), col("Industry", ""), fin_map)
+    sv = score_valor(col("P/E", np.nan), col("P/B", np.nan), col("EV/EBITDA", np.nan),
+                     fin, pe_cap, pb_cap, eve_cap)
+    sc, metric = score_calidad(col("Debt/Equity", np.nan), col("ROE", np.nan), fin)
+    lab = etiqueta(sv, sc, val_th, qual_th, caro_th)
+
+    out["Score (0-100)"] = sv
+    out["Score Calidad"] = sc
+    out["Calidad por"] = metric
+    out["Etiqueta"] = lab
+    out["Señal"] = senal(lab)
+    out["IVR"] = ivr(sv, sc, w_val, w_qual)
+    return out
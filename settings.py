@@ -0,0 +1,54 @@
+# settings.py — único loader de ajustes del modelo (tabla 'settings' en screener.db),
+# usado por app.py y por scan_universe.py para que panel y escáner puntúen igual.
+import hashlib, json
+
+import db
+
+# Defaults (si no hay settings guardados aún)
+DEFAULTS = {
+    "pe_cap": 25.0,
+    "pb_cap": 5.0,
+    "eve_cap": 15.0,
+    "val_th": 70,   # umbral Valor para etiqueta
+    "qual_th": 50,  # umbral Calidad para etiqueta
+    "w_val": 0.7,   # peso Valor en IVR
+    "w_qual": 0.3,  # peso Calidad en IVR
+}
+KEYS = list(DEFAULTS)
+
+
+def _typed(s: dict) -> dict:
+    out = {k: float(s[k]) for k in ("pe_cap", "pb_cap", "eve_cap", "w_val", "w_qual")}
+    out.update({k: int(s[k]) for k in ("val_th", "qual_th")})
+    return {k: out[k] for k in KEYS}
+
+def load_settings() -> dict:
+    """Ajustes guardados como dict tipado (mismas claves que DEFAULTS); los siembra si no hay."""
+    conn = db.get_conn()
+    row = conn.execute(f"SELECT {', '.join(KEYS)} FROM settings WHERE id = 1").fetchone()
+    if row is None:
+        with conn:
+            conn.execute(
+                f"INSERT OR IGNORE INTO settings (id, {', '.join(KEYS)}) VALUES (1, {','.join('?' * len(KEYS))})",
+                [DEFAULTS[k] for k in KEYS],
+            )
+        return dict(DEFAULTS)
+    return _typed(dict(zip(KEYS, row)))
+
+def save_settings(pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual) -> None:
+    conn = db.get_conn()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO settings (id, pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual)
+            VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+              pe_cap=excluded.pe_cap, pb_cap=excluded.pb_cap, eve_cap=excluded.eve_cap,
+              val_th=excluded.val_th, qual_th=excluded.qual_th, w_val=excluded.w_val, w_qual=excluded.w_qual
+            """,
+            (pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual),
+        )
+
+def settings_hash(S: dict) -> str:
+    """Huella corta de los ajustes: cambia sólo si cambia algún valor que afecta el score."""
+    return hashlib.sha1(json.dumps(_typed(S), sort_keys=True).encode()).hexdigest()[:16]
@@ -0,0 +1,123 @@
+# shards.py — cola de trabajo compartida para escanear varios universos en paralelo
+# (tabla 'scan_queue' de screener.db). Un coordinador parte los universos en shards y cada
+# worker (proceso del pool o `python scan_universe.py --worker` en otra terminal) reclama
+# el próximo shard pendiente con BEGIN IMMEDIATE, lo escanea y deja su resumen.
+import json, os, socket, time, uuid
+
+import db
+
+SHARD_SIZE = 250           # tickers por shard
+SHARD_STALE = 15 * 60      # segundos: un shard 'running' sin terminar se devuelve a la cola
+MAX_ATTEMPTS = 3           # intentos por shard antes de darlo por fallido
+KEEP_SECS = 7 * 24 * 60 * 60  # historial de corridas terminadas
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def memberships(universes: dict) -> dict:
+    """{ticker: "u1,u2"} de los tickers que están en más de un universo (en el orden de `universes`)."""
+    tags = {}
+    for name, tickers in universes.items():
+        for t in dict.fromkeys(tickers):
+            tags.setdefault(t, []).append(name)
+    return {t: ",".join(names) for t, names in tags.items() if len(names) > 1}
+
+def split(universes: dict, shard_size: int = SHARD_SIZE) -> list:
+    """
+    {universo: [tickers]} -> [(universo, [tickers], {ticker: "u1,u2"}), ...]. Un ticker que
+    está en varios universos se escanea una sola vez, en el shard del primero que lo lista,
+    y lleva todos sus universos (columna "Universo" de las reglas y de las alertas).
+    """
+    multi = memberships(universes)
+    seen, out = set(), []
+    for name, tickers in universes.items():
+        own = [t for t in dict.fromkeys(tickers) if t not in seen]
+        seen.update(own)
+        for i in range(0, len(own), shard_size):
+            chunk = own[i:i + shard_size]
+            out.append((name, chunk, {t: multi[t] for t in chunk if t in multi}))
+    return out
+
+def enqueue(universes: dict, shard_size: int = SHARD_SIZE) -> str:
+    """Encola una corrida nueva. Devuelve su run_id."""
+    run_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    now = time.time()
+    rows = [(run_id, i, name, json.dumps(tks), json.dumps(members))
+            for i, (name, tks, members) in enumerate(split(universes, shard_size))]
+    conn = db.get_conn()
+    with conn:
+        conn.execute("DELETE FROM scan_queue WHERE state IN ('done', 'failed') AND finished_at < ?", (now - KEEP_SECS,))
+        conn.executemany(
+            """INSERT INTO scan_queue (run_id, shard, universe, tickers, members, state, attempts)
+               VALUES (?,?,?,?,?,'pending',0)""",
+            rows,
+        )
+    return run_id
+
+def latest_run() -> str:
+    """run_id más nuevo con shards pendientes (para workers que se suman desde afuera)."""
+    row = db.get_conn().execute(
+        "SELECT run_id FROM scan_queue WHERE state = 'pending' ORDER BY run_id DESC LIMIT 1"
+    ).fetchone()
+    return row[0] if row else None
+
+def claim(run_id: str) -> tuple:
+    """Reclama el próximo shard pendiente: (shard, universo, tickers, {ticker: "u1,u2"}) o None."""
+    conn = db.get_conn()
+    conn.execute("BEGIN IMMEDIATE")  # dos workers no pueden tomar el mismo shard
+    try:
+        row = conn.execute(
+            """SELECT shard, universe, tickers, members FROM scan_queue
+               WHERE run_id = ? AND state = 'pending' ORDER BY shard LIMIT 1""",
+            (run_id,),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                """UPDATE scan_queue SET state = 'running', worker = ?, claimed_at = ?, attempts = attempts + 1
+                   WHERE run_id = ? AND shard = ?""",
+                (worker_id(), time.time(), run_id, row[0]),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return None if row is None else (row[0], row[1], json.loads(row[2]), json.loads(row[3] or "{}"))
+
+def finish(run_id: str, shard: int, result: dict = None, error: str = None) -> None:
+    """Cierra un shard: 'done' con su resumen, o de vuelta a la cola / 'failed' si hubo error."""
+    conn = db.get_conn()
+    with conn:
+        if error is None:
+            conn.execute(
+                "UPDATE scan_queue SET state = 'done', finished_at = ?, result = ? WHERE run_id = ? AND shard = ?",
+                (time.time(), json.dumps(result), run_id, shard),
+            )
+        else:
+            conn.execute(
+                """UPDATE scan_queue SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                     finished_at = ?, result = ? WHERE run_id = ? AND shard = ?""",
+                (MAX_ATTEMPTS, time.time(), json.dumps({"error": error}), run_id, shard),
+            )
+
+def requeue_stale(run_id: str) -> int:
+    """Devuelve a la cola los shards 'running' de workers que murieron (claimed_at viejo)."""
+    conn = db.get_conn()
+    with conn:
+        return conn.execute(
+            """UPDATE scan_queue SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END
+               WHERE run_id = ? AND state = 'running' AND claimed_at < ?""",
+            (MAX_ATTEMPTS, run_id, time.time() - SHARD_STALE),
+        ).rowcount
+
+def pending(run_id: str) -> int:
+    return db.get_conn().execute(
+        "SELECT count(*) FROM scan_queue WHERE run_id = ? AND state IN ('pending', 'running')", (run_id,)
+    ).fetchone()[0]
+
+def results(run_id: str) -> list:
+    """[(universo, estado, resumen dict), ...] de todos los shards de la corrida."""
+    rows = db.get_conn().execute(
+        "SELECT universe, state, result FROM scan_queue WHERE run_id = ? ORDER BY shard", (run_id,)
+    ).fetchall()
+    return [(u, s, json.loads(r) if r else {}) for u, s, r in rows]
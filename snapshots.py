@@ -0,0 +1,175 @@
+# snapshots.py — historial de scans en Parquet particionado por fecha (snapshots/date=AAAA-MM-DD/).
+# Cada scan agrega un archivo chico con todas las métricas y scores (float32 + categóricas);
+# los días anteriores se compactan en un solo archivo ordenado por ticker/ts en el que sólo
+# quedan las filas que cambiaron respecto del scan anterior del mismo ticker (cada fila
+# vale hasta la siguiente). Las lecturas proyectan columnas, filtran por partición y usan
+# memory-map.
+import glob, os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+import scoring
+
+SNAPSHOT_DIR = "snapshots"
+
+FLOAT_COLS = ["Precio", "P/E", "P/B", "EV/EBITDA", "Debt/Equity", "ROE", "Score (0-100)", "Score Calidad", "IVR"]
+CAT_COLS = ["Sector", "Industry", "Etiqueta"]
+
+SCHEMA = pa.schema(
+    [("ts", pa.timestamp("s", tz="UTC")), ("ticker", pa.dictionary(pa.int32(), pa.string()))]
+    + [(c, pa.float32()) for c in FLOAT_COLS]
+    + [(c, pa.dictionary(pa.int32(), pa.string())) for c in CAT_COLS]
+)
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def _to_table(df: pd.DataFrame, ts: datetime) -> pa.Table:
+    n = len(df)
+    cols = {"ts": pa.array([ts] * n, type=SCHEMA.field("ts").type),
+            "ticker": pa.array(df["Ticker"].astype(str).tolist()).dictionary_encode()}
+    for c in FLOAT_COLS:
+        v = pd.to_numeric(df[c], errors="coerce") if c in df.columns else pd.Series([float("nan")] * n)
+        cols[c] = pa.array(v.to_numpy(dtype="float32"), type=pa.float32(), from_pandas=True)
+    for c in CAT_COLS:
+        v = df[c].fillna("").astype(str) if c in df.columns else pd.Series([""] * n)
+        cols[c] = pa.array(v.tolist(), type=pa.string()).dictionary_encode()
+    return pa.table(cols, schema=SCHEMA)
+
+def write_snapshot(df: pd.DataFrame, ts: datetime = None, root: str = SNAPSHOT_DIR) -> str:
+    """Agrega un snapshot (filas = tickers, columnas del panel ya puntuadas). Devuelve la ruta."""
+    ts = (ts or datetime.now(timezone.utc)).replace(microsecond=0)
+    return _write(_to_table(df, ts), ts, root)
+
+def _write(tbl: pa.Table, ts: datetime, root: str) -> str:
+    part = os.path.join(root, f"date={ts:%Y-%m-%d}")
+    os.makedirs(part, exist_ok=True)
+    # pid + contador: shards de la misma corrida que terminan en el mismo segundo (en otro
+    # proceso o en el mismo) no se pisan
+    path = os.path.join(part, f"scan-{ts:%H%M%S}-{os.getpid()}.parquet")
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(part, f"scan-{ts:%H%M%S}-{os.getpid()}-{n}.parquet")
+        n += 1
+    pq.write_table(tbl, path, compression="zstd")
+    return path
+
+def _changed(tbl: pa.Table) -> np.ndarray:
+    """Máscara de filas distintas a la anterior (tabla ordenada por ticker, ts)."""
+    n = tbl.num_rows
+    same = np.ones(max(n - 1, 0), dtype=bool)
+    for c in ["ticker"] + FLOAT_COLS + CAT_COLS:
+        col = tbl[c]
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(pa.string())
+        v = col.to_numpy(zero_copy_only=False)
+        eq = v[1:] == v[:-1]
+        if c in FLOAT_COLS:
+            eq |= np.isnan(v[1:]) & np.isnan(v[:-1])
+        same &= eq
+    keep = np.ones(n, dtype=bool)
+    keep[1:] = ~same
+    return keep
+
+def compact_day(part: str) -> None:
+    """
+    Junta los scan-*.parquet de una partición en day.parquet: ordenado por ticker, ts y
+    sin las filas idénticas a la anterior del mismo ticker.
+    """
+    files = sorted(glob.glob(os.path.join(part, "scan-*.parquet")))
+    if not files:
+        return
+    day = os.path.join(part, "day.parquet")
+    tables = [pq.read_table(f, schema=SCHEMA) for f in files]
+    if os.path.exists(day):
+        tables.insert(0, pq.read_table(day, schema=SCHEMA))
+    tbl = pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+    keys = pa.table({"ticker": tbl["ticker"].cast(pa.string()), "ts": tbl["ts"]})
+    tbl = tbl.take(pc.sort_indices(keys, sort_keys=[("ticker", "ascending"), ("ts", "ascending")]))
+    tbl = tbl.filter(pa.array(_changed(tbl)))
+    tmp = day + ".tmp"
+    pq.write_table(tbl, tmp, compression="zstd", compression_level=9, row_group_size=1 << 20)
+    os.replace(tmp, day)
+    for f in files:
+        os.remove(f)
+
+def compact(before: str = None, root: str = SNAPSHOT_DIR) -> int:
+    """Compacta las particiones anteriores a `before` (AAAA-MM-DD, por defecto hoy UTC)."""
+    before = before or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    n = 0
+    for part in sorted(glob.glob(os.path.join(root, "date=*"))):
+        if part.rsplit("=", 1)[-1] < before and glob.glob(os.path.join(part, "scan-*.parquet")):
+            compact_day(part)
+            n += 1
+    return n
+
+# ======================== Lectura ========================
+def read_snapshots(columns=None, start: str = None, end: str = None, tickers=None,
+                   root: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """
+    Lee el historial. `columns` proyecta (siempre se incluyen ts y ticker); `start`/`end`
+    (AAAA-MM-DD, inclusive) filtran por partición sin abrir los demás días ("date" también
+    se puede pedir como columna). En días ya
+    compactados cada fila es un cambio: el valor rige hasta la próxima fila del ticker.
+    """
+    if not os.path.isdir(root) or not glob.glob(os.path.join(root, "date=*", "*.parquet")):
+        cols = ["ts", "ticker"] + list(columns or FLOAT_COLS + CAT_COLS)
+        return pd.DataFrame(columns=cols)
+    dset = ds.dataset(root, format="parquet", partitioning=PARTITIONING, schema=SCHEMA.append(pa.field("date", pa.string())),
+                      filesystem=pafs.LocalFileSystem(use_mmap=True), exclude_invalid_files=True)
+    flt = None
+    for expr in (
+        ds.field("date") >= start if start else None,
+        ds.field("date") <= end if end else None,
+        ds.field("ticker").isin(list(tickers)) if tickers is not None else None,
+    ):
+        if expr is not None:
+            flt = expr if flt is None else flt & expr
+    cols = ["ts", "ticker"] + [c for c in (columns or FLOAT_COLS + CAT_COLS) if c not in ("ts", "ticker")]
+    return dset.to_table(columns=cols, filter=flt).to_pandas()
+
+def metric_history(metric: str, start: str = None, end: str = None, tickers=None,
+                   root: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """Una métrica en formato ancho (índice = ts, columnas = tickers), como serie escalonada."""
+    df = read_snapshots([metric], start, end, tickers, root)
+    wide = df.pivot_table(index="ts", columns="ticker", values=metric, aggfunc="last", observed=True)
+    return wide.ffill()
+
+# ======================== Etapa del pipeline ========================
+class SnapshotWriter:
+    """
+    Tap para pipeline.run_scan: puntúa cada lote del scan (lo fetcheado y lo de caché) con
+    los ajustes vigentes apenas llega y lo guarda ya en columnas Arrow (float32 +
+    diccionario), no como dicts; al cerrar escribe un snapshot con todo el scan.
+    Después compacta los días anteriores que hayan quedado con varios archivos (con
+    compact=False lo hace el coordinador, cuando hay varios shards escribiendo a la vez).
+    """
+
+    _TS0 = datetime(1970, 1, 1, tzinfo=timezone.utc)  # se reemplaza por el ts del cierre
+
+    def __init__(self, S: dict, root: str = SNAPSHOT_DIR, compact: bool = True):
+        self.S = S
+        self.root = root
+        self.compact = compact
+        self.tables = []
+        self.path = None
+
+    def add(self, batch: list) -> None:
+        self.tables.append(_to_table(scoring.score_frame(pd.DataFrame(batch), **self.S), self._TS0))
+
+    def close(self) -> None:
+        if not self.tables:
+            return
+        ts = datetime.now(timezone.utc).replace(microsecond=0)
+        tbl = pa.concat_tables(self.tables).unify_dictionaries()
+        tbl = tbl.set_column(0, SCHEMA.field("ts"), pa.array([ts] * len(tbl), type=SCHEMA.field("ts").type))
+        self.path = _write(tbl, ts, self.root)
+        self.tables = []
+        if self.compact:
+            compact(root=self.root)
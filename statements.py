@@ -0,0 +1,214 @@
+# statements.py — estados contables trimestrales crudos (tabla 'statements' de screener.db)
+# y ratios propios sobre ventana TTM, calculados vectorizados para todo el universo.
+# Los estados sólo cambian cuando hay balance nuevo: se bajan una vez por período
+# (próxima consulta = cierre del último trimestre + 3 meses + plazo de presentación) y los
+# ratios que dependen del precio se recalculan con el precio vigente. Donde no hay estados
+# (o vienen en otra moneda) quedan los ratios de Yahoo.
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+import fetcher
+import freshness
+import fundamentals
+import perf
+from freshness import QUARTER_DAYS, FILING_LAG_DAYS, RETRY_SECS, EMPTY_RETRY_SECS  # período -> próxima consulta
+
+# columna -> filas candidatas de yfinance (la primera que exista)
+INCOME_ROWS = {
+    "net_income": ["Net Income Common Stockholders", "Net Income"],
+    "ebitda": ["EBITDA", "Normalized EBITDA"],
+}
+BALANCE_ROWS = {
+    "total_debt": ["Total Debt"],
+    "equity": ["Stockholders Equity", "Common Stock Equity"],
+    "cash": ["Cash And Cash Equivalents", "Cash Cash Equivalents And Short Term Investments"],
+    "shares": ["Ordinary Shares Number", "Share Issued"],
+}
+FLOW_COLS = list(INCOME_ROWS)
+STOCK_COLS = list(BALANCE_ROWS)
+STMT_COLS = FLOW_COLS + STOCK_COLS
+# 4 trimestres consecutivos van de un cierre al otro en ~273 días; más que esto es que falta
+# alguno (Yahoo saltea períodos) y la suma no sería un año
+TTM_MAX_SPAN_DAYS = 300
+
+# ratio del panel -> se reemplaza sólo si se pudo calcular con estados
+RATIO_COLS = ["P/E", "P/B", "EV/EBITDA", "Debt/Equity", "ROE"]
+
+
+# ======================== Parseo ========================
+def _pick(frame: pd.DataFrame, names: list) -> pd.Series:
+    for n in names:
+        if frame is not None and n in frame.index:
+            return pd.to_numeric(frame.loc[n], errors="coerce")
+    return pd.Series(dtype="float64")
+
+def parse_statements(income: pd.DataFrame, balance: pd.DataFrame) -> list:
+    """Frames trimestrales de yfinance (filas = conceptos, columnas = cierres) -> filas por período."""
+    cols = {c: _pick(income, names) for c, names in INCOME_ROWS.items()}
+    cols.update({c: _pick(balance, names) for c, names in BALANCE_ROWS.items()})
+    df = pd.DataFrame(cols)
+    if df.empty:
+        return []
+    df.index = pd.to_datetime(df.index, errors="coerce").strftime("%Y-%m-%d")
+    df = df[df.index.notna()].astype("float64")
+    df = df.astype(object).where(df.notna(), None)  # NaN -> NULL
+    return [{"period_end": p, **r} for p, r in zip(df.index, df.to_dict("records"))]
+
+# ======================== Caché ========================
+def due(tickers, now: float = None) -> list:
+    """
+    Tickers cuyos estados hay que (re)bajar: nunca bajados o ya pasó el próximo balance.
+    Los que Yahoo no resolvió hace poco esperan su reintento (freshness.failed).
+    """
+    now = time.time() if now is None else now
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    bad = freshness.failed("statements", tickers, now)
+    tickers = [t for t in tickers if t not in bad]
+    meta = {}
+    conn = db.get_conn()
+    for i in range(0, len(tickers), 500):
+        chunk = tickers[i:i + 500]
+        q = f"SELECT ticker, checked_at, last_period FROM statements_meta WHERE ticker IN ({','.join('?' * len(chunk))})"
+        meta.update({t: (c or 0.0, p) for t, c, p in conn.execute(q, chunk)})
+    out = []
+    for t in tickers:
+        if t not in meta:
+            out.append(t)
+            continue
+        checked, period = meta[t]
+        if period is None:
+            if now - checked >= EMPTY_RETRY_SECS:
+                out.append(t)
+            continue
+        expected = pd.Timestamp(period).timestamp() + (QUARTER_DAYS + FILING_LAG_DAYS) * 86400
+        if now >= expected and now - checked >= RETRY_SECS:
+            out.append(t)
+    return out
+
+def save(got: dict, now: float = None) -> None:
+    """got: {ticker: {"income": df, "balance": df, "ccy_ok": bool}} tal como lo da la fuente."""
+    now = time.time() if now is None else now
+    rows, meta = [], []
+    for t, raw in got.items():
+        periods = parse_statements(raw.get("income"), raw.get("balance"))
+        rows.extend((t, p["period_end"], *(p[c] for c in STMT_COLS)) for p in periods)
+        last = max((p["period_end"] for p in periods), default=None)
+        meta.append((t, now, last, int(bool(raw.get("ccy_ok", True)))))
+    conn = db.get_conn()
+    with perf.timer("db.statements.write"), conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO statements (ticker, period_end, {', '.join(STMT_COLS)}) "
+            f"VALUES ({','.join('?' * (2 + len(STMT_COLS)))})",
+            rows,
+        )
+        conn.executemany(
+            """INSERT INTO statements_meta (ticker, checked_at, last_period, ccy_ok) VALUES (?,?,?,?)
+               ON CONFLICT(ticker) DO UPDATE SET
+                 checked_at=excluded.checked_at, last_period=coalesce(excluded.last_period, last_period),
+                 ccy_ok=excluded.ccy_ok""",
+            meta,
+        )
+
+def refresh(tickers, source=None, deadline: float = None, **kw) -> dict:
+    """Baja los estados de los tickers vencidos (ver due) y los guarda. Devuelve el reporte del fetch."""
+    todo = due(tickers)
+    if not todo:
+        return {"requested": 0, "ok": 0, "failed": 0, "failed_symbols": [], "unresolved_symbols": []}
+    _, rep = fetcher.fetch_statements(todo, source=source, deadline=deadline, on_batch=save,
+                                      currencies=fundamentals.load_currencies(todo), **kw)
+    freshness.record_failures("statements", rep["unresolved_symbols"])
+    freshness.clear_failures("statements", set(todo) - set(rep["failed_symbols"]))
+    return rep
+
+# ======================== TTM ========================
+def load_ttm(tickers) -> pd.DataFrame:
+    """
+    Por ticker (índice): flujos sumados de los últimos 4 trimestres (NaN si no hay 4 o no son
+    consecutivos, ver TTM_MAX_SPAN_DAYS) y stocks del último balance, todos del mismo cierre.
+    Sólo tickers con estados en la moneda de cotización. NaN = vale el ratio de Yahoo.
+    """
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    frames = []
+    conn = db.get_conn()
+    t0 = time.perf_counter()
+    for i in range(0, len(tickers), 500):
+        chunk = tickers[i:i + 500]
+        frames.append(pd.read_sql_query(
+            f"""SELECT s.ticker, s.period_end, {', '.join('s.' + c for c in STMT_COLS)}
+                FROM statements s JOIN statements_meta m ON m.ticker = s.ticker
+                WHERE m.ccy_ok = 1 AND s.ticker IN ({','.join('?' * len(chunk))})""",
+            conn, params=chunk,
+        ))
+    perf.observe("db.statements.read", time.perf_counter() - t0)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if df.empty:
+        return pd.DataFrame(columns=STMT_COLS, dtype="float64")
+    df = df.sort_values(["ticker", "period_end"])
+    df["period_end"] = pd.to_datetime(df["period_end"], errors="coerce")
+
+    flows = df[df[FLOW_COLS].notna().any(axis=1)]
+    last4 = flows.groupby("ticker", sort=False).tail(4).groupby("ticker")
+    ttm = last4[FLOW_COLS].sum(min_count=4)  # con menos de 4 trimestres no hay TTM
+    span = (last4["period_end"].max() - last4["period_end"].min()).dt.days
+    ttm[(span > TTM_MAX_SPAN_DAYS).to_numpy()] = np.nan  # salteó un trimestre: no es un año
+
+    # stocks: la fila del último balance entera (no el último no nulo de cada columna por separado)
+    bal = df[df[STOCK_COLS].notna().any(axis=1)]
+    stocks = bal.groupby("ticker", sort=False).tail(1).set_index("ticker")[STOCK_COLS]
+    out = pd.DataFrame(index=pd.Index(df["ticker"].unique(), name="ticker"))
+    return out.join(ttm).join(stocks)[STMT_COLS].astype("float64")
+
+def ratios(ttm: pd.DataFrame, price: pd.Series) -> tuple:
+    """
+    Ratios del panel a partir de TTM + precio (alineados por índice). Devuelve (valores,
+    hay_dato): NaN con hay_dato=True es "no da ratio" (ganancia/patrimonio/EBITDA <= 0,
+    igual que Yahoo); hay_dato=False es que faltan insumos y vale el ratio de Yahoo.
+    """
+    p = price.reindex(ttm.index).to_numpy(dtype="float64")
+    ni, ebitda, debt, eq, cash, sh = (ttm[c].to_numpy(dtype="float64") for c in
+                                      ("net_income", "ebitda", "total_debt", "equity", "cash", "shares"))
+    mcap = p * sh
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = pd.DataFrame({
+            "P/E": np.where(ni > 0, mcap / ni, np.nan),
+            "P/B": np.where(eq > 0, mcap / eq, np.nan),
+            "EV/EBITDA": np.where(ebitda > 0, (mcap + np.nan_to_num(debt) - np.nan_to_num(cash)) / ebitda, np.nan),
+            "Debt/Equity": np.where(eq > 0, debt / eq, np.nan),
+            "ROE": np.where(eq > 0, ni / eq, np.nan),
+        }, index=ttm.index)
+    fin = np.isfinite
+    has = pd.DataFrame({
+        "P/E": fin(mcap) & fin(ni),
+        "P/B": fin(mcap) & fin(eq),
+        "EV/EBITDA": fin(mcap) & fin(ebitda),
+        "Debt/Equity": fin(debt) & fin(eq),
+        "ROE": fin(ni) & fin(eq),
+    }, index=ttm.index)
+    return out.where(has), has
+
+def apply_ratios(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reemplaza P/E, P/B, EV/EBITDA, Debt/Equity y ROE de `df` (columnas del panel, con
+    "Ticker" y "Precio") por los ratios propios donde hay estados. Devuelve una copia.
+    """
+    if df.empty:
+        return df
+    with perf.timer("ratios"):
+        return _apply_ratios(df)
+
+def _apply_ratios(df: pd.DataFrame) -> pd.DataFrame:
+    tick = df["Ticker"].astype(str).str.upper().to_numpy()
+    ttm = load_ttm(tick)
+    if ttm.empty:
+        return df
+    df = df.copy()
+    price = pd.Series(pd.to_numeric(df["Precio"], errors="coerce").to_numpy(dtype="float64"), index=tick)
+    own, has = ratios(ttm, price.groupby(level=0).last())
+    own, has = own.reindex(tick), has.reindex(tick, fill_value=False)
+    for c in RATIO_COLS:
+        cur = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64") if c in df.columns else np.nan
+        df[c] = np.where(has[c].to_numpy(dtype=bool), own[c].to_numpy(dtype="float64"), cur)
+    return df
@@ -0,0 +1,134 @@
+# test_fetcher.py — fetcher.py contra una fuente stub (sin red): lotes, concurrencia
+# adaptativa ante throttling, reintentos con backoff, fallidos reportados y deadline.
+#   python -m pytest -q test_fetcher.py
+import threading, time
+
+import fetcher
+
+
+class StubSource:
+    """
+    Fuente local con la interfaz de fetcher.YahooSource. `script(lote, n)` decide qué pasa en
+    la llamada n (desde 0): devuelve el dict de respuesta o levanta una excepción.
+    """
+
+    def __init__(self, script=None, latency: float = 0.0):
+        self.script = script or (lambda batch, n: {s: {"shortName": s} for s in batch})
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def info(self, symbols: list) -> dict:
+        with self._lock:
+            n = len(self.calls)
+            self.calls.append(list(symbols))
+        if self.latency:
+            time.sleep(self.latency)
+        return self.script(list(symbols), n)
+
+SYMBOLS = [f"S{i:03d}" for i in range(45)]
+
+
+def test_batches():
+    src = StubSource()
+    got, rep = fetcher.fetch_fundamentals(SYMBOLS, source=src, batch_size=20)
+    assert sorted(len(b) for b in src.calls) == [5, 20, 20]
+    assert sorted(s for b in src.calls for s in b) == SYMBOLS  # cada símbolo pedido una vez
+    assert set(got) == set(SYMBOLS)
+    assert rep["batches"] == 3 and rep["ok"] == 45 and rep["failed"] == 0 and rep["retries"] == 0
+
+def test_on_batch_streams():
+    seen = []
+    got, rep = fetcher.fetch_fundamentals(SYMBOLS, source=StubSource(), batch_size=10, on_batch=seen.append)
+    assert got == {}
+    assert sorted(s for b in seen for s in b) == SYMBOLS
+    assert all(b[s]["Ticker"] == s for b in seen for s in b)  # ya en formato fundamentals
+
+def test_adaptive_limit_halves_on_throttle():
+    lim = fetcher.AdaptiveLimit(start=8, min_limit=1, max_limit=16)
+    assert lim.observe(0.1, 10, 0, throttled=True) == 4
+    assert lim.observe(0.1, 10, 0, throttled=True) == 2
+    assert lim.observe(0.1, 10, 0) == 3            # rápido y sin errores: +1
+    assert lim.observe(0.1, 10, 5) == 1            # 50% de error: /2
+    assert lim.observe(0.1, 10, 0, throttled=True) == 1  # piso min_limit
+
+def test_429_halves_concurrency_and_retries():
+    def script(batch, n):
+        if n == 0:
+            raise Exception("429 Client Error: Too Many Requests")
+        return {s: {"shortName": s} for s in batch}
+
+    lim = fetcher.AdaptiveLimit(start=4, max_limit=4)
+    got, rep = fetcher.fetch_fundamentals(SYMBOLS[:10], source=StubSource(script), batch_size=10,
+                                          limit=lim, backoff=0.01)
+    assert rep["throttled"] == 1
+    assert lim.limit < 4  # bajó a la mitad y después sube de a uno
+    assert set(got) == set(SYMBOLS[:10]) and rep["failed"] == 0
+    assert rep["retries"] == 10
+
+def test_retry_with_backoff():
+    # S000 no viene en las dos primeras respuestas: se reencola con backoff creciente
+    stamps = []
+
+    def script(batch, n):
+        stamps.append(time.time())
+        skip = {"S000"} if n < 2 else set()
+        return {s: {"shortName": s} for s in batch if s not in skip}
+
+    got, rep = fetcher.fetch_fundamentals(SYMBOLS[:5], source=StubSource(script), batch_size=5, backoff=0.05)
+    assert set(got) == set(SYMBOLS[:5])
+    assert rep["retries"] == 2 and rep["failed"] == 0
+    waits = [b - a for a, b in zip(stamps, stamps[1:])]
+    assert waits[0] >= 0.05 and waits[1] >= 0.10  # backoff * 2**intento (más jitter)
+
+def test_permanently_missing_symbol():
+    src = StubSource(lambda batch, n: {s: {"shortName": s} for s in batch if s != "DEAD"})
+    got, rep = fetcher.fetch_fundamentals(["AAA", "DEAD", "BBB"], source=src, batch_size=10,
+                                          max_retries=2, backoff=0.01)
+    assert set(got) == {"AAA", "BBB"}
+    assert rep["failed_symbols"] == ["DEAD"]
+    assert rep["unresolved_symbols"] == ["DEAD"]  # respondió sin él en cada intento: caché negativa
+    assert sum(b == ["DEAD"] for b in src.calls) == 2  # max_retries reintentos, sólo del faltante
+
+def test_symbol_errors_are_not_unresolved():
+    # la fuente contesta el lote pero un símbolo falló por red: se reintenta y no va a la caché negativa
+    def script(batch, n):
+        got = {s: {"shortName": s} for s in batch if s not in ("FLAKY", "DEAD")}
+        return got, {"FLAKY": ConnectionError("connection reset")} if "FLAKY" in batch else {}
+
+    src = StubSource(script)
+    got, rep = fetcher.fetch_fundamentals(["AAA", "FLAKY", "DEAD"], source=src, max_retries=2, backoff=0.01)
+    assert set(got) == {"AAA"}
+    assert rep["failed_symbols"] == ["DEAD", "FLAKY"]
+    assert rep["unresolved_symbols"] == ["DEAD"]
+    assert sum("FLAKY" in b for b in src.calls) == 3  # intento + 2 reintentos
+
+def test_symbol_error_once_is_never_unresolved():
+    # falló por red una vez y después vino vacío: no hay certeza de que no exista
+    def script(batch, n):
+        return {}, ({s: TimeoutError("read timeout") for s in batch} if n == 0 else {})
+
+    _, rep = fetcher.fetch_fundamentals(["AAA"], source=StubSource(script), max_retries=2, backoff=0.01)
+    assert rep["failed_symbols"] == ["AAA"]
+    assert rep["unresolved_symbols"] == []
+
+def test_errors_are_not_unresolved():
+    # una excepción (red caída) agota los reintentos pero no marca los símbolos como inexistentes
+    def script(batch, n):
+        raise ConnectionError("connection reset")
+
+    _, rep = fetcher.fetch_fundamentals(["AAA", "BBB"], source=StubSource(script), max_retries=1, backoff=0.01)
+    assert rep["failed_symbols"] == ["AAA", "BBB"]
+    assert rep["unresolved_symbols"] == []
+
+def test_deadline_cutoff():
+    src = StubSource(latency=0.2)
+    t0 = time.time()
+    got, rep = fetcher.fetch_fundamentals(SYMBOLS, source=src, batch_size=5,
+                                          limit=fetcher.AdaptiveLimit(start=1, max_limit=1), deadline=0.5)
+    elapsed = time.time() - t0
+    assert elapsed < 1.0  # lo que queda en cola no se despacha
+    assert 0 < len(got) < len(SYMBOLS)
+    assert rep["failed"] == len(SYMBOLS) - len(got)
+    assert sorted(set(got) | set(rep["failed_symbols"])) == SYMBOLS
+    assert rep["unresolved_symbols"] == []  # cortados por tiempo: se reintentan en el próximo scan
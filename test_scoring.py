@@ -0,0 +1,182 @@
+# test_scoring.py — paridad de scoring.score_frame con el cálculo fila por fila original
+# (df.apply sobre calcular_val_score_mixto / calidad_router / etiqueta / calc_ivr de app.py),
+# sobre frames aleatorios con NaN, financieras y no financieras y múltiplos negativos.
+#   python -m pytest -q test_scoring.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import scoring
+
+# ======================== Referencia (app.py original) ========================
+def is_financial_row(row: pd.Series) -> bool:
+    s = (row.get("Sector") or "").lower()
+    i = (row.get("Industry") or "").lower()
+    keys = ["financial", "bank", "insurance", "capital markets", "diversified financial"]
+    return any(k in s for k in keys) or any(k in i for k in keys)
+
+def subscore_inverse(x: float, cap: float) -> float:
+    try:
+        if pd.isna(x):
+            return float("nan")
+        return max(0.0, min(1.0, (cap - float(x)) / cap))
+    except Exception:
+        return float("nan")
+
+def score_val_non_fin(row: pd.Series, pe_cap: float, pb_cap: float, eve_cap: float) -> float:
+    subs = [
+        subscore_inverse(row.get("P/E"), pe_cap),
+        subscore_inverse(row.get("P/B"), pb_cap),
+        subscore_inverse(row.get("EV/EBITDA"), eve_cap),
+    ]
+    s = pd.Series(subs, dtype="float64").dropna()
+    return float(s.mean() * 100.0) if not s.empty else float("nan")
+
+def score_val_bank(row: pd.Series, pe_cap: float, pb_cap: float) -> float:
+    pb_sub = subscore_inverse(row.get("P/B"), pb_cap)
+    pe_sub = subscore_inverse(row.get("P/E"), pe_cap)
+    s = pd.Series([pb_sub, pb_sub, pe_sub], dtype="float64").dropna()
+    return float(s.mean() * 100.0) if not s.empty else float("nan")
+
+def calcular_val_score_mixto(row: pd.Series, pe_cap: float, pb_cap: float, eve_cap: float) -> float:
+    return score_val_bank(row, pe_cap, pb_cap) if is_financial_row(row) else \
+           score_val_non_fin(row, pe_cap, pb_cap, eve_cap)
+
+def score_calidad_de(de_ratio: float) -> float:
+    if pd.isna(de_ratio):
+        return float("nan")
+    x = float(de_ratio)
+    if x <= 0:
+        return 100.0
+    return float(max(0.0, min(100.0, (3.0 - x) * 50.0)))
+
+def score_calidad_roe(roe_ratio: float) -> float:
+    if pd.isna(roe_ratio):
+        return float("nan")
+    r = float(roe_ratio)
+    if r > 1.0:  # por si viniera en %
+        r = r / 100.0
+    return float(max(0.0, min(100.0, (r - 0.05) / 0.10 * 100.0)))
+
+def calidad_router(row: pd.Series) -> pd.Series:
+    if is_financial_row(row):
+        return pd.Series({"Score Calidad": score_calidad_roe(row.get("ROE")), "Calidad por": "ROE"})
+    return pd.Series({"Score Calidad": score_calidad_de(row.get("Debt/Equity")), "Calidad por": "D/E"})
+
+def etiqueta(row, val_th, qual_th, caro_th):
+    sv, sc = row["Score (0-100)"], row["Score Calidad"]
+    if pd.isna(sv):
+        return "Sin datos"
+    if sv >= val_th and (not pd.isna(sc)) and sc >= qual_th:
+        return "Barato y sano"
+    if sv >= val_th:
+        return "Barato pero frágil"
+    if sv <= caro_th and (not pd.isna(sc)) and sc >= qual_th:
+        return "Caro pero sano"
+    if sv <= caro_th:
+        return "Caro y frágil"
+    return "Neutral"
+
+def senal_simple(et):
+    if et.startswith("Barato"):
+        return "Comprar"
+    if et.startswith("Caro"):
+        return "Vender"
+    return "Mantener"
+
+def calc_ivr(row, w_val, w_qual):
+    sv, sc = row["Score (0-100)"], row["Score Calidad"]
+    if pd.isna(sv):
+        return float("nan")
+    if pd.isna(sc):
+        sc = 0.0
+    return round(w_val * float(sv) + w_qual * float(sc), 2)
+
+def reference(df: pd.DataFrame, pe_cap, pb_cap, eve_cap, val_th, qual_th, w_val, w_qual) -> pd.DataFrame:
+    """La cadena de df.apply del panel antes de scoring.py."""
+    caro_th = max(10, min(90, 100 - val_th))
+    df = df.copy()
+    df["Score (0-100)"] = df.apply(lambda r: calcular_val_score_mixto(r, pe_cap, pb_cap, eve_cap), axis=1)
+    qual_df = df.apply(calidad_router, axis=1, result_type="expand")
+    qual_df.columns = ["Score Calidad", "Calidad por"]
+    df = pd.concat([df, qual_df], axis=1)
+    df["Etiqueta"] = df.apply(lambda r: etiqueta(r, val_th, qual_th, caro_th), axis=1)
+    df["Señal"] = df["Etiqueta"].apply(senal_simple)
+    df["IVR"] = df.apply(lambda r: calc_ivr(r, w_val, w_qual), axis=1)
+    return df
+
+# ======================== Datos ========================
+SECTORS = [
+    ("Technology", "Software - Infrastructure"),
+    ("Energy", "Oil & Gas Integrated"),
+    ("Healthcare", "Drug Manufacturers - General"),
+    ("Financial Services", "Banks - Regional"),
+    ("Financial Services", "Insurance - Diversified"),
+    ("Financial Services", "Capital Markets"),
+    ("Real Estate", "REIT - Mortgage"),
+    ("Industrials", "Conglomerates"),
+    ("", "Banks - Diversified"),
+    ("", ""),  # fetch_metrics dejaba "" cuando Yahoo no traía sector / industria
+]
+
+def random_frame(n: int, seed: int) -> pd.DataFrame:
+    """Múltiplos negativos, ceros y outliers; ~15% NaN por columna; ROE en fracción o en %."""
+    rng = np.random.default_rng(seed)
+    sec = [SECTORS[i] for i in rng.integers(0, len(SECTORS), n)]
+
+    def num(lo, hi):
+        v = rng.uniform(lo, hi, n)
+        v[rng.random(n) < 0.05] = 0.0
+        v[rng.random(n) < 0.15] = np.nan
+        return v
+
+    roe = num(-0.3, 0.5)
+    pct = rng.random(n) < 0.1
+    roe[pct] *= 100.0
+    return pd.DataFrame({
+        "Ticker": [f"T{i}" for i in range(n)],
+        "Sector": [s for s, _ in sec],
+        "Industry": [i for _, i in sec],
+        "P/E": num(-40, 80),
+        "P/B": num(-5, 15),
+        "EV/EBITDA": num(-20, 40),
+        "Debt/Equity": num(-1, 5),
+        "ROE": roe,
+    })
+
+SETTINGS = [
+    dict(pe_cap=25.0, pb_cap=3.0, eve_cap=15.0, val_th=65, qual_th=60, w_val=0.7, w_qual=0.3),
+    dict(pe_cap=15.0, pb_cap=1.5, eve_cap=10.0, val_th=50, qual_th=40, w_val=0.5, w_qual=0.5),
+    dict(pe_cap=40.0, pb_cap=6.0, eve_cap=25.0, val_th=95, qual_th=80, w_val=1.0, w_qual=0.0),
+    dict(pe_cap=20.0, pb_cap=2.0, eve_cap=12.0, val_th=5, qual_th=0, w_val=0.2, w_qual=0.8),
+]
+
+# ======================== Tests ========================
+@pytest.mark.parametrize("S", SETTINGS)
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_score_frame_matches_row_wise(S, seed):
+    df = random_frame(1000, seed)
+    got = scoring.score_frame(df, **S)
+    ref = reference(df, **S)
+    for c in ["Score (0-100)", "Score Calidad", "IVR"]:
+        np.testing.assert_array_equal(got[c].to_numpy(dtype="float64"), ref[c].to_numpy(dtype="float64"), err_msg=c)
+    for c in ["Calidad por", "Etiqueta", "Señal"]:
+        assert got[c].tolist() == ref[c].tolist(), c
+
+def test_score_frame_all_nan_rows():
+    df = pd.DataFrame({"Ticker": ["A", "B"], "Sector": [None, "Financial Services"], "Industry": [None, "Banks"],
+                       "P/E": [np.nan] * 2, "P/B": [np.nan] * 2, "EV/EBITDA": [np.nan] * 2,
+                       "Debt/Equity": [np.nan] * 2, "ROE": [np.nan] * 2})
+    got = scoring.score_frame(df, **SETTINGS[0])
+    assert got["Etiqueta"].tolist() == ["Sin datos", "Sin datos"]
+    assert got["Calidad por"].tolist() == ["D/E", "ROE"]
+    assert got["IVR"].isna().all()
+
+def test_score_frame_missing_columns():
+    # el panel puede traer sólo algunas columnas: las que faltan cuentan como NaN
+    got = scoring.score_frame(pd.DataFrame({"Ticker": ["A"], "P/E": [10.0]}), **SETTINGS[0])
+    ref = reference(pd.DataFrame({"Ticker": ["A"], "P/E": [10.0], "Sector": [None], "Industry": [None],
+                                  "P/B": [np.nan], "EV/EBITDA": [np.nan], "Debt/Equity": [np.nan],
+                                  "ROE": [np.nan]}), **SETTINGS[0])
+    assert got["Score (0-100)"].iloc[0] == ref["Score (0-100)"].iloc[0]
+    assert got["IVR"].iloc[0] == ref["IVR"].iloc[0]
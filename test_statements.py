@@ -0,0 +1,57 @@
+# test_statements.py — statements.load_ttm sobre una base temporal: TTM sólo con 4 trimestres
+# consecutivos y stocks tomados enteros del último balance.
+#   python -m pytest -q test_statements.py
+import numpy as np
+import pytest
+
+import db
+import fundamentals
+import statements
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "screener.db"))
+    return db.get_conn()
+
+def put(conn, ticker, rows):
+    """rows: [(period_end, net_income, ebitda, total_debt, equity, cash, shares)]"""
+    with conn:
+        conn.executemany(
+            f"INSERT INTO statements (ticker, period_end, {', '.join(statements.STMT_COLS)}) VALUES (?,?,?,?,?,?,?,?)",
+            [(ticker, *r) for r in rows],
+        )
+        conn.execute("INSERT INTO statements_meta (ticker, checked_at, last_period, ccy_ok) VALUES (?,0,?,1)",
+                     (ticker, max(r[0] for r in rows)))
+
+QUARTERS = ["2025-09-30", "2025-12-31", "2026-03-31", "2026-06-30"]
+
+def test_ttm_sums_four_consecutive_quarters(conn):
+    put(conn, "AAA", [(p, 1.0, 2.0, 10.0, 20.0, 5.0, 100.0) for p in QUARTERS])
+    got = statements.load_ttm(["AAA"]).loc["AAA"]
+    assert got["net_income"] == 4.0 and got["ebitda"] == 8.0
+
+def test_ttm_with_a_gap_is_nan(conn):
+    # falta 2025-12-31: las últimas 4 filas abarcan 15 meses, no un año
+    put(conn, "GAP", [(p, 1.0, 2.0, 10.0, 20.0, 5.0, 100.0)
+                      for p in ["2025-06-30", "2025-09-30", "2026-03-31", "2026-06-30"]])
+    got = statements.load_ttm(["GAP"]).loc["GAP"]
+    assert np.isnan(got["net_income"]) and np.isnan(got["ebitda"])
+    assert got["equity"] == 20.0  # los stocks siguen valiendo
+
+def test_stocks_come_from_one_balance(conn):
+    # el último balance no trae cash: queda NaN, no el cash de un trimestre anterior
+    rows = [(p, 1.0, 2.0, 10.0, 20.0, 5.0, 100.0) for p in QUARTERS[:3]]
+    rows.append((QUARTERS[3], 1.0, 2.0, 12.0, 30.0, None, 110.0))
+    put(conn, "BBB", rows)
+    got = statements.load_ttm(["BBB"]).loc["BBB"]
+    assert got["total_debt"] == 12.0 and got["equity"] == 30.0 and got["shares"] == 110.0
+    assert np.isnan(got["cash"])
+
+def test_currencies_cached_with_fundamentals(conn):
+    # statements.refresh las lee de acá en vez de pedir `info` de nuevo
+    m = fundamentals.empty_metrics("ADR")
+    m.update(fundamentals.parse_info({"currency": "USD", "financialCurrency": "BRL"}))
+    fundamentals.save_many([m, fundamentals.empty_metrics("NEW")], groups=("price",))
+    fundamentals.save_many([m])
+    assert fundamentals.load_currencies(["ADR", "NEW", "NONE"]) == {"ADR": ("BRL", "USD")}
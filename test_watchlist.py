@@ -0,0 +1,47 @@
+# test_watchlist.py — watchlist.import_symbols contra una fuente stub (sin red) y una base
+# temporal: los nunca vistos se confirman en un solo lote y los que Yahoo no conoce no se agregan.
+#   python -m pytest -q test_watchlist.py
+import pytest
+
+import db
+import fundamentals
+import watchlist
+
+
+class PriceSource:
+    def __init__(self, prices: dict, fail: set = frozenset()):
+        self.p = prices
+        self.fail = fail
+        self.calls = []
+
+    def prices(self, symbols: list) -> tuple:
+        self.calls.append(list(symbols))
+        return ({s: self.p[s] for s in symbols if s in self.p},
+                {s: ConnectionError("connection reset") for s in symbols if s in self.fail})
+
+@pytest.fixture(autouse=True)
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "screener.db"))
+    return db.get_conn()
+
+def test_unknown_symbols_are_not_imported():
+    fundamentals.save_many([fundamentals.empty_metrics("AAPL")])
+    src = PriceSource({"MSFT": 400.0, "GGAL.BA": 5000.0})
+    rep = watchlist.import_symbols("AAPL, MSFT, GGAL.BA, XXXX, ZZ$Z", known={"KO"}, source=src)
+    assert rep["cached"] == ["AAPL"]
+    assert rep["new"] == ["MSFT", "GGAL.BA"]
+    assert rep["unknown"] == ["XXXX"]
+    assert rep["invalid"] == ["ZZ$Z"]
+    assert src.calls[0] == ["MSFT", "GGAL.BA", "XXXX"]  # un solo lote con todos los nunca vistos
+    assert watchlist.list_tickers() == ["AAPL", "GGAL.BA", "MSFT"]
+
+def test_network_errors_keep_the_symbol():
+    # sin confirmar por red no es "Yahoo no lo conoce": se importa y lo baja el prefetch
+    rep = watchlist.import_symbols("NVDA", source=PriceSource({}, fail={"NVDA"}))
+    assert rep["new"] == ["NVDA"] and rep["unknown"] == []
+    assert watchlist.list_tickers() == ["NVDA"]
+
+def test_known_symbols_skip_yahoo():
+    src = PriceSource({})
+    rep = watchlist.import_symbols("KO", known={"KO"}, source=src)
+    assert rep["cached"] == ["KO"] and src.calls == []
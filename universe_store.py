@@ -0,0 +1,116 @@
+# universe_store.py — el universo del escáner puntuado, en memoria y compacto: una sola
+# tabla columnar (categóricas para sector/industria/etiqueta, float32 para ratios y scores,
+# strings de Arrow para ticker/empresa) en vez de un dict por ticker. En el panel vive en un
+# st.cache_resource: una copia por proceso compartida por todas las sesiones, que se recarga
+# sólo cuando el escáner publica una versión nueva.
+import sys, threading
+
+import pandas as pd
+
+import alerts
+import fundamentals
+import peer_stats
+import scoring
+import snapshots
+import statements
+from settings import settings_hash
+
+FLOAT_COLS = snapshots.FLOAT_COLS + ["EPS", "BVPS", "Valor vs pares"]
+CAT_COLS = snapshots.CAT_COLS + ["Señal", "Calidad por", "Universo", "Moneda", "Moneda EEFF"]
+STR_COLS = ["Ticker", "Empresa"]
+MAX_SCORED = 4  # combinaciones de ajustes puntuadas que se guardan a la vez
+
+
+def universe_names(col: pd.Series) -> list:
+    """Universos de la columna "Universo" (la de un ticker en varios es "u1,u2")."""
+    return list(dict.fromkeys(u for v in col.astype("category").cat.categories for u in v.split(",")))
+
+def in_universes(col: pd.Series, names) -> pd.Series:
+    """Filas de algún universo de `names` (por categoría, no por fila)."""
+    names = set(names)
+    return col.astype("category").map(lambda v: not names.isdisjoint(v.split(","))).astype(bool)
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia con dtypes compactos (float32 / category / string de Arrow); el resto queda igual."""
+    out = {}
+    for c in df.columns:
+        if c in FLOAT_COLS:
+            out[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+        elif c in CAT_COLS:
+            out[c] = df[c].astype("category")
+        elif c in STR_COLS:
+            out[c] = df[c].astype("string[pyarrow]")
+        else:
+            out[c] = df[c]
+    return pd.DataFrame(out, index=df.index)
+
+class UniverseStore:
+    """
+    Métricas (con ratios propios) de todos los tickers de los universos del escáner, leídas
+    de la caché de screener.db, y su puntuación por ajustes. Thread-safe; get()/scored()
+    recargan sólo si cambió la versión publicada por el escáner (alerts.current_version).
+    """
+
+    def __init__(self, universes: dict = None):
+        self.universes = universes  # {nombre: [tickers]}; None = los de scan_universe
+        self.version = None
+        self.frame = pd.DataFrame()
+        self.peers = peer_stats.PeerStats()
+        self._scored = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> pd.DataFrame:
+        universes = self.universes
+        if universes is None:
+            import scan_universe
+            universes = scan_universe.load_universes()
+        owner = {}
+        for name, tickers in universes.items():
+            for t in dict.fromkeys(tickers):
+                owner[t] = f"{owner[t]},{name}" if t in owner else name  # todos sus universos
+        cached = fundamentals.load_cached(list(owner))
+        if not cached:
+            return pd.DataFrame()
+        df = statements.apply_ratios(pd.DataFrame([m for m, _ in cached.values()]))
+        df["Universo"] = [owner[t] for t in df["Ticker"]]
+        return compact(df.reset_index(drop=True))
+
+    def get(self) -> pd.DataFrame:
+        """Métricas del universo (compactas, sin puntuar)."""
+        v = alerts.current_version()
+        with self._lock:
+            if v != self.version:
+                self.frame = self._load()
+                self.peers = peer_stats.load()
+                self._scored = {}
+                self.version = v
+            return self.frame
+
+    def scored(self, S: dict) -> pd.DataFrame:
+        """
+        Universo puntuado con los ajustes `S` y "Valor vs pares" (peer_stats), compacto; se
+        guarda por huella de ajustes.
+        """
+        frame = self.get()
+        key = settings_hash(S)
+        with self._lock:
+            df = self._scored.get(key)
+            if df is None:
+                df = frame
+                if not frame.empty:
+                    df = scoring.score_frame(frame, **S, fin_map=self.peers.fin_map)
+                    df["Valor vs pares"] = self.peers.relative_value(df) if self.peers else float("nan")
+                    df = compact(df)
+                if len(self._scored) >= MAX_SCORED:
+                    self._scored.pop(next(iter(self._scored)))
+                self._scored[key] = df
+            return df
+
+def memory(obj) -> int:
+    """Bytes aproximados (profundos) de un DataFrame o de una lista de dicts de métricas."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    total = sys.getsizeof(obj)
+    for m in obj:
+        total += sys.getsizeof(m) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in m.items())
+    return total
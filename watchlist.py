@@ -0,0 +1,175 @@
+# watchlist.py — lista propia del panel (tabla 'tickers' de screener.db) y capa de consulta
+# sobre la tabla puntuada: filtro (sector, etiqueta, rango de IVR, texto), orden y paginado
+# del lado del servidor, para mandarle al navegador sólo la página visible.
+# Importación masiva (pegado, CSV o archivo de universo) en una sola transacción, con
+# validación contra la caché (y contra Yahoo los nunca vistos) y precarga en segundo plano
+# de los nuevos; export y diff
+# contra los universos del escáner.
+import csv, io, math, re, threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import db
+import fetcher
+import fundamentals
+import statements
+
+PAGE_SIZES = [25, 50, 100, 250]
+# columnas por las que se puede ordenar
+SORTABLE = ["IVR", "Score (0-100)", "Score Calidad", "Valor vs pares", "Precio", "P/E", "P/B", "EV/EBITDA",
+            "Debt/Equity", "ROE", "Ticker", "Empresa", "Sector"]
+
+
+# ======================== Tabla 'tickers' ========================
+def list_tickers() -> list:
+    return [r[0] for r in db.get_conn().execute("SELECT ticker FROM tickers ORDER BY ticker ASC")]
+
+def add(tickers) -> int:
+    """Agrega (ignora repetidos y vacíos). Devuelve cuántos eran nuevos."""
+    tickers = [t for t in dict.fromkeys((t or "").strip().upper() for t in tickers) if t]
+    if not tickers:
+        return 0
+    now = datetime.utcnow().isoformat()
+    conn = db.get_conn()
+    with conn:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO tickers (ticker, created_at) VALUES (?, ?)",
+                         [(t, now) for t in tickers])
+        return conn.total_changes - before
+
+def remove(tickers) -> int:
+    """Quita varios de una vez. Devuelve cuántos se borraron."""
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    if not tickers:
+        return 0
+    conn = db.get_conn()
+    with conn:
+        before = conn.total_changes
+        conn.executemany("DELETE FROM tickers WHERE ticker = ?", [(t,) for t in tickers])
+        return conn.total_changes - before
+
+# ======================== Import / export ========================
+SYMBOL_RE = re.compile(r"^[A-Z0-9^][A-Z0-9.\-=^]{0,19}$")  # AAPL, BRK-B, GGAL.BA, ^MERV, EURUSD=X
+CHECK_DEADLINE = 30  # segundos para confirmar contra Yahoo los símbolos nunca vistos
+CSV_COLS = ("ticker", "symbol", "simbolo", "símbolo")
+
+
+def parse_symbols(text: str) -> list:
+    """
+    Símbolos de un pegado, un CSV o un archivo de universo (uno por línea), sin repetir y en
+    mayúsculas. Si es un CSV con columna ticker/symbol se usa sólo esa; si no, cualquier
+    separador (coma, punto y coma, espacios, saltos de línea) sirve.
+    """
+    text = (text or "").lstrip("\ufeff")
+    first = text.splitlines()[0] if text.strip() else ""
+    if "," in first or ";" in first:
+        dialect = ";" if first.count(";") > first.count(",") else ","
+        rows = list(csv.reader(io.StringIO(text), delimiter=dialect))
+        header = [h.strip().lower() for h in rows[0]]
+        col = next((header.index(c) for c in CSV_COLS if c in header), None)
+        if col is not None:
+            return list(dict.fromkeys(r[col].strip().upper() for r in rows[1:] if len(r) > col and r[col].strip()))
+    return list(dict.fromkeys(s.upper() for s in re.split(r"[\s,;]+", text) if s))
+
+def validate(symbols: list, known=(), source=None) -> dict:
+    """
+    {"cached": [...], "new": [...], "unknown": [...], "invalid": [...]}: con datos en la caché
+    (o en `known`, ej. los universos del escáner), nunca vistos pero con precio en Yahoo (se
+    van a bajar), nunca vistos que Yahoo no conoce y con formato inválido (estos dos no se
+    importan). Los nunca vistos se confirman con un solo fetch_prices en lote; los que no se
+    pudieron confirmar por red / tiempo quedan en "new".
+    """
+    ok = [s for s in symbols if SYMBOL_RE.match(s)]
+    cached = fundamentals.load_cached(ok)
+    known = set(known)
+    new = [s for s in ok if s not in cached and s not in known]
+    unknown = set()
+    if new:
+        _, rep = fetcher.fetch_prices(new, source=source, max_retries=1, backoff=0.5, deadline=CHECK_DEADLINE)
+        unknown = set(rep["unresolved_symbols"])  # Yahoo contestó sin ellos en cada intento
+    return {
+        "cached": [s for s in ok if s in cached or s in known],
+        "new": [s for s in new if s not in unknown],
+        "unknown": [s for s in new if s in unknown],
+        "invalid": [s for s in symbols if not SYMBOL_RE.match(s)],
+    }
+
+def import_symbols(text: str, known=(), source=None) -> dict:
+    """Parsea, valida y agrega todo en una transacción. Devuelve validate() + "added" (los nuevos en la lista)."""
+    syms = parse_symbols(text)
+    rep = validate(syms, known, source)
+    before = set(list_tickers())
+    add(rep["cached"] + rep["new"])
+    rep["added"] = [s for s in rep["cached"] + rep["new"] if s not in before]
+    return rep
+
+def export_csv(tickers: list = None) -> str:
+    """CSV (ticker, empresa, sector) de la lista; se vuelve a importar tal cual."""
+    tickers = list_tickers() if tickers is None else tickers
+    cached = fundamentals.load_cached(tickers)
+    out = io.StringIO()
+    w = csv.writer(out, lineterminator="\n")
+    w.writerow(["ticker", "empresa", "sector"])
+    for t in tickers:
+        m = cached[t][0] if t in cached else fundamentals.empty_metrics(t)
+        w.writerow([t, m["Empresa"], m["Sector"]])
+    return out.getvalue()
+
+def diff(mine, universe) -> dict:
+    """{"only_mine", "only_universe", "both"} (ordenados) entre la lista y un universo."""
+    mine, universe = set(mine), set(universe)
+    return {"only_mine": sorted(mine - universe), "only_universe": sorted(universe - mine),
+            "both": sorted(mine & universe)}
+
+def prefetch(tickers: list) -> threading.Thread:
+    """
+    Baja en segundo plano, en lote, fundamentales (con precio) y estados de `tickers` (los
+    importados que no están en la caché) y los deja en screener.db. Devuelve el hilo.
+    """
+    def on_batch(got: dict):
+        ms = list(got.values())
+        fundamentals.save_many(ms, groups=("fund",))
+        fundamentals.save_many([m for m in ms if m["Precio"] == m["Precio"]], groups=("price",))
+
+    def run():
+        try:
+            fetcher.fetch_fundamentals(tickers, on_batch=on_batch, deadline=5 * 60)  # `info` trae el precio
+            statements.refresh(tickers, deadline=2 * 60)
+        except Exception:
+            pass  # lo que no llegó lo baja el panel en el próximo render
+
+    th = threading.Thread(target=run, name="watchlist-prefetch", daemon=True)
+    th.start()
+    return th
+
+# ======================== Consulta ========================
+def query(df: pd.DataFrame, sectors=None, labels=None, ivr_range=None, search: str = None,
+          sort_by: str = "IVR", ascending: bool = False, page: int = 1, page_size: int = 50) -> tuple:
+    """
+    Filtra, ordena y pagina la tabla puntuada (columnas de scoring.score_frame). Filtros
+    vacíos/None no filtran; `ivr_range` (mín, máx) deja afuera los que no tienen IVR.
+    Empates por Ticker. Devuelve (página, filas que pasan el filtro, cantidad de páginas);
+    `page` se acota a [1, páginas].
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if sectors:
+        mask &= df["Sector"].isin(sectors).to_numpy()
+    if labels:
+        mask &= df["Etiqueta"].isin(labels).to_numpy()
+    if ivr_range is not None:
+        ivr = pd.to_numeric(df["IVR"], errors="coerce")
+        mask &= ivr.between(*ivr_range).to_numpy()
+    if search:
+        s = search.strip().upper()
+        mask &= (df["Ticker"].astype(str).str.upper().str.contains(s, regex=False)
+                 | df["Empresa"].astype(str).str.upper().str.contains(s, regex=False)).to_numpy()
+    hit = df.loc[mask]
+    total = len(hit)
+    pages = max(1, math.ceil(total / page_size))
+    page = min(max(1, int(page)), pages)
+    by = [sort_by] if sort_by == "Ticker" else [sort_by, "Ticker"]
+    hit = hit.sort_values(by=by, ascending=[ascending] + [True] * (len(by) - 1), na_position="last", kind="stable")
+    start = (page - 1) * page_size
+    return hit.iloc[start:start + page_size], total, pages